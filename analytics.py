@@ -0,0 +1,149 @@
+"""
+Brightness and dominant-colour analytics for the wallpaper library
+
+Images are decoded at reduced size and analysed in batches with NumPy: mean
+luminance, contrast (luminance standard deviation) and a few dominant colours
+from a k-means that runs on all images of a batch at once. Results are stored
+in the library index, so the tray can filter by them without decoding images.
+"""
+import io
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from library_index import LibraryIndex
+
+THUMB_SIZE = 48
+CLUSTERS = 4
+KMEANS_ITERATIONS = 10
+BATCH_SIZE = 32
+
+FILTER_MODES = ("all", "dark", "light", "accent")
+DARK_LUMA = 0.35
+LIGHT_LUMA = 0.55
+# Euclidean RGB distance and minimum share of the image for an accent match
+ACCENT_DISTANCE = 90
+ACCENT_MIN_WEIGHT = 0.1
+
+_LUMA_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def load_thumb(source: Union[bytes, Path, str]) -> np.ndarray:
+    """Decode an image at reduced size into a (THUMB_SIZE**2, 3) float32 RGB pixel buffer"""
+    from PIL import Image
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    with Image.open(fp) as img:
+        img.draft("RGB", (THUMB_SIZE * 4, THUMB_SIZE * 4))
+        thumb = img.convert("RGB").resize((THUMB_SIZE, THUMB_SIZE))
+    return np.asarray(thumb, dtype=np.float32).reshape(-1, 3)
+
+
+def kmeans_batch(pixels: np.ndarray, k: int = CLUSTERS,
+                 iterations: int = KMEANS_ITERATIONS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    k-means over a (n, p, 3) batch of pixel buffers, all images at once.
+
+    Centroids start at luminance quantiles, so results are deterministic.
+    Returns (centroids (n, k, 3), weights (n, k)).
+    """
+    n, p, _ = pixels.shape
+    order = np.argsort(pixels @ _LUMA_WEIGHTS, axis=1)
+    picks = order[:, ((np.arange(k) + 0.5) * p / k).astype(int)]
+    centroids = np.take_along_axis(pixels, picks[:, :, None], axis=1)
+    clusters = np.arange(k)
+    for _ in range(iterations):
+        dist = ((pixels[:, :, None, :] - centroids[:, None, :, :]) ** 2).sum(axis=-1)
+        onehot = (dist.argmin(axis=2)[:, :, None] == clusters).astype(np.float32)
+        counts = onehot.sum(axis=1)
+        sums = np.einsum("npk,npc->nkc", onehot, pixels)
+        # Empty clusters keep their previous centroid
+        centroids = np.where(counts[:, :, None] > 0, sums / np.maximum(counts, 1)[:, :, None], centroids)
+    return centroids, counts / p
+
+
+def analyze_batch(pixels: np.ndarray) -> List[dict]:
+    """Luminance, contrast and dominant colours for a (n, p, 3) batch"""
+    luma = (pixels @ _LUMA_WEIGHTS) / 255.0
+    centroids, weights = kmeans_batch(pixels)
+    results = []
+    for i in range(len(pixels)):
+        order = np.argsort(-weights[i])
+        colors = [[to_hex_color(centroids[i, j]), round(float(weights[i, j]), 3)]
+                  for j in order if weights[i, j] > 0]
+        results.append({
+            "luma": round(float(luma[i].mean()), 3),
+            "contrast": round(float(luma[i].std()), 3),
+            "colors": colors,
+        })
+    return results
+
+
+def analyze_many(sources: Iterable[Union[bytes, Path, str]]) -> List[dict]:
+    thumbs = [load_thumb(s) for s in sources]
+    return analyze_batch(np.stack(thumbs)) if thumbs else []
+
+
+def update_analytics(index: LibraryIndex, names: Optional[Sequence[str]] = None,
+                     batch_size: int = BATCH_SIZE, logger=None) -> int:
+    """
+    Analyse index entries that have no analytics yet (or only `names`).
+
+    Returns the number of images analysed; entries that already carry
+    analytics are skipped, so repeated calls only cost the new images.
+    """
+    if names is None:
+        names = [name for name, entry in index.oldest_first() if "luma" not in entry]
+    names = [n for n in names if index.get(n) is not None]
+    done = 0
+    for start in range(0, len(names), batch_size):
+        batch, thumbs = [], []
+        for name in names[start:start + batch_size]:
+            try:
+                thumbs.append(load_thumb(index.folder / name))
+                batch.append(name)
+            except Exception as e:
+                if logger:
+                    logger.warning(f"Could not analyse {name}: {e}")
+        if not thumbs:
+            continue
+        for name, result in zip(batch, analyze_batch(np.stack(thumbs))):
+            index.update(name, **result)
+            done += 1
+    return done
+
+
+def to_hex_color(rgb: Sequence[float]) -> str:
+    return "#" + "".join(f"{int(round(min(max(c, 0), 255))):02x}" for c in rgb)
+
+
+def from_hex_color(value: str) -> Tuple[int, int, int]:
+    value = value.lstrip("#")
+    return int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16)
+
+
+def has_analytics(entry: Optional[dict]) -> bool:
+    return bool(entry) and "luma" in entry
+
+
+def matches_filter(entry: Optional[dict], mode: str, accent: Optional[Tuple[int, int, int]] = None) -> bool:
+    """Check an index entry against a tray filter; entries without analytics only pass 'all'"""
+    if mode == "all":
+        return True
+    if not has_analytics(entry):
+        return False
+    if mode == "dark":
+        return entry["luma"] < DARK_LUMA
+    if mode == "light":
+        return entry["luma"] >= LIGHT_LUMA
+    if mode == "accent":
+        if accent is None:
+            return True
+        for color, weight in entry.get("colors", []):
+            rgb = from_hex_color(color)
+            dist2 = sum((a - b) ** 2 for a, b in zip(rgb, accent))
+            if weight >= ACCENT_MIN_WEIGHT and dist2 <= ACCENT_DISTANCE ** 2:
+                return True
+        return False
+    return True
+
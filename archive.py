@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Bing Wallpaper Downloader - Archive re-encoding
+
+Re-encodes wallpapers older than N days to a smaller format/quality (WebP by
+default) in a low-priority process pool. Files keep their date/slug stem from
+build_filename(), only the extension changes, and their modification time is
+preserved so the tray's history order does not change.
+
+Usage:
+    python archive.py --older-than 30
+    python archive.py --older-than 90 --format webp --quality 75 --workers 2
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from bing_wallpaper import get_current_wallpaper, guess_ext_from_ct, load_config
+from library_index import FILE_FIELDS, LibraryIndex, entry_date
+from logger import setup_logger
+
+logger = setup_logger('archive')
+
+# Windows priority classes
+BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+IDLE_PRIORITY_CLASS = 0x00000040
+
+# PIL format names and encoder options for the supported target formats
+PIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+SAVE_OPTIONS = {"webp": {"method": 4}, "jpeg": {"optimize": True, "progressive": True}}
+
+
+@dataclass
+class ReencodeResult:
+    source: str
+    target: Optional[str]
+    old_size: int
+    new_size: int
+    cpu_seconds: float
+    error: Optional[str] = None
+
+    @property
+    def saved(self) -> int:
+        return self.old_size - self.new_size if self.target else 0
+
+
+def lower_priority(level: str = "idle"):
+    """Lower the CPU priority of the current (worker) process"""
+    if level == "normal":
+        return
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            cls = IDLE_PRIORITY_CLASS if level == "idle" else BELOW_NORMAL_PRIORITY_CLASS
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), cls)
+        else:
+            os.nice(19 if level == "idle" else 10)
+    except Exception:
+        # Priority is best effort; re-encoding still works at normal priority
+        pass
+
+
+def target_path(path: Path, fmt: str) -> Path:
+    """Same stem as the original, extension derived the way the downloader derives it"""
+    return path.with_suffix(guess_ext_from_ct(f"image/{fmt}"))
+
+
+def reencode(path_str: str, fmt: str, quality: int) -> ReencodeResult:
+    """Re-encode one file; runs in a worker process"""
+    start = time.process_time()
+    path = Path(path_str)
+    try:
+        from PIL import Image
+        st = path.stat()
+        target = target_path(path, fmt)
+        tmp = target.with_name(f".{target.name}.tmp")
+        with Image.open(path) as img:
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(tmp, PIL_FORMATS[fmt], quality=quality, **SAVE_OPTIONS[fmt])
+        new_size = tmp.stat().st_size
+        if new_size >= st.st_size:
+            # Not worth it - keep the original
+            tmp.unlink()
+            return ReencodeResult(path_str, None, st.st_size, st.st_size, time.process_time() - start)
+        os.replace(tmp, target)
+        os.utime(target, (st.st_atime, st.st_mtime))
+        if target != path:
+            path.unlink()
+        return ReencodeResult(path_str, str(target), st.st_size, new_size, time.process_time() - start)
+    except Exception as e:
+        return ReencodeResult(path_str, None, 0, 0, time.process_time() - start, error=str(e))
+
+
+def select_candidates(index: LibraryIndex, older_than_days: int, fmt: str, protected: set,
+                      now: Optional[datetime] = None) -> List[Path]:
+    """Files older than the cutoff that have not been archived yet (same format at lower quality included)"""
+    cutoff = ((now or datetime.now()) - timedelta(days=older_than_days)).strftime("%Y-%m-%d")
+    out = []
+    for name, entry in index.oldest_first():
+        if entry_date(entry) >= cutoff:
+            break
+        if name in protected or entry.get("archived"):
+            continue
+        out.append(index.folder / name)
+    return out
+
+
+def run_archive(folder: Path, older_than_days: int, fmt: str = "webp", quality: int = 80,
+                workers: Optional[int] = None, priority: str = "idle", protected: set = frozenset()) -> dict:
+    """Re-encode old wallpapers in `folder` and update the library index"""
+    index = LibraryIndex.open(folder)
+    candidates = select_candidates(index, older_than_days, fmt, set(protected))
+    logger.info(f"Archiving {len(candidates)} file(s) older than {older_than_days} days to {fmt} (quality {quality})")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    start = time.perf_counter()
+    results: List[ReencodeResult] = []
+    if workers <= 0:
+        # In-process mode (debugging, tests)
+        results = [reencode(str(p), fmt, quality) for p in candidates]
+    elif candidates:
+        with ProcessPoolExecutor(max_workers=workers, initializer=lower_priority, initargs=(priority,)) as pool:
+            results = list(pool.map(reencode, [str(p) for p in candidates], [fmt] * len(candidates),
+                                    [quality] * len(candidates), chunksize=4))
+    wall = time.perf_counter() - start
+
+    for r in results:
+        if r.error:
+            logger.warning(f"Could not re-encode {Path(r.source).name}: {r.error}")
+            continue
+        if r.target:
+            source, target = Path(r.source).name, Path(r.target)
+            # Analytics, hashes and duplicate marks describe the picture, which the re-encode keeps
+            kept = {k: v for k, v in (index.get(source) or {}).items() if k not in FILE_FIELDS}
+            index.remove(source)
+            index.add(target)
+            index.update(target.name, **{**kept, "archived": fmt})
+            for name in list(index.names()):
+                if index.get(name).get("duplicate_of") == source:
+                    index.update(name, duplicate_of=target.name)
+        else:
+            index.update(Path(r.source).name, archived="kept")
+    index.save()
+
+    converted = [r for r in results if r.target]
+    bytes_in = sum(r.old_size for r in results if not r.error)
+    cpu = sum(r.cpu_seconds for r in results)
+    report = {
+        "candidates": len(candidates),
+        "converted": len(converted),
+        "kept_original": len([r for r in results if not r.target and not r.error]),
+        "errors": len([r for r in results if r.error]),
+        "bytes_saved": sum(r.saved for r in converted),
+        "wall_s": round(wall, 3),
+        "mb_per_s": round(bytes_in / 1024 / 1024 / wall, 2) if wall > 0 else None,
+        "mb_per_s_per_core": round(bytes_in / 1024 / 1024 / cpu, 2) if cpu > 0 else None,
+        "workers": max(workers, 1),
+    }
+    logger.info(f"Archive finished: {report}")
+    return report
+
+
+def main():
+    config = load_config()
+    p = argparse.ArgumentParser("Re-encode old Bing wallpapers to save disk space")
+    p.add_argument("--folder", default=config.get("download_folder", str(Path.home() / "Pictures" / "BingWallpapers")))
+    p.add_argument("--older-than", type=int, default=config.get("archive_older_than_days", 30),
+                   help="Only re-encode wallpapers older than this many days")
+    p.add_argument("--format", choices=sorted(PIL_FORMATS), default=config.get("archive_format", "webp"))
+    p.add_argument("--quality", type=int, default=config.get("archive_quality", 80))
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count, 0 = in-process)")
+    p.add_argument("--priority", choices=["idle", "below_normal", "normal"], default="idle")
+    args = p.parse_args()
+
+    folder = Path(args.folder)
+    if not folder.exists():
+        print(f"Ordner nicht gefunden: {folder}", file=sys.stderr)
+        return 1
+
+    protected = set(config.get("favorites", []))
+    current = get_current_wallpaper()
+    if current:
+        protected.add(current.name)
+
+    report = run_archive(folder, args.older_than, args.format, args.quality, args.workers, args.priority, protected)
+    print(f"Konvertiert: {report['converted']} von {report['candidates']}, "
+          f"gespart: {report['bytes_saved'] / 1024 / 1024:.1f} MB, "
+          f"{report['mb_per_s']} MB/s gesamt, {report['mb_per_s_per_core']} MB/s pro Kern")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
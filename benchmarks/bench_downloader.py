@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark for the downloader pipeline.
+
+Runs `fetch_all_images` and `main()` against the local fake Bing server for a
+set of network scenarios and reports wall time, bytes transferred, requests
+per image and peak RSS. Each scenario runs in its own interpreter so peak RSS
+is not polluted by earlier scenarios.
+
+Usage:
+    python benchmarks/bench_downloader.py                 # run and compare to baselines
+    python benchmarks/bench_downloader.py --scenario lan  # single scenario
+    python benchmarks/bench_downloader.py --save-baseline # overwrite stored baselines
+    python benchmarks/bench_downloader.py --check         # exit 1 on regression
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+BASELINE_FILE = BENCH_DIR / "baselines" / "downloader.json"
+
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fake_bing import FakeBingServer, ServerConfig  # noqa: E402
+from library_index import is_image_name  # noqa: E402
+
+RES = "UHD,3840x2160,2560x1440,1920x1200,1920x1080"
+
+SCENARIOS: Dict[str, ServerConfig] = {
+    "local": ServerConfig(),
+    "lan": ServerConfig(latency=0.005, bandwidth=50 * 1024 * 1024),
+    "slow_link": ServerConfig(latency=0.05, bandwidth=8 * 1024 * 1024),
+    "missing_uhd": ServerConfig(missing_resolutions={"UHD", "3840x2160"}),
+    "flaky": ServerConfig(error_rate=0.2),
+    "laptop_auto": ServerConfig(),
+}
+
+# Client config overrides per scenario (default: the fixed RES list)
+CLIENT_CONFIG: Dict[str, dict] = {
+    "laptop_auto": {"resolution": "auto", "display_provider": "static", "display": "1366x768"},
+}
+
+# Relative wall-time slack before a scenario counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process, if the platform exposes it"""
+    if sys.platform == "win32":
+        try:
+            import psutil  # optional
+            return psutil.Process().memory_info().peak_wset
+        except ImportError:
+            return None
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS reports bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def run_scenario(name: str, count: int = 8) -> dict:
+    """Run one scenario in this process and return its measurements"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        config_file = tmp / "config.json"
+        out_dir = tmp / "wallpapers"
+        config = {
+            "download_folder": str(out_dir),
+            "market": "en-US",
+            "fallback_markets": "",
+            "resolution": RES,
+            "image_count": count,
+            "set_latest": False,
+            "file_mode": "overwrite",
+            "name_mode": "slug",
+        }
+        config.update(CLIENT_CONFIG.get(name, {}))
+        config_file.write_text(json.dumps(config), encoding="utf-8")
+
+        import bing_wallpaper
+        from displays import auto_resolutions, detect_display
+        bing_wallpaper.CONFIG_FILE = config_file
+
+        with FakeBingServer(SCENARIOS[name]) as server:
+            bing_wallpaper.BING_BASE = server.base_url
+            display = None
+            if config["resolution"] == "auto":
+                display = detect_display(config)
+                preferred_res = auto_resolutions(display)
+            else:
+                preferred_res = [r.strip() for r in RES.split(",")]
+
+            # Phase 1: fetch only
+            start = time.perf_counter()
+            images = bing_wallpaper.fetch_all_images(["en-US"], count, preferred_res, display)
+            fetch_time = time.perf_counter() - start
+            fetch_stats = server.stats.snapshot()
+            server.stats.reset()
+
+            # Phase 2: full main() including disk writes
+            argv = sys.argv
+            sys.argv = ["bing_wallpaper.py", "--out", str(out_dir)]
+            try:
+                start = time.perf_counter()
+                rc = bing_wallpaper.main()
+                main_time = time.perf_counter() - start
+            finally:
+                sys.argv = argv
+            main_stats = server.stats.snapshot()
+
+        n_images = max(1, len(images))
+        return {
+            "scenario": name,
+            "images": len(images),
+            "fetch_wall_s": round(fetch_time, 4),
+            "main_wall_s": round(main_time, 4),
+            "main_rc": rc,
+            "bytes_transferred": fetch_stats["bytes_sent"],
+            "requests": sum(fetch_stats["requests"].values()),
+            "requests_per_image": round(sum(fetch_stats["requests"].values()) / n_images, 2),
+            "candidate_404s": fetch_stats["requests"].get("image_404", 0),
+            "main_bytes_transferred": main_stats["bytes_sent"],
+            # Images only: the folder also holds the library index
+            "files_written": sum(1 for p in out_dir.iterdir() if is_image_name(p.name)) if out_dir.exists() else 0,
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+
+def run_isolated(name: str) -> dict:
+    """Run a scenario in a fresh interpreter and parse its JSON result"""
+    proc = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--child", name],
+        capture_output=True, text=True, cwd=str(REPO_DIR),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{proc.stderr}")
+    # The result is the last line; the downloader may print above it
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(result: dict, baseline: Optional[dict], tolerance: float) -> list:
+    """Return a list of human-readable regressions against the baseline"""
+    if not baseline:
+        return []
+    problems = []
+    for key in ("fetch_wall_s", "main_wall_s"):
+        allowed = baseline[key] * (1 + tolerance) + 0.05
+        if result[key] > allowed:
+            problems.append(f"{key} {result[key]:.3f}s > {allowed:.3f}s")
+    # Transfer volume and request counts are deterministic for a scenario
+    for key in ("bytes_transferred", "requests_per_image"):
+        if result[key] > baseline[key]:
+            problems.append(f"{key} {result[key]} > baseline {baseline[key]}")
+    return problems
+
+
+def format_row(result: dict, baseline: Optional[dict]) -> str:
+    def delta(key):
+        if not baseline or not baseline.get(key):
+            return ""
+        return f" ({(result[key] / baseline[key] - 1) * 100:+.0f}%)"
+    rss = result["peak_rss_bytes"]
+    rss_text = f"{rss / 1024 / 1024:.1f} MB" if rss else "n/a"
+    return (
+        f"{result['scenario']:<12} images={result['images']} "
+        f"fetch={result['fetch_wall_s']:.3f}s{delta('fetch_wall_s')} "
+        f"main={result['main_wall_s']:.3f}s{delta('main_wall_s')} "
+        f"bytes={result['bytes_transferred']}{delta('bytes_transferred')} "
+        f"req/img={result['requests_per_image']} rss={rss_text}"
+    )
+
+
+def main():
+    p = argparse.ArgumentParser("Downloader end-to-end benchmark")
+    p.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                   help="Scenario to run (repeatable, default: all)")
+    p.add_argument("--save-baseline", action="store_true", help="Store results as the new baselines")
+    p.add_argument("--check", action="store_true", help="Exit with status 1 if a regression is found")
+    p.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    p.add_argument("--json", action="store_true", help="Print raw JSON results")
+    p.add_argument("--child", help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        result = run_scenario(args.child)
+        print(json.dumps(result))
+        return 0
+
+    baselines = {}
+    if BASELINE_FILE.exists():
+        baselines = json.loads(BASELINE_FILE.read_text(encoding="utf-8"))
+
+    results = {}
+    regressions = {}
+    for name in args.scenario or list(SCENARIOS):
+        result = run_isolated(name)
+        results[name] = result
+        problems = compare(result, baselines.get(name), args.tolerance)
+        if problems:
+            regressions[name] = problems
+        if not args.json:
+            print(format_row(result, baselines.get(name)))
+            for problem in problems:
+                print(f"    REGRESSION: {problem}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        baselines.update(results)
+        BASELINE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE_FILE.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Baselines written to {BASELINE_FILE}")
+
+    if args.check and regressions:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Large-library scaling benchmark for the tray manager.
+
+Generates synthetic wallpaper libraries (10k-100k files by default) and times
+the `WallpaperManager` / `TrayApp` operations that depend on library size:
+`refresh_wallpaper_list`, Previous/Next navigation, `get_current_wallpaper_info`,
+`TrayApp.get_menu` and the Browse menu (date index, one month's day items).
+`menu_tree` builds every item of every submenu, as pystray's Win32 backend
+does on each update_menu(); `menu_tree_unbounded` does the same with Browse
+listing the whole library instead of the last BROWSE_MONTHS months. Win32
+calls (ctypes, schtasks) are stubbed so the harness runs on Linux.
+
+Usage:
+    python benchmarks/bench_tray.py                          # 1k, 10k, 100k sparse files
+    python benchmarks/bench_tray.py --sizes 10000,50000 --real
+    python benchmarks/bench_tray.py --json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+from unittest import mock
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fake_bing import make_jpeg  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+SPARSE_SIZE = 1_500_000  # apparent size of sparse files, roughly a UHD JPEG
+
+
+def _install_pystray_stand_in():
+    """Provide a minimal pystray replacement when no display backend is available.
+
+    Menu and MenuItem keep their arguments like the real classes do, so menu
+    construction cost stays representative.
+    """
+    class MenuItem:
+        def __init__(self, text, action, **kwargs):
+            self.text = text
+            self.action = action
+            self.options = kwargs
+
+        @property
+        def submenu(self):
+            return self.action if isinstance(self.action, Menu) else None
+
+    class Menu:
+        SEPARATOR = MenuItem("- - - -", None)
+
+        def __init__(self, *items):
+            self._items = items
+
+        @property
+        def items(self):
+            # Like pystray, a single callable is an item generator run on every access
+            if len(self._items) == 1 and callable(self._items[0]):
+                return tuple(self._items[0]())
+            return self._items
+
+    stand_in = types.ModuleType("pystray")
+    stand_in.Menu = Menu
+    stand_in.MenuItem = MenuItem
+    stand_in.Icon = object
+    sys.modules["pystray"] = stand_in
+
+
+def import_tray():
+    try:
+        import pystray  # noqa: F401
+    except Exception:
+        _install_pystray_stand_in()
+    import bing_wallpaper_tray
+    return bing_wallpaper_tray
+
+
+class StubIcon:
+    """Tray icon stand-in: counts menu redraws instead of talking to a tray backend"""
+
+    def __init__(self):
+        self.redraws = 0
+
+    def update_menu(self):
+        self.redraws += 1
+
+
+def generate_library(folder: Path, count: int, real: bool = False, start: datetime = None) -> List[Path]:
+    """Create `count` wallpaper files named like the downloader names them.
+
+    real=True writes small but structurally valid JPEGs; otherwise files are
+    sparse (apparent size SPARSE_SIZE, almost no disk usage). Modification
+    times follow the dates in the filenames, newest first.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    start = start or datetime(2025, 1, 20, 9, 0, 0)
+    payload = make_jpeg(64, 36, 2048) if real else None
+    paths = []
+    for i in range(count):
+        day = start - timedelta(days=i // 3, minutes=i % 3)
+        path = folder / f"{day.strftime('%Y-%m-%d')}_Synthetic{i:06d}.jpg"
+        if real:
+            path.write_bytes(payload)
+        else:
+            with open(path, "wb") as f:
+                f.truncate(SPARSE_SIZE)
+        ts = day.timestamp()
+        os.utime(path, (ts, ts))
+        paths.append(path)
+    return paths
+
+
+def measure(fn: Callable, repeat: int = 1) -> Dict[str, float]:
+    """Time `fn` and record its peak traced allocation"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed / repeat, "peak_bytes": peak}
+
+
+def build_tree(menu) -> int:
+    """Create every item of `menu` and its submenus, as pystray's Win32 _create_menu does; returns the item count"""
+    count = 0
+    for entry in menu.items:
+        count += 1
+        submenu = entry.submenu
+        if submenu:
+            count += build_tree(submenu)
+    return count
+
+
+def bench_size(tray, size: int, real: bool, nav_steps: int) -> Dict[str, dict]:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        library = tmp / "wallpapers"
+        gen_start = time.perf_counter()
+        paths = generate_library(library, size, real=real)
+        gen_time = time.perf_counter() - gen_start
+        config_file = tmp / "config.json"
+        config_file.write_text(json.dumps({"download_folder": str(library)}), encoding="utf-8")
+
+        # Pretend the newest-but-one file is the current Windows wallpaper so
+        # refresh has to look it up, as it does on a real desktop.
+        current = paths[1]
+        with mock.patch.object(tray, "CONFIG_FILE", config_file), \
+                mock.patch.object(tray.WallpaperManager, "is_task_enabled", return_value=True), \
+                mock.patch.object(tray.WallpaperManager, "get_current_wallpaper", return_value=current), \
+                mock.patch.object(tray.WallpaperManager, "set_wallpaper", return_value=True):
+            app = tray.TrayApp()
+            app.icon = StubIcon()
+            manager = app.manager
+
+            results = {"generate": {"seconds": gen_time, "peak_bytes": 0}}
+            results["refresh_wallpaper_list"] = measure(manager.refresh_wallpaper_list)
+
+            manager.current_wallpaper_index = 0
+            results["previous_wallpaper"] = measure(manager.previous_wallpaper, repeat=nav_steps)
+            results["next_wallpaper"] = measure(manager.next_wallpaper, repeat=nav_steps)
+            # Deliver the coalesced redraw now rather than from its timer during a later measurement
+            app.redraw.flush()
+            results["get_current_wallpaper_info"] = measure(manager.get_current_wallpaper_info, repeat=100)
+            results["get_menu"] = measure(app.get_menu, repeat=20)
+            results["browse_index"] = measure(lambda: tray.DateIndex(manager.wallpapers))
+            index = tray.DateIndex(manager.wallpapers)
+            year = index.years()[0]
+            month = index.months(year)[0][0]
+            results["browse_month"] = measure(lambda: list(app.browse_days(index, year, month)), repeat=20)
+            results["menu_tree"] = measure(lambda: build_tree(app.get_menu()), repeat=5)
+            results["menu_tree"]["items"] = build_tree(app.get_menu())
+            with mock.patch.object(tray, "BROWSE_MONTHS", 12 * 1000):
+                results["menu_tree_unbounded"] = measure(lambda: build_tree(app.get_menu()), repeat=5)
+                results["menu_tree_unbounded"]["items"] = build_tree(app.get_menu())
+    return results
+
+
+def print_report(all_results: Dict[int, Dict[str, dict]]):
+    sizes = sorted(all_results)
+    ops = [op for op in all_results[sizes[0]] if op != "generate"]
+    print(f"{'operation':<28}" + "".join(f"{size:>22,}" for size in sizes))
+    for op in ops:
+        cells = []
+        prev = None
+        for size in sizes:
+            r = all_results[size][op]
+            cell = f"{r['seconds'] * 1000:9.3f}ms {r['peak_bytes'] / 1024:7.0f}K"
+            # Growth relative to the previous size, normalised by the size ratio:
+            # ~1.0x means linear, >1 means super-linear
+            if prev is not None and prev[1]["seconds"] > 0:
+                growth = (r["seconds"] / prev[1]["seconds"]) / (size / prev[0])
+                cell += f" {growth:4.1f}x"
+            else:
+                cell += "      "
+            cells.append(f"{cell:>22}")
+            prev = (size, r)
+        print(f"{op:<28}" + "".join(cells))
+    print("\n(time per call, peak traced allocation, growth vs. linear scaling from the previous size)")
+
+
+def main():
+    p = argparse.ArgumentParser("Tray manager large-library benchmark")
+    p.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                   help="Comma-separated library sizes")
+    p.add_argument("--real", action="store_true", help="Write real (small) JPEG files instead of sparse files")
+    p.add_argument("--nav-steps", type=int, default=50, help="Previous/Next calls per measurement")
+    p.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = p.parse_args()
+
+    tray = import_tray()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    all_results = {}
+    for size in sizes:
+        all_results[size] = bench_size(tray, size, args.real, args.nav_steps)
+        if not args.json:
+            print(f"library size {size:,}: generated in {all_results[size]['generate']['seconds']:.1f}s",
+                  file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(all_results, indent=2))
+    else:
+        print_report(all_results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
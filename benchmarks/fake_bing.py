@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Bing endpoints used by the downloader.
+
+Serves /HPImageArchive.aspx (JSON metadata) and /th?id=OHR.* (images) with
+configurable latency, bandwidth, missing resolutions and error rates, so the
+real download pipeline can be benchmarked without touching the network.
+"""
+import json
+import random
+import re
+import struct
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set
+
+# Pixel dimensions for the resolution tokens Bing understands
+RESOLUTIONS = {
+    "UHD": (3840, 2160),
+    "3840x2160": (3840, 2160),
+    "2560x1440": (2560, 1440),
+    "1920x1200": (1920, 1200),
+    "1920x1080": (1920, 1080),
+    "1366x768": (1366, 768),
+    "1280x720": (1280, 720),
+}
+
+IMAGE_RE = re.compile(r"^OHR\.(?P<slug>[^_]+)_(?P<tag>[^_]+)_(?P<res>[^.]+)\.(?P<ext>jpg|png|webp)$")
+
+
+def make_jpeg(width: int, height: int, size: int) -> bytes:
+    """Build a structurally valid baseline JPEG of roughly `size` bytes.
+
+    The payload has SOI, a SOF0 frame header carrying the real dimensions,
+    a scan of filler entropy data and EOI, which is enough for header-only
+    validators. It is not meant to be decoded.
+    """
+    sof = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\x00"
+    sos = b"\xff\xda" + struct.pack(">HB", 8, 1) + b"\x01\x00\x00\x3f\x00"
+    head = b"\xff\xd8" + b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    head += sof + sos
+    filler = max(0, size - len(head) - 2)
+    # Entropy-coded data must not contain 0xFF, so use a repeating safe pattern
+    body = (bytes(range(0x20, 0x7F)) * (filler // 95 + 1))[:filler]
+    return head + body + b"\xff\xd9"
+
+
+@dataclass
+class ServerConfig:
+    """Behaviour knobs for the fake server"""
+    latency: float = 0.0                 # seconds added before every response
+    bandwidth: Optional[int] = None      # bytes per second for response bodies, None = unlimited
+    missing_resolutions: Set[str] = field(default_factory=set)
+    extensions: Set[str] = field(default_factory=lambda: {"jpg"})
+    error_rate: float = 0.0              # probability of a 500 for image requests
+    metadata_error_rate: float = 0.0     # probability of a 500 for metadata requests
+    bytes_per_pixel: float = 0.15        # controls image payload size
+    image_count: int = 8
+    seed: int = 1234
+
+
+class Stats:
+    """Thread-safe request/byte counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests: Dict[str, int] = {"metadata": 0, "image": 0, "image_404": 0, "error": 0}
+            self.bytes_sent = 0
+
+    def record(self, kind: str, nbytes: int = 0):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes_sent += nbytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requests": dict(self.requests), "bytes_sent": self.bytes_sent}
+
+
+def build_metadata(mkt: str, idx: int, n: int, total: int) -> dict:
+    """Build an HPImageArchive-style JSON document"""
+    today = datetime(2025, 1, 20)
+    images = []
+    for i in range(idx, min(idx + n, total)):
+        day = today - timedelta(days=i)
+        slug = f"Bench{i:02d}"
+        tag = f"{mkt.replace('-', '')}{1000 + i}"
+        images.append({
+            "startdate": day.strftime("%Y%m%d"),
+            "fullstartdate": day.strftime("%Y%m%d") + "0800",
+            "url": f"/th?id=OHR.{slug}_{tag}_1920x1080.jpg&rf=LaDigue_1920x1080.jpg&pid=hp",
+            "urlbase": f"/th?id=OHR.{slug}_{tag}",
+            "title": f"Benchmark image {i}",
+            "copyright": "Benchmark",
+        })
+    return {"images": images}
+
+
+class FakeBingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeBingServer"
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+    def do_GET(self):
+        cfg = self.server.config
+        if cfg.latency:
+            time.sleep(cfg.latency)
+        parsed = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parsed.query)
+
+        if parsed.path == "/HPImageArchive.aspx":
+            if self.server.roll(cfg.metadata_error_rate):
+                return self._send_status(500, "error")
+            doc = build_metadata(
+                query.get("mkt", ["en-US"])[0],
+                int(query.get("idx", ["0"])[0]),
+                int(query.get("n", ["1"])[0]),
+                cfg.image_count,
+            )
+            body = json.dumps(doc).encode("utf-8")
+            self.server.stats.record("metadata", len(body))
+            return self._send_body(body, "application/json; charset=utf-8")
+
+        if parsed.path == "/th":
+            m = IMAGE_RE.match(query.get("id", [""])[0])
+            if not m or m["res"] not in RESOLUTIONS or m["res"] in cfg.missing_resolutions \
+                    or m["ext"] not in cfg.extensions:
+                return self._send_status(404, "image_404")
+            if self.server.roll(cfg.error_rate):
+                return self._send_status(500, "error")
+            body = self.server.image_bytes(m["res"])
+            self.server.stats.record("image", len(body))
+            return self._send_body(body, "image/jpeg")
+
+        self._send_status(404, "error")
+
+    def _send_status(self, code: int, kind: str):
+        self.server.stats.record(kind)
+        body = b"Not Found" if code == 404 else b"Server Error"
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        bandwidth = self.server.config.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        chunk = max(1024, bandwidth // 50)
+        start = time.perf_counter()
+        for offset in range(0, len(body), chunk):
+            self.wfile.write(body[offset:offset + chunk])
+            # Sleep until the cumulative byte budget allows the next chunk
+            due = (offset + chunk) / bandwidth
+            delay = due - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+
+class FakeBingServer(ThreadingHTTPServer):
+    """Threaded fake Bing server bound to 127.0.0.1 on an ephemeral port"""
+    daemon_threads = True
+
+    def __init__(self, config: Optional[ServerConfig] = None, port: int = 0):
+        super().__init__(("127.0.0.1", port), FakeBingHandler)
+        self.config = config or ServerConfig()
+        self.stats = Stats()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._images: Dict[str, bytes] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def roll(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < probability
+
+    def image_bytes(self, res: str) -> bytes:
+        # Cached per resolution; identical payloads are fine for benchmarking
+        if res not in self._images:
+            w, h = RESOLUTIONS[res]
+            self._images[res] = make_jpeg(w, h, int(w * h * self.config.bytes_per_pixel))
+        return self._images[res]
+
+    def start(self) -> "FakeBingServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -81,7 +81,24 @@ try {
     "--remove-output",
     "--disable-ccache",
     "--nofollow-imports",
-    "--include-module=logger"
+    "--include-module=logger",
+    "--include-module=telemetry",
+    "--include-module=metrics",
+    "--include-module=fileutil",
+    "--include-module=library_index",
+    "--include-module=retention",
+    "--include-module=phash",
+    "--include-module=analytics",
+    "--include-module=displays",
+    "--include-module=journal",
+    "--include-module=http_cache",
+    "--include-module=shared_cache",
+    "--include-module=mirror",
+    "--include-module=throttle",
+    "--include-module=imageinfo",
+    "--include-module=connectivity",
+    "--include-module=deadline",
+    "--include-module=health"
   )
   $nuitkaArgs += "--output-filename=$ExeName"
 
@@ -109,6 +126,17 @@ try {
       "--disable-ccache",
       "--nofollow-imports",
       "--include-module=logger",
+      "--include-module=telemetry",
+      "--include-module=metrics",
+      "--include-module=fileutil",
+      "--include-module=library_index",
+      "--include-module=retention",
+      "--include-module=analytics",
+      "--include-module=tray_state",
+      "--include-module=slideshow",
+      "--include-module=browse",
+      "--include-module=tray_control",
+      "--include-module=diagnostics",
       "--include-data-files=tray_icon.png=tray_icon.png",
       "--include-data-files=app_icon.ico=app_icon.ico"
     )
@@ -5,15 +5,32 @@ import hashlib
 import json
 import os
 import sys
+import time
 from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
 # Import logging
-from logger import setup_logger
+from deadline import Deadline, DeadlineExceeded, request_timeout
+from connectivity import DEFAULT_MAX_WAIT, INITIAL_BACKOFF, ConnectivityProvider, SocketProvider, wait_for_network
+from displays import AUTO, apply_resolution_policy, auto_resolutions, detect_display, order_urls
+from fileutil import atomic_write_bytes
+from health import HEALTH_FILE_NAME, PROBE_TIMEOUT, HealthStore
+from http_cache import CACHE_DIR_NAME, HttpCache
+from imageinfo import ImageProbe, InvalidImage
+from journal import DOWNLOADING, JOURNAL_NAME, VERIFIED, WRITTEN, RunJournal, sha256_bytes
+from logger import LOG_DIR, setup_logger
+from library_index import IMAGE_EXTENSIONS, LibraryIndex
+from metrics import downloader_registry, record_run, update_locked
+from retention import RetentionPolicy, apply_retention, protected_names, select_unwanted
+from shared_cache import DEFAULT_MAX_AGE_DAYS, SharedCache
+from telemetry import RunProfiler, run_stats
+from throttle import CHUNK_SIZE, BandwidthPolicy, TokenBucket, read_paced
 
 BING_BASE = "https://www.bing.com"
 HEADERS = {
@@ -26,6 +43,24 @@ HEADERS = {
 
 # Config file location
 CONFIG_FILE = Path(os.getenv('APPDATA', '')) / 'BingWallpaperDownloader' / 'config.json'
+RUN_SUMMARY_NAME = 'last_run.json'
+METRICS_DIR_NAME = 'metrics'
+MIRROR_DIR_NAME = 'mirror'
+
+# Shared on-disk HTTP cache (set up in main(); None = no caching)
+http_cache: Optional[HttpCache] = None
+# Freshness for responses without cache headers
+METADATA_TTL = 15 * 60
+# Bing does not add resolutions to an existing image, so a 404 stays a 404
+NEGATIVE_TTL = 24 * 3600
+# Image pool shared by several machines (set up in main(); None = fleet mode off)
+shared_cache: Optional[SharedCache] = None
+# Rate cap / idle-only downloads (set up in main(); None = full speed)
+bandwidth: Optional[BandwidthPolicy] = None
+# Reachability probe (set up in main(); None = no probing)
+connectivity: Optional[ConnectivityProvider] = None
+# Circuit breakers per market and host (set up in main(); None = off)
+health: Optional[HealthStore] = None
 
 # Initialize logger
 logger = setup_logger('downloader')
@@ -55,6 +90,7 @@ def load_config() -> dict:
             logger.info("Config file still not found after waiting - creating default config")
             default_config = {
                 "download_folder": str(Path.home() / "Pictures" / "BingWallpapers"),
+                "shared_cache_folder": "",
                 "market": "de-DE",
                 "fallback_markets": "en-US",
                 "resolution": "UHD,3840x2160,2560x1440,1920x1200,1920x1080",
@@ -82,16 +118,44 @@ def load_config() -> dict:
         logger.warning(f"Could not load config file: {e}")
         return {}
 
-def fetch_images_json(mkt: str, idx: int, count: int) -> List[dict]:
-    """Fetch multiple images at once from Bing API"""
+def record_host(url: str, seconds: float, status: Optional[int] = None, error: Optional[str] = None):
+    """Feed one request's outcome into the host's breaker; 4xx answers count as a healthy host"""
+    if health is None:
+        return
+    ok = error is None and status < 500
+    health.record("host", urllib.parse.urlsplit(url).netloc, ok, seconds, error or f"HTTP {status}")
+
+def timed_get(get: Callable, url: str, **kwargs):
+    """get(url, **kwargs), recording latency and failures for the host"""
+    start = time.monotonic()
+    try:
+        r = get(url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        record_host(url, time.monotonic() - start, error=str(e))
+        raise
+    record_host(url, time.monotonic() - start, status=r.status_code)
+    return r
+
+def fetch_images_json(mkt: str, idx: int, count: int, deadline: Optional[Deadline] = None) -> List[dict]:
+    """Fetch multiple images at once from Bing API; raises DeadlineExceeded when the budget is gone"""
     url = (
         f"{BING_BASE}/HPImageArchive.aspx?"
         f"format=js&idx={idx}&n={count}&mkt={urllib.parse.quote(mkt)}"
     )
+    timeout = request_timeout(deadline, 15)
     try:
-        r = requests.get(url, headers=HEADERS, timeout=15)
-        r.raise_for_status()
-        data = r.json()
+        with run_stats.span("metadata"):
+            if http_cache is not None:
+                r = http_cache.fetch(url, lambda u, extra: timed_get(requests.get, u, headers={**HEADERS, **extra},
+                                                                     timeout=timeout),
+                                     METADATA_TTL, cacheable=(200,),
+                                     max_wait=deadline.remaining() if deadline else None)
+                if not r.ok:
+                    raise requests.HTTPError(f"{r.status_code} Error for url: {url}")
+            else:
+                r = timed_get(requests.get, url, headers=HEADERS, timeout=timeout)
+                r.raise_for_status()
+            data = r.json()
         imgs = data.get("images") or []
         if imgs:
             logger.info(f"Fetched {len(imgs)} image(s) metadata for market={mkt}, idx={idx}, count={count}")
@@ -105,7 +169,7 @@ def fetch_images_json(mkt: str, idx: int, count: int) -> List[dict]:
         logger.error(f"Unexpected error fetching metadata: {e}", exc_info=True)
         return []
 
-def build_candidate_urls(img: dict, preferred_res: List[str]) -> List[str]:
+def build_candidate_urls(img: dict, preferred_res: List[str], display: Optional[Tuple[int, int]] = None) -> List[str]:
     urls = []
     url = img.get("url")
     urlbase = img.get("urlbase")
@@ -122,7 +186,8 @@ def build_candidate_urls(img: dict, preferred_res: List[str]) -> List[str]:
         if u not in seen:
             seen.add(u)
             out.append(u)
-    return out
+    # Auto mode: smallest resolution covering the display first, including img["url"]
+    return order_urls(out, display)
 
 def guess_ext_from_ct(ct: Optional[str]) -> str:
     if not ct:
@@ -134,23 +199,55 @@ def guess_ext_from_ct(ct: Optional[str]) -> str:
     if "bmp" in ct: return ".bmp"
     return ".jpg"
 
-def download_first(urls: List[str]) -> Tuple[bytes, str]:
+def download_first(urls: List[str], bucket: Optional[TokenBucket] = None,
+                   deadline: Optional[Deadline] = None) -> Tuple[bytes, str]:
     last = None
-    with requests.Session() as s:
+    with run_stats.span("download"), requests.Session() as s:
         for u in urls:
+            cached = http_cache.lookup(u) if http_cache is not None else None
+            if cached is not None and cached.status_code == 404:
+                # Another run already found that this resolution does not exist
+                run_stats.add("candidate_404s_cached")
+                continue
             try:
-                r = s.get(u, headers=HEADERS, timeout=30)
+                # Stream the body through the validator (and the rate limiter, if any):
+                # a bad candidate is dropped after its first chunk, not after the whole body
+                r = timed_get(s.get, u, headers=HEADERS, timeout=request_timeout(deadline, 30), stream=True)
                 r.raise_for_status()
-                data = r.content
+                probe = ImageProbe()
+                slept = bucket.slept if bucket else 0.0
+                chunks = probe.watch(r.iter_content(CHUNK_SIZE))
+                data = read_paced(deadline.watch(chunks) if deadline else chunks, bucket)
+                if bucket:
+                    run_stats.record("throttle", bucket.slept - slept)
+                info = probe.finish()
                 if len(data) < 10 * 1024:
                     last = RuntimeError("Response too small")
                     logger.warning(f"Image too small from {u[:50]}...")
+                    run_stats.add("candidate_misses")
                     continue
-                ct = r.headers.get("Content-Type", "") or "image/jpeg"
-                logger.info(f"Successfully downloaded image ({len(data)} bytes)")
+                # The real format, not what the Content-Type header claims
+                ct = info.content_type
+                logger.info(f"Successfully downloaded image ({len(data)} bytes, {info.width}x{info.height} {info.format})")
+                run_stats.add("bytes_downloaded", len(data))
+                run_stats.add("images_downloaded")
                 return data, ct
+            except DeadlineExceeded:
+                raise
+            except InvalidImage as e:
+                r.close()
+                logger.warning(f"Rejected {u[:50]}...: {e}")
+                run_stats.add("candidate_misses")
+                run_stats.add("candidate_invalid")
+                last = e
             except Exception as e:
                 logger.warning(f"Failed to download from {u[:50]}...: {e}")
+                run_stats.add("candidate_misses")
+                response = getattr(e, "response", None)
+                if response is not None and response.status_code == 404:
+                    run_stats.add("candidate_404s")
+                    if http_cache is not None:
+                        http_cache.store(u, 404, b"", response.headers, NEGATIVE_TTL)
                 last = e
     logger.error("All download attempts failed")
     raise last or RuntimeError("Download failed")
@@ -205,37 +302,268 @@ def build_filename(img: dict, ct: str, name_mode: str = "slug", img_idx: Optiona
         base = base[:140].rstrip("_")
     return base + guess_ext_from_ct(ct)
 
+def existing_variant(target: Path) -> Optional[Path]:
+    """Return target or an archived copy of it (same stem, other image extension), if present"""
+    if target.exists():
+        return target
+    for ext in IMAGE_EXTENSIONS:
+        cand = target.with_suffix(ext)
+        if cand.exists():
+            return cand
+    return None
+
 def set_wallpaper(path: Path):
     SPI_SETDESKWALLPAPER = 20
     SPIF_UPDATEINIFILE = 0x01
     SPIF_SENDWININICHANGE = 0x02
-    ok = ctypes.windll.user32.SystemParametersInfoW(
-        SPI_SETDESKWALLPAPER, 0, str(path.resolve()), SPIF_UPDATEINIFILE | SPIF_SENDWININICHANGE
-    )
+    with run_stats.span("set_wallpaper"):
+        ok = ctypes.windll.user32.SystemParametersInfoW(
+            SPI_SETDESKWALLPAPER, 0, str(path.resolve()), SPIF_UPDATEINIFILE | SPIF_SENDWININICHANGE
+        )
     if ok == 0:
         raise ctypes.WinError()
 
-def fetch_all_images(markets: List[str], count: int, preferred_res: List[str]) -> List[Tuple[bytes, str, dict]]:
-    """Fetch all images at once from the first available market"""
+def get_current_wallpaper() -> Optional[Path]:
+    """Return the current Windows wallpaper, or None if it cannot be determined"""
+    SPI_GETDESKWALLPAPER = 0x0073
+    try:
+        buf = ctypes.create_unicode_buffer(512)
+        ctypes.windll.user32.SystemParametersInfoW(SPI_GETDESKWALLPAPER, len(buf), buf, 0)
+        return Path(buf.value) if buf.value else None
+    except Exception:
+        return None
+
+def open_duplicate_finder(out_dir: Path, config: dict):
+    """Near-duplicate finder over the hashes in the library index, or None if dedupe is off"""
+    if config.get("dedupe_mode", "off") == "off":
+        return None
+    try:
+        from phash import DEFAULT_THRESHOLD, DuplicateFinder
+        index = LibraryIndex.open(out_dir, sync=False)
+        return DuplicateFinder.from_index(index, config.get("dedupe_threshold", DEFAULT_THRESHOLD))
+    except Exception as e:
+        logger.warning(f"Near-duplicate detection disabled: {e}")
+        return None
+
+def check_duplicate(finder, data: bytes, out_dir: Path, fname: str = "") -> Tuple[dict, Optional[Path]]:
+    """Hash downloaded image data; returns (index fields, path of a near-duplicate already on disk)"""
+    try:
+        from phash import image_hashes
+        with run_stats.span("phash"):
+            fields = image_hashes(data)
+    except Exception as e:
+        logger.warning(f"Could not hash image: {e}")
+        return {}, None
+    # The file being overwritten is not a duplicate of itself
+    match = finder.find(fields[finder.kind], exclude=(fname,))
+    if match and (out_dir / match[1]).exists():
+        run_stats.add("near_duplicates")
+        fields["duplicate_of"] = match[1]
+        return fields, out_dir / match[1]
+    return fields, None
+
+def update_library(out_dir: Path, config: dict, written: List[Path], latest_path: Optional[Path],
+                   fields: Optional[Dict[str, dict]] = None):
+    """Record new files in the library index and enforce the retention policy"""
+    fields = fields or {}
+    try:
+        index = LibraryIndex.open(out_dir)
+        for path in written:
+            index.add(path, **fields.get(path.name, {}))
+        if written and config.get("analytics_enabled", True):
+            try:
+                from analytics import update_analytics
+                with run_stats.span("analytics"):
+                    update_analytics(index, [p.name for p in written], logger=logger)
+            except Exception as e:
+                logger.warning(f"Could not analyse new images: {e}")
+        policy = RetentionPolicy.from_config(config)
+        if policy.enabled:
+            protected = protected_names(config, latest_path, get_current_wallpaper())
+            with run_stats.span("retention"):
+                removed, freed = apply_retention(index, policy, protected, logger)
+            run_stats.add("files_evicted", len(removed))
+            run_stats.add("bytes_evicted", freed)
+        index.save()
+    except Exception as e:
+        logger.warning(f"Could not update library index: {e}")
+
+def retention_filter(out_dir: Path, config: dict) -> Optional[Callable[[List[dict]], List[dict]]]:
+    """Filter for fetched image lists that drops images the retention policy would evict right after writing"""
+    policy = RetentionPolicy.from_config(config)
+    if not policy.enabled:
+        return None
+
+    def keep(imgs: List[dict]) -> List[dict]:
+        try:
+            index = LibraryIndex.open(out_dir)
+            dates = [date_from_img(img, pos) for pos, img in enumerate(imgs)]
+            unwanted = select_unwanted(index, policy, dates, protected_names(config, get_current_wallpaper()))
+        except Exception as e:
+            logger.warning(f"Could not apply retention policy before downloading: {e}")
+            return imgs
+        if unwanted:
+            logger.info(f"Not downloading {len(unwanted)} image(s) the retention policy would remove again")
+            run_stats.add("images_retention_skipped", len(unwanted))
+        return [img for pos, img in enumerate(imgs) if pos not in unwanted]
+    return keep
+
+def network_lost() -> bool:
+    """After a failure: True if the server is no longer reachable, so further requests would only time out"""
+    if connectivity is None or connectivity.reachable():
+        return False
+    logger.warning("Server no longer reachable, skipping the remaining requests")
+    run_stats.add("network_lost")
+    return True
+
+def download_images(imgs: List[dict], preferred_res: List[str], display: Optional[Tuple[int, int]] = None,
+                    journal: Optional[RunJournal] = None,
+                    deadline: Optional[Deadline] = None) -> List[Tuple[bytes, str, dict]]:
+    """Download the best candidate for each image, skipping images that fail"""
+    results = []
+    for pos, img in enumerate(imgs):
+        priority = (journal.order(img, pos) if journal else pos) == 0
+        if deadline is not None and (deadline.expired or (deadline.low and not priority)):
+            # Older images give way to today's image and to writing what we have
+            logger.warning(f"Run deadline: dropping image {date_from_img(img, pos)}")
+            run_stats.add("images_dropped")
+            continue
+        try:
+            if journal:
+                journal.mark(img, DOWNLOADING)
+            bucket = None
+            if bandwidth is not None:
+                # Today's image goes first at priority rate; the rest may wait for an idle link
+                if not priority:
+                    idle_budget = deadline.remaining() - deadline.reserve if deadline else None
+                    waited = bandwidth.before_bulk(logger, max_wait=idle_budget)
+                    if waited:
+                        run_stats.record("idle_wait", waited)
+                bucket = bandwidth.bucket(priority)
+            urls = build_candidate_urls(img, preferred_res, display)
+            options = {name: value for name, value in (("bucket", bucket), ("deadline", deadline))
+                       if value is not None}
+            download = partial(download_first, **options) if options else download_first
+            if shared_cache is not None:
+                data, ct = shared_cache.fetch(urls, download, guess_ext_from_ct,
+                                              max_wait=deadline.remaining() if deadline else None)
+            else:
+                data, ct = download(urls)
+            results.append((data, ct, img))
+        except DeadlineExceeded as e:
+            logger.warning(f"Run deadline: dropping image {date_from_img(img, pos)} ({e})")
+            run_stats.add("images_dropped")
+        except Exception as e:
+            logger.warning(f"Failed to download image: {e}")
+            if network_lost():
+                break
+            continue
+    return results
+
+def journal_progress(journal: RunJournal) -> Tuple[List[Tuple[int, Path, bool]], List[dict]]:
+    """(saved images as (order, path, skipped), images still to download) of a journal"""
+    done, pending = [], []
+    for img in journal.images():
+        path = journal.verify(img)
+        if path:
+            done.append((journal.order(img, 0), path, journal.entry(img).get("skipped", False)))
+        else:
+            pending.append(img)
+    return done, pending
+
+def probe_market(mkt: str, timeout: float) -> Tuple[bool, float, str]:
+    """One-image metadata request for a half-open market, uncached; runs on a worker thread"""
+    url = f"{BING_BASE}/HPImageArchive.aspx?format=js&idx=0&n=1&mkt={urllib.parse.quote(mkt)}"
+    start = time.monotonic()
+    try:
+        r = requests.get(url, headers=HEADERS, timeout=timeout)
+        r.raise_for_status()
+        ok = bool(r.json().get("images"))
+        return ok, time.monotonic() - start, "" if ok else "no images"
+    except Exception as e:
+        return False, time.monotonic() - start, str(e)
+
+def record_probe(mkt: str, future) -> bool:
+    ok, seconds, error = future.result()
+    health.record("market", mkt, ok, seconds, error)
+    logger.info(f"Probe of market {mkt}: {'ok' if ok else error} ({seconds:.1f}s)")
+    return ok
+
+def market_attempts(ordered: List[str], probes: dict):
+    """Markets to try: the planned ones, then half-open markets whose probe succeeded"""
+    yield from ordered
+    for mkt in list(probes):
+        if record_probe(mkt, probes.pop(mkt)):
+            yield mkt
+
+def fetch_all_images(markets: List[str], count: int, preferred_res: List[str],
+                     display: Optional[Tuple[int, int]] = None,
+                     journal: Optional[RunJournal] = None,
+                     deadline: Optional[Deadline] = None,
+                     keep: Optional[Callable[[List[dict]], List[dict]]] = None) -> List[Tuple[bytes, str, dict]]:
+    """
+    Fetch all images at once from the first available market, skipping markets whose breaker is open.
+
+    `keep` may narrow the fetched image list before anything is downloaded.
+    """
+    ordered, probing = health.plan(markets) if health is not None else (list(markets), [])
+    skipped = [m for m in markets if m not in ordered and m not in probing]
+    if skipped:
+        logger.info(f"Skipping markets with open circuit breaker: {skipped}")
+        run_stats.extra["markets_skipped"] = skipped
+    probes = {}
+    pool = None
+    if probing and not (deadline is not None and deadline.expired):
+        # Half-open markets are probed next to the normal attempts, not in front of them
+        pool = ThreadPoolExecutor(max_workers=len(probing), thread_name_prefix="market-probe")
+        timeout = request_timeout(deadline, PROBE_TIMEOUT)
+        probes = {mkt: pool.submit(probe_market, mkt, timeout) for mkt in probing}
+    try:
+        return fetch_markets(market_attempts(ordered, probes), markets[0] if markets else None, count,
+                             preferred_res, display, journal, deadline, keep)
+    finally:
+        # Probes not needed for this run still count if they have finished
+        for mkt, future in probes.items():
+            if future.done():
+                record_probe(mkt, future)
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+def fetch_markets(markets, primary: Optional[str], count: int, preferred_res: List[str],
+                  display: Optional[Tuple[int, int]], journal: Optional[RunJournal],
+                  deadline: Optional[Deadline],
+                  keep: Optional[Callable[[List[dict]], List[dict]]] = None) -> List[Tuple[bytes, str, dict]]:
+    """Try `markets` in order until one yields images; records each metadata outcome"""
     last = None
-    for mkt in markets:
+    for mkt_idx, mkt in enumerate(markets):
+        if mkt_idx > 0 and (deadline is not None and deadline.expired or network_lost()):
+            break
         try:
-            imgs = fetch_images_json(mkt, 0, count)
+            start = time.monotonic()
+            imgs = fetch_images_json(mkt, 0, count, deadline)
+            if health is not None:
+                health.record("market", mkt, bool(imgs), time.monotonic() - start, "" if imgs else "no images")
             if not imgs:
                 continue
+            if keep is not None:
+                imgs = keep(imgs)
+            pending = imgs
+            if journal:
+                journal.begin(mkt, imgs)
+                # Images saved by an earlier day's interrupted run are not downloaded again
+                pending = journal_progress(journal)[1]
             
-            results = []
-            for img in imgs:
-                try:
-                    urls = build_candidate_urls(img, preferred_res)
-                    data, ct = download_first(urls)
-                    results.append((data, ct, img))
-                except Exception as e:
-                    logger.warning(f"Failed to download image: {e}")
-                    continue
+            results = download_images(pending, preferred_res, display, journal, deadline)
             
-            if results:
+            if results or len(pending) < len(imgs):
+                if mkt != primary:
+                    run_stats.add("market_fallbacks")
+                run_stats.extra["market"] = mkt
                 return results
+        except DeadlineExceeded as e:
+            last = e
+            logger.warning(f"Stopped at market {mkt}: {e}")
+            break
         except Exception as e:
             last = e
             logger.warning(f"Failed to fetch from market {mkt}: {e}")
@@ -245,85 +573,234 @@ def fetch_all_images(markets: List[str], count: int, preferred_res: List[str]) -
         logger.error(f"All markets failed: {last}")
     return []
 
-def main():
-    logger.info("=== Bing Wallpaper Downloader Starting ===")
-    import argparse
-    
-    # Load config file first
-    config = load_config()
-    logger.info(f"Config loaded from: {CONFIG_FILE}")
-    
-    # Set defaults from config file, can be overridden by CLI args
-    p = argparse.ArgumentParser("Bing week downloader (HPImageArchive) with robust dedupe")
-    p.add_argument("--mkt", default=config.get("market", "de-DE"))
-    p.add_argument("--fallback-mkts", default=config.get("fallback_markets", "en-US"))
-    p.add_argument("--count", type=int, default=config.get("image_count", 8))
-    p.add_argument("--out", default=config.get("download_folder", str(Path.home() / "Pictures" / "BingWallpapers")))
-    p.add_argument("--res", default=config.get("resolution", "UHD,3840x2160,2560x1440,1920x1200,1920x1080"))
-    p.add_argument("--mode", choices=["skip","unique","overwrite"], default=config.get("file_mode", "skip"),
-                   help="skip: existierende Zieldatei nicht neu schreiben; "
-                        "unique: falls gleicher Name existiert, _1, _2 anhängen; "
-                        "overwrite: bestehende Datei gleichen Namens überschreiben.")
-    p.add_argument("--name-mode", choices=["slug","title"], default=config.get("name_mode", "slug"),
-                   help="Dateiname aus OHR-Slug (robust) oder aus Titel.")
-    p.add_argument("--set-latest", action="store_true", default=config.get("set_latest", False))
-    args = p.parse_args()
+def open_http_cache(config: dict) -> Optional[HttpCache]:
+    """The shared HTTP cache next to the config file, unless disabled"""
+    if not config.get("http_cache_enabled", True):
+        return None
+    max_mb = config.get("http_cache_max_mb", 5)
+    return HttpCache(CONFIG_FILE.parent / CACHE_DIR_NAME, int(max_mb * 1024 * 1024))
+
+def open_connectivity(config: dict) -> Optional[ConnectivityProvider]:
+    """Probe for BING_BASE (or the proxy in front of it), unless "connectivity_check" is off"""
+    if not config.get("connectivity_check", True):
+        return None
+    return SocketProvider(BING_BASE)
 
+def await_network(config: dict, deadline: Optional[Deadline] = None) -> bool:
+    """Defer the run until the server is reachable; False if it stays unreachable"""
+    if connectivity is None:
+        return True
+    max_wait = config.get("connectivity_max_wait_seconds", DEFAULT_MAX_WAIT)
+    if deadline is not None:
+        max_wait = min(max_wait, deadline.remaining())
+    start = time.monotonic()
+    with run_stats.span("connectivity"):
+        online = wait_for_network(connectivity, max_wait)
+    waited = time.monotonic() - start
+    if not online:
+        logger.warning(f"Server not reachable after {waited:.0f}s, skipping this run")
+        run_stats.extra["network"] = "offline"
+        return False
+    if waited >= INITIAL_BACKOFF:
+        logger.info(f"Server reachable after {waited:.0f}s")
+        run_stats.extra["network_wait_seconds"] = round(waited, 1)
+    return True
+
+def open_health(config: dict) -> Optional[HealthStore]:
+    """Breaker state from the previous runs, unless "circuit_breaker_enabled" is off"""
+    if not config.get("circuit_breaker_enabled", True):
+        return None
+    store = HealthStore(CONFIG_FILE.parent / HEALTH_FILE_NAME)
+    store.load()
+    return store
+
+def open_shared_cache(config: dict) -> Optional[SharedCache]:
+    """The fleet-wide image pool from "shared_cache_folder", if configured"""
+    folder = config.get("shared_cache_folder", "")
+    if not folder:
+        return None
+    logger.info(f"Shared cache: {folder}")
+    return SharedCache(Path(folder), logger)
+
+def serve_mirror(config: dict, port: int) -> int:
+    """Run the caching mirror (see mirror.py) until interrupted"""
+    from mirror import MirrorStore, create_server
+    folder = Path(config.get("mirror_cache_folder") or CONFIG_FILE.parent / MIRROR_DIR_NAME)
+    store = MirrorStore(folder, config.get("mirror_upstream", "https://www.bing.com"), HEADERS,
+                        METADATA_TTL, NEGATIVE_TTL, logger)
+    server = create_server(store, config.get("mirror_bind", "0.0.0.0"), port)
+    logger.info(f"Mirror listening on port {port}, cache: {folder}")
+    print(f"Mirror läuft auf Port {port} (Strg+C zum Beenden)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Mirror stopped: {store.stats}")
+    return 0
+
+def write_run_summary(success: bool, export_metrics: bool = True):
+    """Write the structured run summary and cumulative metrics next to the config file"""
+    try:
+        summary = run_stats.write_summary(CONFIG_FILE.parent / RUN_SUMMARY_NAME)
+        logger.info(f"Run summary: {json.dumps(summary, separators=(',', ':'))}")
+    except Exception as e:
+        logger.warning(f"Could not write run summary: {e}")
+        return
+    if not export_metrics:
+        return
+    try:
+        metrics_dir = CONFIG_FILE.parent / METRICS_DIR_NAME
+        update_locked(downloader_registry(), metrics_dir, "downloader",
+                      lambda registry: record_run(registry, summary, success))
+    except Exception as e:
+        logger.warning(f"Could not write metrics: {e}")
+
+def choose_resolutions(args, config: dict) -> Tuple[List[str], Optional[Tuple[int, int]]]:
+    """(preferred resolutions, largest display) for --res, detecting the display for 'auto'"""
+    if args.res.strip().lower() != AUTO:
+        return [x.strip() for x in args.res.split(",") if x.strip()], None
+    display = detect_display(config, logger)
+    if display:
+        run_stats.extra["display"] = f"{display[0]}x{display[1]}"
+    logger.info(f"Largest display: {display}")
+    return auto_resolutions(display), display
+
+def next_unique_path(base: Path) -> Path:
+    """base, or base with the first free _1, _2, ... suffix (unique mode)"""
+    if not base.exists():
+        return base
+    i = 1
+    while True:
+        cand = base.with_stem(f"{base.stem}_{i}")
+        if not cand.exists():
+            return cand
+        i += 1
+
+def load_images(args, config: dict, journal: RunJournal, markets: List[str], preferred_res: List[str],
+                display: Optional[Tuple[int, int]], out_dir: Path, deadline: Optional[Deadline] = None):
+    """(downloaded images, images saved before an interruption) for this run.
+
+    Resumes an interrupted run from today if there is one, otherwise fetches all images at once.
+    """
+    if journal.load():
+        logger.info(f"Resuming interrupted run: {journal.counts()}")
+        run_stats.extra["resumed"] = journal.counts()
+        done, pending = journal_progress(journal)
+        return download_images(pending, preferred_res, display, journal, deadline), done
+    logger.info(f"Fetching {args.count} images from markets: {markets}")
+    all_images = fetch_all_images(markets, min(8, max(1, args.count)), preferred_res, display, journal,
+                                  deadline, retention_filter(out_dir, config))
+    # Images an interrupted run from an earlier day already saved
+    return all_images, journal_progress(journal)[0]
+
+def skip_image(journal: RunJournal, img: dict, data: bytes, path: Path) -> Path:
+    """Record an image that is not written because `path` already holds it"""
+    run_stats.add("files_skipped")
+    run_stats.add("bytes_skipped", len(data))
+    journal.mark(img, VERIFIED, filename=path.name, size=path.stat().st_size, skipped=True)
+    return path
+
+def write_image(args, journal: RunJournal, img: dict, data: bytes, target: Path) -> Tuple[Path, str]:
+    """Write downloaded image data to target (or its unique-mode name); returns (path written, sha256)"""
+    fname = target.name
+    # A name chosen before an interruption is ours: reuse it instead of adding _1
+    planned = (journal.entry(img) or {}).get("filename")
+    if args.mode == "unique":
+        target = target.parent / planned if planned else next_unique_path(target)
+    journal.mark(img, DOWNLOADING, filename=target.name)
+    with run_stats.span("write"):
+        # Temp file + rename: a crash never leaves a partial file under the final name
+        atomic_write_bytes(target, data)
+    digest = sha256_bytes(data)
+    journal.mark(img, WRITTEN, size=len(data), sha256=digest)
+    journal.verify(img)
+    if args.mode == "overwrite":
+        logger.info(f"Overwrote: {fname}")
+    else:  # unique
+        logger.info(f"Saved: {target.name}")
+    run_stats.add("files_written")
+    return target, digest
+
+def save_image(args, config: dict, journal: RunJournal, finder, img: dict, data: bytes, ct: str, idx: int,
+               out_dir: Path, index_fields: Dict[str, dict]) -> Tuple[Path, bool]:
+    """Save one downloaded image; returns (file holding it, whether it was written)"""
+    fname = build_filename(img, ct, name_mode=args.name_mode, img_idx=idx)
+    target = out_dir / fname
+
+    existing = existing_variant(target) if args.mode == "skip" else None
+    if existing:
+        # kein Speichern, kein _1 (auch nicht, wenn archive.py die Datei umkodiert hat)
+        logger.info(f"Skipping existing file: {existing.name}")
+        return skip_image(journal, img, data, existing), False
+
+    fields, duplicate = check_duplicate(finder, data, out_dir, fname) if finder else ({}, None)
+    if duplicate:
+        if config.get("dedupe_mode", "off") == "skip":
+            logger.info(f"Skipping {fname}: near-duplicate of {duplicate.name}")
+            return skip_image(journal, img, data, duplicate), False
+        logger.info(f"{fname} is a near-duplicate of {duplicate.name}")
+
+    target, digest = write_image(args, journal, img, data, target)
+    if fields and not duplicate:
+        finder.add(fields[finder.kind], target.name)
+    # Lets ingest.py --verify check downloaded files without re-reading them first
+    index_fields[target.name] = {**fields, "sha256": digest}
+    return target, True
+
+def run(args, config: dict, deadline: Optional[Deadline] = None) -> int:
+    """Download, save and optionally set wallpapers for parsed CLI args"""
     out_dir = Path(args.out); out_dir.mkdir(parents=True, exist_ok=True)
     logger.info(f"Download directory: {out_dir}")
-    preferred_res = [x.strip() for x in args.res.split(",") if x.strip()]
+    preferred_res, display = choose_resolutions(args, config)
     markets = [args.mkt.strip()] + [m.strip() for m in args.fallback_mkts.split(",") if m.strip()]
     logger.info(f"Markets: {markets}, Resolutions: {preferred_res}")
 
     user_paused = config.get("user_paused", False)
 
     saved: List[Path] = []
+    written: List[Path] = []
     latest_path: Optional[Path] = None
+    index_fields: Dict[str, dict] = {}
+    finder = open_duplicate_finder(out_dir, config)
 
-    # Für unique-Mode Suffixzählung
-    def next_unique_path(base: Path) -> Path:
-        if not base.exists():
-            return base
-        i = 1
-        while True:
-            cand = base.with_stem(f"{base.stem}_{i}")
-            if not cand.exists():
-                return cand
-            i += 1
-
-    # Fetch all images at once
-    logger.info(f"Fetching {args.count} images from markets: {markets}")
-    all_images = fetch_all_images(markets, min(8, max(1, args.count)), preferred_res)
+    journal = RunJournal(CONFIG_FILE.parent / JOURNAL_NAME, out_dir, args.mode, logger)
+    all_images, done = load_images(args, config, journal, markets, preferred_res, display, out_dir, deadline)
     
-    if not all_images:
+    latest_order = None
+    for order, path, skipped in done:
+        logger.info(f"Already saved before interruption: {path.name}")
+        saved.append(path)
+        if not skipped:
+            written.append(path)
+        if latest_order is None or order < latest_order:
+            latest_order, latest_path = order, path
+    
+    if not all_images and not done:
+        journal.finish()
         logger.warning("Failed to fetch any images")
         print("Keine Bilder konnten heruntergeladen werden.", file=sys.stderr)
         return 1
 
     logger.info(f"Successfully fetched {len(all_images)} images")
 
-    for idx, (data, ct, img) in enumerate(all_images):
-        fname = build_filename(img, ct, name_mode=args.name_mode, img_idx=idx)
-        target = out_dir / fname
-
-        if args.mode == "skip" and target.exists():
-            # kein Speichern, kein _1
-            logger.info(f"Skipping existing file: {fname}")
-            saved.append(target)
-            if idx == 0:
-                latest_path = target
+    for pos, (data, ct, img) in enumerate(all_images):
+        idx = journal.order(img, pos)
+        if idx != 0 and deadline is not None and deadline.remaining() <= 0:
+            # Keep the promise of the deadline; the next run fetches these again
+            logger.warning(f"Run deadline: not writing image {date_from_img(img, idx)}")
+            run_stats.add("images_dropped")
             continue
-        elif args.mode == "overwrite":
-            target.write_bytes(data)
-            logger.info(f"Overwrote: {fname}")
-        else:  # unique
-            target = next_unique_path(target)
-            target.write_bytes(data)
-            logger.info(f"Saved: {target.name}")
-
-        saved.append(target)
-        if idx == 0:
-            latest_path = target
+        path, was_written = save_image(args, config, journal, finder, img, data, ct, idx, out_dir, index_fields)
+        saved.append(path)
+        if was_written:
+            written.append(path)
+        if latest_order is None or idx < latest_order:
+            latest_order, latest_path = idx, path
+
+    update_library(out_dir, config, written, latest_path, index_fields)
+    journal.finish()
 
     if not saved:
         logger.info("No new images downloaded (all already exist)")
@@ -348,6 +825,91 @@ def main():
     logger.info("=== Bing Wallpaper Downloader Completed Successfully ===")
     return 0
 
+def main():
+    logger.info("=== Bing Wallpaper Downloader Starting ===")
+    import argparse
+    
+    # Load config file first
+    config = apply_resolution_policy(load_config())
+    logger.info(f"Config loaded from: {CONFIG_FILE}")
+    
+    # Set defaults from config file, can be overridden by CLI args
+    p = argparse.ArgumentParser("Bing week downloader (HPImageArchive) with robust dedupe")
+    p.add_argument("--mkt", default=config.get("market", "de-DE"))
+    p.add_argument("--fallback-mkts", default=config.get("fallback_markets", "en-US"))
+    p.add_argument("--count", type=int, default=config.get("image_count", 8))
+    p.add_argument("--out", default=config.get("download_folder", str(Path.home() / "Pictures" / "BingWallpapers")))
+    p.add_argument("--res", default=config.get("resolution", "UHD,3840x2160,2560x1440,1920x1200,1920x1080"),
+                   help="Kommagetrennte Auflösungen oder 'auto' (kleinste, die den größten Bildschirm abdeckt).")
+    p.add_argument("--mode", choices=["skip","unique","overwrite"], default=config.get("file_mode", "skip"),
+                   help="skip: existierende Zieldatei nicht neu schreiben; "
+                        "unique: falls gleicher Name existiert, _1, _2 anhängen; "
+                        "overwrite: bestehende Datei gleichen Namens überschreiben.")
+    p.add_argument("--name-mode", choices=["slug","title"], default=config.get("name_mode", "slug"),
+                   help="Dateiname aus OHR-Slug (robust) oder aus Titel.")
+    p.add_argument("--set-latest", action="store_true", default=config.get("set_latest", False))
+    p.add_argument("--profile", action="store_true",
+                   help="cProfile- und tracemalloc-Daten für diesen Lauf im Log-Ordner speichern.")
+    p.add_argument("--deadline", type=float, default=config.get("run_deadline_seconds", 0),
+                   help="Zeitbudget des Laufs in Sekunden (0 = keins); ältere Bilder werden zuerst weggelassen.")
+    p.add_argument("--mirror", action="store_true",
+                   help="Als Cache-Mirror für andere Rechner laufen (bing_base auf diesen Rechner setzen).")
+    p.add_argument("--mirror-port", type=int, default=config.get("mirror_port", 8080))
+    args = p.parse_args()
+
+    if args.mirror:
+        return serve_mirror(config, args.mirror_port)
+
+    global BING_BASE, http_cache, shared_cache, bandwidth, connectivity, health
+    health = open_health(config)
+    if config.get("bing_base"):
+        # Desktops in a fleet point this at a mirror; while it keeps failing they go to Bing directly
+        base = config["bing_base"].rstrip("/")
+        if health is not None and not health.allow("host", urllib.parse.urlsplit(base).netloc):
+            logger.warning(f"Circuit breaker open for {base}, using {BING_BASE} for this run")
+        else:
+            BING_BASE = base
+            logger.info(f"Using Bing base URL: {BING_BASE}")
+    http_cache = open_http_cache(config)
+    shared_cache = open_shared_cache(config)
+    bandwidth = BandwidthPolicy.from_config(config)
+    connectivity = open_connectivity(config)
+    run_stats.reset()
+    deadline = Deadline(args.deadline) if args.deadline > 0 else None
+    profiler = None
+    if args.profile:
+        profiler = RunProfiler(LOG_DIR)
+        profiler.start()
+    rc = 1
+    try:
+        if not await_network(config, deadline):
+            print("Keine Netzwerkverbindung - Lauf übersprungen.", file=sys.stderr)
+            return rc
+        rc = run(args, config, deadline)
+        return rc
+    finally:
+        if deadline is not None:
+            run_stats.extra["deadline"] = {"seconds": deadline.seconds, "left": round(deadline.remaining(), 1)}
+        if profiler:
+            run_stats.extra["profile"] = profiler.stop()
+        if health is not None:
+            run_stats.extra["health"] = health.summary()
+            try:
+                health.save()
+            except OSError as e:
+                logger.warning(f"Could not save circuit breaker state: {e}")
+        if http_cache is not None:
+            for name, value in http_cache.stats.items():
+                run_stats.add(f"http_cache_{name}", value)
+        if shared_cache is not None:
+            try:
+                shared_cache.prune(config.get("shared_cache_max_age_days", DEFAULT_MAX_AGE_DAYS))
+            except OSError as e:
+                logger.warning(f"Could not prune shared cache: {e}")
+            for name, value in shared_cache.stats.items():
+                run_stats.add(f"shared_cache_{name}", value)
+        write_run_summary(rc == 0, export_metrics=config.get("metrics_enabled", True))
+
 if __name__ == "__main__":
     try:
         sys.exit(main())
@@ -4,14 +4,17 @@ Bing Wallpaper Downloader - System Tray Manager
 Manages wallpaper auto-download, enables/disables scheduled task, and allows navigation through downloaded wallpapers.
 """
 
+import argparse
 import ctypes
 import json
 import os
 import subprocess
 import sys
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 try:
     import pystray
@@ -23,11 +26,50 @@ except ImportError:
     sys.exit(1)
 
 # Import logging
-from logger import setup_logger
+from browse import BROWSE_MONTHS, MAX_PER_DAY, DateIndex, month_name, wallpaper_label
+from diagnostics import DEFAULT_PROFILE_SECONDS, Diagnostics
+from fileutil import atomic_write_text
+from library_index import LibraryIndex
+from logger import LOG_DIR, setup_logger
+from metrics import tray_registry
+from slideshow import INTERVALS_MINUTES, Slideshow, SlideshowSettings, default_power_provider, select_playlist
+from tray_control import ControlError, ControlServer, create_key, default_address, read_key, send_command
+from tray_state import REDRAW_DELAY, Coalescer, TrayState, state_property
 
 # Configuration storage
 CONFIG_FILE = Path(os.getenv('APPDATA', '')) / 'BingWallpaperDownloader' / 'config.json'
 TASK_NAME = "BingWallpaperDownloader"
+METRICS_DIR_NAME = 'metrics'
+
+# Menu entries and the state keys their text/enabled/visible flags depend on
+MENU_DEPENDENCIES = {
+    'status': {'auto_enabled', 'user_paused'},
+    'info': {'wallpapers', 'current_index'},
+    'can_previous': {'wallpapers', 'current_index'},
+    'can_next': {'current_index'},
+    'favorite': {'wallpapers', 'current_index', 'favorites'},
+    'has_wallpapers': {'wallpapers'},
+    'auto_toggle': {'auto_enabled'},
+    'paused': {'user_paused'},
+    'filter_mode': {'filter_mode'},
+    'slideshow': {'slideshow'},
+    'browse': {'wallpapers'},
+}
+
+# Menu handlers timed in diagnostics mode
+TIMED_ACTIONS = (
+    'on_previous', 'on_next', 'on_jump_to_latest', 'on_toggle_favorite', 'on_browse',
+    'on_set_filter', 'on_set_slideshow', 'on_toggle_auto', 'on_resume', 'on_download_now',
+    'on_open_folder', 'on_refresh',
+)
+
+SLIDESHOW_LABELS = (
+    ('Off', 'off'),
+    ('All Wallpapers', 'all'),
+    ('Recent Days', 'recent'),
+    ('Favourites', 'favorites'),
+    ('Date Range', 'dates'),
+)
 
 # Initialize logger
 logger = setup_logger('tray')
@@ -72,13 +114,35 @@ def check_single_instance() -> bool:
 
 
 class WallpaperManager:
+    # Shared with the menu and background threads; see tray_state
+    wallpapers = state_property('wallpapers')
+    current_wallpaper_index = state_property('current_index')
+    auto_enabled = state_property('auto_enabled')
+    user_paused = state_property('user_paused')
+    favorites = state_property('favorites')
+    filter_mode = state_property('filter_mode')
+    slideshow = state_property('slideshow')
+    
     def __init__(self):
+        self.state = TrayState(wallpapers=[], current_index=0, auto_enabled=False,
+                               user_paused=False, favorites=frozenset(), filter_mode='all',
+                               slideshow=SlideshowSettings())
+        # Serialises directory scans so a slow scan cannot overwrite a newer one
+        self._refresh_lock = threading.Lock()
+        self._config_lock = threading.Lock()
         self.config = self.load_config()
         self.wallpaper_dir = Path(self.config.get('download_folder', str(Path.home() / "Pictures" / "BingWallpapers")))
-        self.current_wallpaper_index = 0
-        self.wallpapers: List[Path] = []
         self.auto_enabled = self.is_task_enabled()
         self.user_paused = self.config.get('user_paused', False)
+        self.favorites = frozenset(self.config.get('favorites', []))
+        self.filter_mode = self.config.get('wallpaper_filter', 'all')
+        self.slideshow = SlideshowSettings.from_config(self.config)
+        self.accent_color = self.get_accent_color() if self.filter_mode == 'accent' else None
+        self.pending_analysis = 0
+        self.metrics_enabled = self.config.get('metrics_enabled', True)
+        self.metrics = tray_registry()
+        if self.metrics_enabled:
+            self.metrics.load(CONFIG_FILE.parent / METRICS_DIR_NAME / 'tray.json')
         self.refresh_wallpaper_list()
         
     def load_config(self) -> dict:
@@ -106,6 +170,7 @@ class WallpaperManager:
                 logger.info("Config file still not found after waiting - creating default config")
                 default_config = {
                     "download_folder": str(Path.home() / "Pictures" / "BingWallpapers"),
+                    "shared_cache_folder": "",
                     "market": "de-DE",
                     "fallback_markets": "en-US",
                     "resolution": "UHD,3840x2160,2560x1440,1920x1200,1920x1080",
@@ -138,34 +203,60 @@ class WallpaperManager:
         """Save configuration to file"""
         CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
         
-        # Load existing config
-        config = self.load_config()
-        
-        # Update with tray-specific settings
-        config['user_paused'] = self.user_paused
-        config['last_manual_selection'] = datetime.now().isoformat()
-        
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
+        # Menu actions and background threads may save at the same time
+        with self._config_lock:
+            # Load existing config
+            config = self.load_config()
+            
+            # Update with tray-specific settings
+            state = self.state.snapshot()
+            config['user_paused'] = state['user_paused']
+            config['favorites'] = sorted(state['favorites'])
+            config['wallpaper_filter'] = state['filter_mode']
+            config.update(state['slideshow'].to_config())
+            config['last_manual_selection'] = datetime.now().isoformat()
+            
+            # Replaced atomically, so the downloader never reads a half-written file
+            atomic_write_text(CONFIG_FILE, json.dumps(config, indent=2), durable=False)
     
     def refresh_wallpaper_list(self):
         """Scan wallpaper directory and build sorted list"""
-        if not self.wallpaper_dir.exists():
-            self.wallpapers = []
-            return
-        
-        # Find all image files
-        images = []
-        for ext in ['*.jpg', '*.jpeg', '*.png', '*.webp', '*.bmp']:
-            images.extend(self.wallpaper_dir.glob(ext))
-        
-        # Sort by modification time (newest first)
-        self.wallpapers = sorted(images, key=lambda p: p.stat().st_mtime, reverse=True)
-        
-        # Find current wallpaper
-        current = self.get_current_wallpaper()
-        if current and current in self.wallpapers:
-            self.current_wallpaper_index = self.wallpapers.index(current)
+        with self._refresh_lock:
+            if not self.wallpaper_dir.exists():
+                self.state.set(wallpapers=[], current_index=0)
+                return
+            
+            # Find all image files
+            images = []
+            for ext in ['*.jpg', '*.jpeg', '*.png', '*.webp', '*.bmp']:
+                images.extend(self.wallpaper_dir.glob(ext))
+            
+            # Sort by modification time (newest first)
+            images = sorted(images, key=lambda p: p.stat().st_mtime, reverse=True)
+            
+            # Filter by the analytics stored in the library index - no image decoding here
+            filter_mode = self.filter_mode
+            pending = 0
+            if filter_mode != 'all':
+                # analytics needs numpy; loaded only once a filter is in use
+                from analytics import has_analytics, matches_filter
+                index = LibraryIndex.open(self.wallpaper_dir)
+                pending = sum(1 for p in images if not has_analytics(index.get(p.name)))
+                images = [p for p in images if matches_filter(index.get(p.name), filter_mode, self.accent_color)]
+            self.pending_analysis = pending
+            current = self.get_current_wallpaper()
+            
+            # The scan ran without the state lock; swap the list in atomically
+            with self.state.batch():
+                shown = self._wallpaper_or_none(self.wallpapers, self.current_wallpaper_index)
+                if current and current in images:
+                    index = images.index(current)
+                elif shown is not None and shown in images:
+                    # Keep the selection when a download adds files in front of it
+                    index = images.index(shown)
+                else:
+                    index = self.current_wallpaper_index if self.current_wallpaper_index < len(images) else 0
+                self.state.set(wallpapers=images, current_index=index)
     
     def get_current_wallpaper(self) -> Optional[Path]:
         """Get the currently set Windows wallpaper"""
@@ -182,89 +273,202 @@ class WallpaperManager:
         SPI_SETDESKWALLPAPER = 20
         SPIF_UPDATEINIFILE = 0x01
         SPIF_SENDWININICHANGE = 0x02
+        start = time.perf_counter()
         try:
             result = ctypes.windll.user32.SystemParametersInfoW(
                 SPI_SETDESKWALLPAPER, 0, str(path.resolve()), 
                 SPIF_UPDATEINIFILE | SPIF_SENDWININICHANGE
             )
             if result != 0:
+                self.metrics.observe('tray_wallpaper_set_seconds', time.perf_counter() - start)
                 logger.info(f"Wallpaper changed to: {path.name}")
                 return True
             else:
+                self.metrics.inc('tray_wallpaper_set_failures')
                 logger.error(f"Failed to set wallpaper: {path}")
                 return False
         except Exception as e:
+            self.metrics.inc('tray_wallpaper_set_failures')
             logger.error(f"Error setting wallpaper: {e}", exc_info=True)
             return False
     
+    def record_action(self, action: str):
+        """Count a tray action and periodically export metrics"""
+        self.metrics.inc('tray_actions', action=action)
+        self.flush_metrics(force=False)
+    
+    def flush_metrics(self, force: bool = True):
+        """Write tray metrics to the metrics folder (throttled unless forced)"""
+        if not self.metrics_enabled:
+            return
+        metrics_dir = CONFIG_FILE.parent / METRICS_DIR_NAME
+        try:
+            if force:
+                self.metrics.write(metrics_dir, 'tray')
+            else:
+                self.metrics.flush_if_due(metrics_dir, 'tray')
+        except Exception as e:
+            logger.warning(f"Could not write metrics: {e}")
+    
+    @staticmethod
+    def _wallpaper_or_none(wallpapers: List[Path], index: int) -> Optional[Path]:
+        return wallpapers[index] if 0 <= index < len(wallpapers) else None
+    
+    def _show(self, choose: Callable[[int, int], Optional[int]]) -> Optional[bool]:
+        """
+        Select the wallpaper at choose(index, count) and set it, atomically with
+        respect to other threads. Returns None if there is nothing to select or the
+        file is gone (e.g. removed by retention; the list is rescanned), otherwise
+        the result of set_wallpaper().
+        """
+        with self.state.batch():
+            wallpapers = self.wallpapers
+            target = choose(self.current_wallpaper_index, len(wallpapers)) if wallpapers else None
+            if target is None:
+                return None
+            wallpaper = wallpapers[target]
+            if wallpaper.exists():
+                self.current_wallpaper_index = target
+                return self.set_wallpaper(wallpaper)
+        # Rescan outside the state lock; a scan can take a while on large libraries
+        logger.info(f"Wallpaper no longer exists, refreshing list: {wallpaper.name}")
+        self.refresh_wallpaper_list()
+        return None
+    
+    def get_accent_color(self) -> Optional[tuple]:
+        """Read the Windows accent colour as (r, g, b)"""
+        try:
+            import winreg
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Software\Microsoft\Windows\DWM") as key:
+                value, _ = winreg.QueryValueEx(key, "AccentColor")
+            # Stored as 0xAABBGGRR
+            return (value & 0xFF, (value >> 8) & 0xFF, (value >> 16) & 0xFF)
+        except Exception as e:
+            logger.warning(f"Could not read accent colour: {e}")
+            return None
+    
+    def set_filter(self, mode: str) -> bool:
+        """Show only dark/light/accent-matching wallpapers (or all)"""
+        from analytics import FILTER_MODES
+        if mode not in FILTER_MODES:
+            return False
+        self.accent_color = self.get_accent_color() if mode == 'accent' else None
+        self.filter_mode = mode
+        self.save_config()
+        self.refresh_wallpaper_list()
+        logger.info(f"Wallpaper filter: {mode} ({len(self.wallpapers)} wallpapers)")
+        return True
+    
+    def set_slideshow(self, **changes) -> SlideshowSettings:
+        """Change slideshow mode/interval (see slideshow.SlideshowSettings) and save them"""
+        with self.state.batch():
+            self.slideshow = self.slideshow.with_changes(**changes)
+            settings = self.slideshow
+        self.save_config()
+        logger.info(f"Slideshow: {settings.mode}, every {settings.interval / 60:.0f} min")
+        return settings
+    
+    def slideshow_playlist(self) -> List[Path]:
+        """Wallpapers the slideshow rotates through with the current settings"""
+        state = self.state.snapshot()
+        return select_playlist(state['wallpapers'], state['slideshow'], state['favorites'])
+    
+    def show_wallpaper(self, path: Path) -> bool:
+        """Select and set a specific wallpaper from the list (does not pause auto-update)"""
+        def choose(index, count):
+            try:
+                return self.wallpapers.index(path)
+            except ValueError:
+                return None
+        return bool(self._show(choose))
+    
+    def browse_to(self, path: Path) -> bool:
+        """Set a wallpaper picked from the Browse menu; anything but the newest pauses auto-update"""
+        if not self.show_wallpaper(path):
+            return False
+        if self.current_wallpaper_index > 0:
+            self.user_paused = True
+            self.save_config()
+        return True
+    
+    def analyze_library(self) -> int:
+        """Compute brightness/colour analytics for wallpapers that have none yet"""
+        from analytics import update_analytics
+        index = LibraryIndex.open(self.wallpaper_dir)
+        done = update_analytics(index, logger=logger)
+        index.save()
+        logger.info(f"Analysed {done} wallpapers")
+        return done
+    
+    def is_favorite(self, path: Optional[Path] = None) -> bool:
+        """Check whether a wallpaper (default: current) is pinned"""
+        if path is None:
+            with self.state.batch():
+                path = self._wallpaper_or_none(self.wallpapers, self.current_wallpaper_index)
+            if path is None:
+                return False
+        return path.name in self.favorites
+    
+    def toggle_favorite(self) -> bool:
+        """Pin or unpin the current wallpaper; pinned files are never evicted"""
+        with self.state.batch():
+            wallpaper = self._wallpaper_or_none(self.wallpapers, self.current_wallpaper_index)
+            if wallpaper is None:
+                return False
+            name = wallpaper.name
+            # Replaced, never mutated, so readers holding the old set stay consistent
+            self.favorites = self.favorites ^ {name}
+            logger.info(f"{'Pinned' if name in self.favorites else 'Unpinned'}: {name}")
+        self.save_config()
+        return True
+    
     def next_wallpaper(self):
         """Switch to next (newer) wallpaper"""
-        if not self.wallpapers:
-            return False
-        
         # Can't go forward if already at newest (index 0)
-        if self.current_wallpaper_index == 0:
-            return False
-        
-        self.current_wallpaper_index = self.current_wallpaper_index - 1
-        wallpaper = self.wallpapers[self.current_wallpaper_index]
-        
-        # If user goes back to the latest, they might want auto-update
-        if self.current_wallpaper_index == 0 and self.user_paused:
-            # User is back at the latest - they can manually resume if they want
-            pass
-        
-        return self.set_wallpaper(wallpaper)
+        result = self._show(lambda index, count: index - 1 if index > 0 else None)
+        return bool(result)
     
     def previous_wallpaper(self):
         """Switch to previous (older) wallpaper"""
-        if not self.wallpapers:
-            return False
-        
         # Can't go back if already at oldest
-        if self.current_wallpaper_index >= len(self.wallpapers) - 1:
+        result = self._show(lambda index, count: index + 1 if index < count - 1 else None)
+        if result is None:
             return False
         
-        self.current_wallpaper_index = self.current_wallpaper_index + 1
-        wallpaper = self.wallpapers[self.current_wallpaper_index]
-        
         # If user selects an older wallpaper, pause auto-update
-        if self.current_wallpaper_index > 0:
-            self.user_paused = True
-            self.save_config()
-        
-        return self.set_wallpaper(wallpaper)
+        self.user_paused = True
+        self.save_config()
+        return result
     
     def jump_to_latest(self):
         """Jump directly to the latest (newest) wallpaper"""
-        if not self.wallpapers:
-            return False
-        
-        # Already at latest
-        if self.current_wallpaper_index == 0:
-            return False
-        
-        self.current_wallpaper_index = 0
-        wallpaper = self.wallpapers[0]
-        
         # If user jumps back to latest, they likely want auto-update to resume
         # But we'll let them manually resume if they want
-        
-        return self.set_wallpaper(wallpaper)
+        return bool(self._show(lambda index, count: 0 if index > 0 else None))
+    
+    def resume_auto_update(self):
+        """Clear the pause from a manual selection and go back to the latest wallpaper"""
+        self.user_paused = False
+        self.save_config()
+        if not self.auto_enabled:
+            self.enable_auto_download()
+        self._show(lambda index, count: 0)
     
     def get_current_wallpaper_info(self) -> str:
         """Get info about current wallpaper"""
-        if not self.wallpapers:
+        state = self.state.snapshot()
+        return self.wallpaper_info(state['wallpapers'], state['current_index'])
+    
+    @staticmethod
+    def wallpaper_info(wallpapers: List[Path], index: int) -> str:
+        """Menu text for the wallpaper at `index`"""
+        if not wallpapers:
             return "No wallpapers found"
         
-        if self.current_wallpaper_index >= len(self.wallpapers):
+        if index >= len(wallpapers):
             return "Unknown wallpaper"
         
-        wallpaper = self.wallpapers[self.current_wallpaper_index]
-        index_display = self.current_wallpaper_index + 1
-        total = len(self.wallpapers)
-        
-        return f"{wallpaper.name}\n({index_display} of {total})"
+        return f"{wallpapers[index].name}\n({index + 1} of {len(wallpapers)})"
     
     def is_task_enabled(self) -> bool:
         """Check if scheduled task is enabled"""
@@ -291,8 +495,7 @@ class WallpaperManager:
                 capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW
             )
             if result.returncode == 0:
-                self.auto_enabled = True
-                self.user_paused = False
+                self.state.set(auto_enabled=True, user_paused=False)
                 self.save_config()
                 logger.info("Auto-download enabled")
                 return True
@@ -343,6 +546,27 @@ class TrayApp:
     def __init__(self):
         self.manager = WallpaperManager()
         self.icon = None
+        self.analyzing = False
+        # Menu texts/flags, recomputed per entry when the state they depend on changes
+        self.view = {}
+        self.refresh_view()
+        self.redraw = Coalescer(self.on_state_changed, REDRAW_DELAY)
+        self.manager.state.subscribe(self.redraw)
+        self.slideshow = Slideshow(
+            self.manager.slideshow_playlist,
+            self.manager.show_wallpaper,
+            self.manager.slideshow,
+            power=default_power_provider(),
+            is_paused=lambda: self.manager.user_paused,
+            logger=logger
+        )
+        self.control = None
+        # Opt-in: without it the handlers stay plain bound methods
+        self.diagnostics = None
+        if self.manager.config.get('diagnostics_enabled', False):
+            self.diagnostics = Diagnostics(self.manager.metrics, LOG_DIR, logger=logger)
+            self.diagnostics.instrument(self, TIMED_ACTIONS)
+            logger.info("Diagnostics enabled: timing menu actions")
         
     def create_icon_image(self) -> Image.Image:
         """Load the app icon for system tray"""
@@ -412,111 +636,316 @@ class TrayApp:
         
         return img
     
-    def get_menu(self):
-        """Build the system tray menu"""
-        status_text = "🟢 Auto-Download: Enabled" if self.manager.auto_enabled else "🔴 Auto-Download: Disabled"
-        if self.manager.user_paused:
-            status_text += " (Paused - user selection)"
+    def refresh_view(self, changed: Optional[frozenset] = None) -> set:
+        """Recompute the menu entries that depend on `changed` (all if None); returns those that differ"""
+        state = self.manager.state.snapshot()
+        wallpapers, index = state['wallpapers'], state['current_index']
+        current = WallpaperManager._wallpaper_or_none(wallpapers, index)
         
-        # Determine if Previous/Next buttons should be enabled
-        can_go_previous = self.manager.current_wallpaper_index < len(self.manager.wallpapers) - 1
-        can_go_next = self.manager.current_wallpaper_index > 0
-        show_jump_to_latest = self.manager.current_wallpaper_index > 0  # Show when not at latest
+        def status():
+            text = "🟢 Auto-Download: Enabled" if state['auto_enabled'] else "🔴 Auto-Download: Disabled"
+            if state['user_paused']:
+                text += " (Paused - user selection)"
+            return text
+        
+        compute = {
+            'status': status,
+            'info': lambda: WallpaperManager.wallpaper_info(wallpapers, index),
+            'can_previous': lambda: index < len(wallpapers) - 1,
+            'can_next': lambda: index > 0,
+            'favorite': lambda: current is not None and current.name in state['favorites'],
+            'has_wallpapers': lambda: bool(wallpapers),
+            'auto_toggle': lambda: state['auto_enabled'],
+            'paused': lambda: state['user_paused'],
+            'filter_mode': lambda: state['filter_mode'],
+            'slideshow': lambda: state['slideshow'],
+            'browse': lambda: DateIndex(wallpapers),
+        }
+        updated = set()
+        for name, keys in MENU_DEPENDENCIES.items():
+            if changed is None or changed & keys:
+                value = compute[name]()
+                if name not in self.view or self.view[name] != value:
+                    self.view[name] = value
+                    updated.add(name)
+        return updated
+    
+    def on_state_changed(self, changed: frozenset):
+        """Coalesced state change: refresh affected entries, redraw once if any differ"""
+        if self.refresh_view(changed) and self.icon:
+            self.manager.metrics.inc('tray_menu_redraws')
+            self.icon.update_menu()
+    
+    def get_menu(self):
+        """Build the system tray menu; entries read their text and flags from self.view"""
+        view = self.view
+        if not view:
+            self.refresh_view()
         
         return pystray.Menu(
-            item(status_text, lambda: None, enabled=False),
-            item(self.manager.get_current_wallpaper_info(), lambda: None, enabled=False),
+            item(lambda _: view['status'], lambda: None, enabled=False),
+            item(lambda _: view['info'], lambda: None, enabled=False),
             pystray.Menu.SEPARATOR,
             
-            item('⬅️ Previous Wallpaper', self.on_previous, enabled=can_go_previous),
-            item('➡️ Next Wallpaper', self.on_next, enabled=can_go_next),
-            item('⏭️ Jump to Latest', self.on_jump_to_latest, visible=show_jump_to_latest),
+            item('⬅️ Previous Wallpaper', self.on_previous, enabled=lambda _: view['can_previous']),
+            item('➡️ Next Wallpaper', self.on_next, enabled=lambda _: view['can_next']),
+            # Show when not at latest
+            item('⏭️ Jump to Latest', self.on_jump_to_latest, visible=lambda _: view['can_next']),
+            item(
+                lambda _: '☆ Unpin Current Wallpaper' if view['favorite'] else '⭐ Pin Current Wallpaper',
+                self.on_toggle_favorite,
+                enabled=lambda _: view['has_wallpapers']
+            ),
+            item('📅 Browse', pystray.Menu(self.browse_years)),
+            item('🎨 Show', pystray.Menu(
+                self.filter_item('All Wallpapers', 'all'),
+                self.filter_item('Dark Only', 'dark'),
+                self.filter_item('Light Only', 'light'),
+                self.filter_item('Match Accent Colour', 'accent')
+            )),
+            item('🖼️ Slideshow', pystray.Menu(
+                *[self.slideshow_mode_item(label, mode) for label, mode in SLIDESHOW_LABELS],
+                pystray.Menu.SEPARATOR,
+                *[self.slideshow_interval_item(minutes) for minutes in INTERVALS_MINUTES]
+            )),
             pystray.Menu.SEPARATOR,
             
             item(
-                '✓ Enable Auto-Download' if not self.manager.auto_enabled else '✗ Disable Auto-Download',
+                lambda _: '✗ Disable Auto-Download' if view['auto_toggle'] else '✓ Enable Auto-Download',
                 self.on_toggle_auto
             ),
             item(
-                '▶️ Resume Auto-Update' if self.manager.user_paused else None,
+                '▶️ Resume Auto-Update',
                 self.on_resume,
-                visible=self.manager.user_paused
+                visible=lambda _: view['paused']
             ),
             item('🔄 Download Now', self.on_download_now),
             pystray.Menu.SEPARATOR,
             
             item('📁 Open Wallpaper Folder', self.on_open_folder),
             item('🔄 Refresh List', self.on_refresh),
+            item(
+                f'🩺 Profile {self.profile_seconds()} Seconds',
+                self.on_profile,
+                visible=self.diagnostics is not None
+            ),
             pystray.Menu.SEPARATOR,
             
             item('❌ Exit', self.on_exit)
         )
     
+    def filter_item(self, label: str, mode: str):
+        """Radio menu item for one wallpaper filter"""
+        return item(
+            label,
+            lambda: self.on_set_filter(mode),
+            checked=lambda _: self.view['filter_mode'] == mode,
+            radio=True
+        )
+    
+    def browse_years(self):
+        """Browse menu: the last BROWSE_MONTHS months by year, month and day, then "Older…" (see browse)"""
+        index = self.view['browse']
+        if not index:
+            yield item('No wallpapers found', lambda: None, enabled=False)
+            return
+        since = index.first_month(BROWSE_MONTHS)
+        for year in index.years():
+            if year < since[:4]:
+                break
+            yield item(year, pystray.Menu(self.browse_level(self.browse_months, index, year, since)))
+        if index.has_before(since):
+            yield pystray.Menu.SEPARATOR
+            yield item('📂 Older…', self.on_open_folder)
+    
+    def browse_level(self, build, *args):
+        """Item generator for a submenu, called by pystray when it builds that submenu"""
+        return lambda: build(*args)
+    
+    def browse_months(self, index: DateIndex, year: str, since: str = ''):
+        for month, days in index.months(year):
+            if f"{year}-{month}" < since:
+                break
+            yield item(f"{month_name(month)} ({days})",
+                       pystray.Menu(self.browse_level(self.browse_days, index, year, month)))
+    
+    def browse_days(self, index: DateIndex, year: str, month: str):
+        for day, paths in index.days(year, month):
+            if len(paths) == 1:
+                yield item(f"{int(day[8:])}. {wallpaper_label(paths[0])}", self.browse_action(paths[0]))
+            else:
+                yield item(f"{int(day[8:])}. ({len(paths)} wallpapers)", pystray.Menu(
+                    *[item(wallpaper_label(p), self.browse_action(p)) for p in paths[:MAX_PER_DAY]]
+                ))
+    
+    def browse_action(self, path: Path):
+        return lambda: self.on_browse(path)
+    
+    def slideshow_mode_item(self, label: str, mode: str):
+        """Radio menu item for one slideshow source"""
+        if mode == 'recent':
+            label = lambda _: f"Last {self.view['slideshow'].recent_days} Days"
+        return item(
+            label,
+            lambda: self.on_set_slideshow(mode=mode),
+            checked=lambda _: self.view['slideshow'].mode == mode,
+            radio=True
+        )
+    
+    def slideshow_interval_item(self, minutes: int):
+        """Radio menu item for one slideshow interval"""
+        label = f"Every {minutes // 60} Hour{'s' if minutes > 60 else ''}" if minutes >= 60 else f"Every {minutes} Minutes"
+        return item(
+            label,
+            lambda: self.on_set_slideshow(interval=minutes * 60),
+            checked=lambda _: self.view['slideshow'].interval == minutes * 60,
+            radio=True
+        )
+    
+    def on_set_slideshow(self, **changes):
+        """Change the slideshow source or interval and reschedule the timer"""
+        self.manager.record_action('slideshow')
+        self.slideshow.configure(self.manager.set_slideshow(**changes))
+    
+    def on_browse(self, path: Path):
+        """Set a wallpaper picked from the Browse menu"""
+        self.manager.record_action('browse')
+        self.manager.browse_to(path)
+    
     def on_previous(self):
         """Handle previous wallpaper"""
+        self.manager.record_action('previous')
         self.manager.previous_wallpaper()
-        self.update_menu()
     
     def on_next(self):
         """Handle next wallpaper"""
+        self.manager.record_action('next')
         self.manager.next_wallpaper()
-        self.update_menu()
     
     def on_jump_to_latest(self):
         """Jump to the latest (today's) wallpaper"""
+        self.manager.record_action('jump_to_latest')
         self.manager.jump_to_latest()
-        self.update_menu()
+    
+    def on_toggle_favorite(self):
+        """Pin/unpin the current wallpaper so retention keeps it"""
+        self.manager.record_action('toggle_favorite')
+        self.manager.toggle_favorite()
+    
+    def on_set_filter(self, mode: str):
+        """Switch the wallpaper filter; analyse missing wallpapers in the background"""
+        self.manager.record_action('filter')
+        self.manager.set_filter(mode)
+        if self.manager.pending_analysis and not self.analyzing:
+            def analyze():
+                try:
+                    self.manager.analyze_library()
+                    self.manager.refresh_wallpaper_list()
+                except Exception as e:
+                    logger.warning(f"Background analysis failed: {e}")
+                finally:
+                    self.analyzing = False
+            self.analyzing = True
+            threading.Thread(target=analyze, daemon=True).start()
     
     def on_toggle_auto(self):
         """Toggle auto-download"""
+        self.manager.record_action('toggle_auto')
         if self.manager.auto_enabled:
             self.manager.disable_auto_download()
         else:
             self.manager.enable_auto_download()
-        self.update_menu()
     
     def on_resume(self):
         """Resume auto-update after manual selection"""
-        self.manager.user_paused = False
-        self.manager.save_config()
-        if not self.manager.auto_enabled:
-            self.manager.enable_auto_download()
-        # Go back to latest wallpaper
-        self.manager.current_wallpaper_index = 0
-        if self.manager.wallpapers:
-            self.manager.set_wallpaper(self.manager.wallpapers[0])
-        self.update_menu()
+        self.manager.record_action('resume')
+        self.manager.resume_auto_update()
     
     def on_download_now(self):
         """Trigger immediate download"""
+        self.manager.record_action('download_now')
         self.manager.run_download_now()
         # Wait a bit and refresh
-        import threading
         def delayed_refresh():
-            import time
             time.sleep(3)
             self.manager.refresh_wallpaper_list()
-            self.update_menu()
         threading.Thread(target=delayed_refresh, daemon=True).start()
     
     def on_open_folder(self):
         """Open wallpaper folder"""
+        self.manager.record_action('open_folder')
         self.manager.open_wallpaper_folder()
     
     def on_refresh(self):
         """Refresh wallpaper list"""
+        self.manager.record_action('refresh')
         self.manager.refresh_wallpaper_list()
-        self.update_menu()
+    
+    def profile_seconds(self) -> int:
+        return int(self.manager.config.get('diagnostics_profile_seconds', DEFAULT_PROFILE_SECONDS))
+    
+    def on_profile(self):
+        """Write a sampling profile and memory snapshot to the logs folder (diagnostics mode)"""
+        if self.diagnostics is None:
+            raise RuntimeError("diagnostics are disabled (set diagnostics_enabled in config.json)")
+        self.manager.record_action('profile')
+        if not self.diagnostics.start_profile(self.profile_seconds()):
+            logger.info("Profile already running")
+    
+    def control_status(self) -> dict:
+        """Status reply for the control channel, read from the live state"""
+        state = self.manager.state.snapshot()
+        current = WallpaperManager._wallpaper_or_none(state['wallpapers'], state['current_index'])
+        return {
+            "wallpaper": current.name if current else None,
+            "index": state['current_index'],
+            "count": len(state['wallpapers']),
+            "auto_enabled": state['auto_enabled'],
+            "user_paused": state['user_paused'],
+            "filter": state['filter_mode'],
+            "slideshow": state['slideshow'].mode,
+            "profiling": self.diagnostics is not None and self.diagnostics.profiling,
+        }
+    
+    def start_control(self):
+        """Listen for commands from scripts and from `bing_wallpaper_tray --next` etc."""
+        folder = CONFIG_FILE.parent
+        handlers = {
+            "next": self.on_next,
+            "previous": self.on_previous,
+            "latest": self.on_jump_to_latest,
+            "refresh": self.on_refresh,
+            "profile": self.on_profile,
+            "status": lambda: None,
+        }
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            address, family = default_address(folder)
+            self.control = ControlServer(handlers, self.control_status, address, family,
+                                         create_key(folder), logger=logger)
+            self.control.start()
+            logger.info(f"Control channel listening on {address}")
+        except Exception as e:
+            self.control = None
+            logger.warning(f"Control channel unavailable: {e}")
     
     def on_exit(self):
         """Exit application"""
+        self.redraw.cancel()
+        self.slideshow.stop()
+        if self.control:
+            self.control.stop()
+        if self.diagnostics:
+            self.diagnostics.stop()
+        self.manager.flush_metrics()
         if self.icon:
             self.icon.stop()
     
     def update_menu(self):
-        """Update the tray menu"""
+        """Recompute every menu entry and redraw now (state changes redraw on their own)"""
+        self.refresh_view()
         if self.icon:
-            self.icon.menu = self.get_menu()
+            self.icon.update_menu()
     
     def run(self):
         """Start the system tray application"""
@@ -528,10 +957,88 @@ class TrayApp:
             menu=self.get_menu()
         )
         
+        self.slideshow.start()
+        self.start_control()
         self.icon.run()
 
 
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Bing Wallpaper Tray - ohne Optionen startet die Tray-App")
+    commands = p.add_mutually_exclusive_group()
+    commands.add_argument("--next", dest="command", action="store_const", const="next",
+                          help="Laufende Tray-App: neueres Hintergrundbild")
+    commands.add_argument("--previous", dest="command", action="store_const", const="previous",
+                          help="Laufende Tray-App: älteres Hintergrundbild")
+    commands.add_argument("--latest", dest="command", action="store_const", const="latest",
+                          help="Laufende Tray-App: neuestes Hintergrundbild")
+    commands.add_argument("--refresh", dest="command", action="store_const", const="refresh",
+                          help="Laufende Tray-App: Bilderliste neu einlesen")
+    commands.add_argument("--profile", dest="command", action="store_const", const="profile",
+                          help="Laufende Tray-App: Profil in den Log-Ordner schreiben (diagnostics_enabled)")
+    commands.add_argument("--status", dest="command", action="store_const", const="status",
+                          help="Status der laufenden Tray-App als JSON ausgeben")
+    return p.parse_args(argv)
+
+
+def attach_console():
+    """
+    Give a GUI build somewhere to print to.
+
+    The tray exe is built without a console, so sys.stdout and sys.stderr
+    are None and the control client's JSON and error messages would be lost.
+    A stream redirected by the caller (`> status.json`, a PowerShell pipe)
+    is picked up from the inherited handle; otherwise the console of the
+    shell that started the exe is attached.
+    """
+    if sys.platform != "win32" or (sys.stdout is not None and sys.stderr is not None):
+        return
+    import msvcrt
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetStdHandle.restype = ctypes.c_ssize_t
+    ATTACH_PARENT_PROCESS = -1
+    INVALID_HANDLE_VALUE = -1
+    attached = None
+    for name, std_handle in (("stdout", -11), ("stderr", -12)):  # STD_OUTPUT_HANDLE, STD_ERROR_HANDLE
+        if getattr(sys, name) is not None:
+            continue
+        handle = kernel32.GetStdHandle(std_handle)
+        try:
+            if handle and handle != INVALID_HANDLE_VALUE:
+                stream = open(msvcrt.open_osfhandle(handle, 0), "w", encoding="utf-8", closefd=False)
+            else:
+                if attached is None:
+                    attached = bool(kernel32.AttachConsole(ATTACH_PARENT_PROCESS))
+                if not attached:
+                    continue
+                stream = open("CONOUT$", "w", encoding="utf-8")
+        except OSError:
+            continue
+        setattr(sys, name, stream)
+
+
+def run_command(command: str) -> int:
+    """Send a command to the running tray; prints its status as JSON"""
+    folder = CONFIG_FILE.parent
+    address, family = default_address(folder)
+    try:
+        reply = send_command(command, address, family, read_key(folder))
+    except ControlError as e:
+        print(f"Tray-App nicht erreichbar: {e}", file=sys.stderr)
+        return 1
+    if not reply.get("ok"):
+        print(f"Fehler: {reply.get('error')}", file=sys.stderr)
+        return 1
+    print(json.dumps(reply["status"], ensure_ascii=False, indent=2))
+    return 0
+
+
 def main():
+    args = parse_args()
+    if args.command:
+        # Control client only: no mutex, no icon, no folder scan
+        attach_console()
+        sys.exit(run_command(args.command))
+    
     logger.info("=== Bing Wallpaper Tray App Starting ===")
     
     # Check if another instance is already running
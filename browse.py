@@ -0,0 +1,93 @@
+"""
+Date index behind the tray's "Browse" menu
+
+DateIndex groups the wallpaper list by day once per refresh (filename dates,
+no decoding; only files without a date in their name are stat'ed) and
+answers year -> month -> day lookups with binary searches over the sorted
+day keys. The menu generates one level at a time, but pystray's Win32 backend
+builds every submenu on each update_menu(), i.e. on every Previous/Next. The
+menu therefore lists only the last BROWSE_MONTHS months, so a redraw costs the
+same on a 5-year archive as on a fresh install; older wallpapers are reached
+through the folder.
+"""
+import bisect
+import calendar
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from library_index import parse_filename
+from slideshow import wallpaper_date
+
+# Entries shown for one day; more are reachable with Previous/Next
+MAX_PER_DAY = 10
+# Months listed in the menu, counting back from the newest wallpaper
+BROWSE_MONTHS = 12
+
+
+def wallpaper_label(path: Path) -> str:
+    """Short menu label: the slug from the filename, else the file stem"""
+    _, slug = parse_filename(path.name)
+    return slug or path.stem
+
+
+class DateIndex:
+    """Wallpapers grouped by day ("YYYY-MM-DD"), newest first within a day"""
+
+    def __init__(self, wallpapers: Iterable[Path] = ()):
+        self.by_day: Dict[str, List[Path]] = {}
+        for path in wallpapers:
+            day = wallpaper_date(path)
+            if day:
+                self.by_day.setdefault(day, []).append(path)
+        # Ascending, for bisect; menus show them newest first
+        self.keys = sorted(self.by_day)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, DateIndex) and self.by_day == other.by_day
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _range(self, prefix: str) -> List[str]:
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + "\uffff")
+        return self.keys[lo:hi]
+
+    def years(self) -> List[str]:
+        """Years with wallpapers, newest first"""
+        years = []
+        i = len(self.keys)
+        while i > 0:
+            year = self.keys[i - 1][:4]
+            years.append(year)
+            # Skip the rest of this year in one step
+            i = bisect.bisect_left(self.keys, year)
+        return years
+
+    def first_month(self, count: int) -> str:
+        """First month ("YYYY-MM") of the last `count` calendar months up to the newest wallpaper"""
+        newest = self.keys[-1]
+        months = int(newest[:4]) * 12 + int(newest[5:7]) - count
+        return f"{months // 12:04d}-{months % 12 + 1:02d}"
+
+    def has_before(self, month: str) -> bool:
+        """True if there are wallpapers older than `month` ("YYYY-MM")"""
+        return bool(self.keys) and self.keys[0] < month
+
+    def months(self, year: str) -> List[Tuple[str, int]]:
+        """(month "MM", number of days with wallpapers) for a year, newest first"""
+        counts: Dict[str, int] = {}
+        for key in self._range(year + "-"):
+            counts[key[5:7]] = counts.get(key[5:7], 0) + 1
+        return sorted(counts.items(), reverse=True)
+
+    def days(self, year: str, month: str) -> List[Tuple[str, List[Path]]]:
+        """(day "YYYY-MM-DD", wallpapers) for a month, newest first"""
+        return [(key, self.by_day[key]) for key in reversed(self._range(f"{year}-{month}-"))]
+
+
+def month_name(month: str) -> str:
+    try:
+        return calendar.month_name[int(month)]
+    except (ValueError, IndexError):
+        return month
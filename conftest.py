@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Shared pytest fixtures
+"""
+import sys
+from unittest import mock
+
+import pytest
+
+_real_pil_modules = {}
+
+
+@pytest.fixture
+def real_pil(monkeypatch):
+    """Use the real Pillow even if another test module replaced it with a mock"""
+    if not _real_pil_modules:
+        for name in ("PIL", "PIL.Image", "PIL.ImageDraw"):
+            if isinstance(sys.modules.get(name), mock.MagicMock):
+                monkeypatch.delitem(sys.modules, name)
+        image = pytest.importorskip("PIL.Image")
+        # Load the format plugins now so they register with this Image module
+        image.init()
+        _real_pil_modules.update((k, v) for k, v in sys.modules.items()
+                                 if (k == "PIL" or k.startswith("PIL.")) and not isinstance(v, mock.MagicMock))
+    for name, module in _real_pil_modules.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    return _real_pil_modules["PIL.Image"]
+
+
+def make_jpeg(width: int = 1920, height: int = 1080, size: int = 20 * 1024) -> bytes:
+    """Structurally valid baseline JPEG (SOI, SOF0, dummy scan, EOI) of `size` bytes; not decodable"""
+    sof = (b"\xff\xc0\x00\x11\x08" + height.to_bytes(2, "big") + width.to_bytes(2, "big")
+           + b"\x03\x01\x22\x00\x02\x11\x01\x03\x11\x01")
+    sos = b"\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00"
+    head = b"\xff\xd8" + sof + sos
+    return head + b"\x55" * max(0, size - len(head) - 2) + b"\xff\xd9"
+
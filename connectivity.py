@@ -0,0 +1,126 @@
+"""
+Connectivity probe and deferral for downloader runs
+
+At logon the network is often not up yet, and every metadata request would
+then wait out its full timeout for each market. Before the first request the
+downloader asks a ConnectivityProvider whether Bing (or the proxy or mirror
+in front of it) can be reached at all. If not, the run is deferred: the
+probe is repeated with exponential backoff, and the local interface state is
+polled in between (no traffic) so the run starts as soon as a link comes up
+instead of at the next backoff step.
+
+Providers are pluggable: SocketProvider opens one TCP connection with a short
+timeout; tests and other environments can pass their own.
+"""
+import socket
+import sys
+import time
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Callable, Hashable, Optional, Tuple
+
+# Timeout of one reachability probe (seconds)
+PROBE_TIMEOUT = 3.0
+# First and largest pause between two probes while offline
+INITIAL_BACKOFF = 2.0
+MAX_BACKOFF = 60.0
+# How often the local link state is checked during a pause
+LINK_POLL_INTERVAL = 1.0
+DEFAULT_MAX_WAIT = 300
+
+
+def link_state() -> Optional[Hashable]:
+    """Names of the interfaces that are up (loopback excluded), or None if unknown; no traffic"""
+    try:
+        import psutil
+        return frozenset(name for name, stats in psutil.net_if_stats().items()
+                         if stats.isup and not name.lower().startswith(("lo", "loopback")))
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        return _windows_link_state()
+    try:
+        return frozenset(path.parent.name for path in Path("/sys/class/net").glob("*/operstate")
+                         if path.parent.name != "lo" and path.read_text().strip() == "up")
+    except OSError:
+        return None
+
+
+def _windows_link_state() -> Optional[Hashable]:
+    try:
+        import ctypes
+        from ctypes import wintypes
+        flags = wintypes.DWORD()
+        connected = ctypes.windll.wininet.InternetGetConnectedState(ctypes.byref(flags), 0)
+        return (bool(connected), flags.value)
+    except Exception:
+        return None
+
+
+def probe_target(base_url: str) -> Tuple[str, int]:
+    """(host, port) a request to base_url connects to first: the HTTPS/HTTP proxy if one is set"""
+    parsed = urllib.parse.urlsplit(base_url)
+    proxy = urllib.request.getproxies().get(parsed.scheme or "https")
+    if proxy and not urllib.request.proxy_bypass(parsed.hostname or ""):
+        parsed = urllib.parse.urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+    default_port = 443 if parsed.scheme == "https" else 80
+    return parsed.hostname or "", parsed.port or default_port
+
+
+class ConnectivityProvider:
+    """Answers "can we reach the server?"; link_state() is an optional cheap change signal"""
+
+    def reachable(self) -> bool:
+        raise NotImplementedError
+
+    def link_state(self) -> Optional[Hashable]:
+        return None
+
+
+class SocketProvider(ConnectivityProvider):
+    """Reachable if a TCP connection to the server (or proxy) opens within `timeout`"""
+
+    def __init__(self, base_url: str, timeout: float = PROBE_TIMEOUT):
+        self.host, self.port = probe_target(base_url)
+        self.timeout = timeout
+        self.probes = 0
+
+    def reachable(self) -> bool:
+        self.probes += 1
+        try:
+            socket.create_connection((self.host, self.port), timeout=self.timeout).close()
+            return True
+        except OSError:
+            return False
+
+    def link_state(self) -> Optional[Hashable]:
+        return link_state()
+
+
+def wait_for_network(provider: ConnectivityProvider, max_wait: float,
+                     initial: float = INITIAL_BACKOFF, cap: float = MAX_BACKOFF,
+                     poll: float = LINK_POLL_INTERVAL,
+                     clock: Callable[[], float] = time.monotonic,
+                     sleep: Callable[[float], None] = time.sleep) -> bool:
+    """
+    Block until provider.reachable(), probing with exponential backoff.
+
+    A change of the local link state ends the current pause early. Returns
+    False once max_wait has passed without a successful probe.
+    """
+    start = clock()
+    delay = initial
+    while True:
+        if provider.reachable():
+            return True
+        remaining = max_wait - (clock() - start)
+        if remaining <= 0:
+            return False
+        state = provider.link_state()
+        wake = clock() + min(delay, remaining)
+        while clock() < wake:
+            sleep(min(poll, wake - clock()))
+            if state is not None and provider.link_state() != state:
+                break
+        delay = min(delay * 2, cap)
@@ -0,0 +1,70 @@
+"""
+Time budget for a single downloader run
+
+Without a budget a run can take markets x 15 s of metadata timeouts plus
+images x candidates x 30 s of download timeouts. With `--deadline` (or
+"run_deadline_seconds") main() creates one Deadline and passes it down:
+
+- every request timeout is cut to the time that is left;
+- streamed image bodies are checked between chunks;
+- waits for cache locks held by other processes or machines end with it;
+- older images are dropped once only the reserve is left, so today's image
+  (downloaded first) keeps the remaining time and the files still get
+  written before the budget ends.
+"""
+import time
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+# A request is not started with less time than this left
+MIN_REQUEST_TIMEOUT = 1.0
+# Time kept back for writing files, as a share of the budget and at most
+RESERVE_SHARE = 0.1
+MAX_RESERVE = 10.0
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """The run's time budget is used up"""
+
+
+class Deadline:
+    """Absolute end of a run; `seconds` from creation on the monotonic clock"""
+
+    def __init__(self, seconds: float, reserve: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.seconds = float(seconds)
+        self.reserve = min(MAX_RESERVE, self.seconds * RESERVE_SHARE) if reserve is None else reserve
+        self.clock = clock
+        self.end = clock() + self.seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.end - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        """Too little time left to start another request"""
+        return self.remaining() < MIN_REQUEST_TIMEOUT
+
+    @property
+    def low(self) -> bool:
+        """Only the reserve is left: no new low-priority work"""
+        return self.remaining() <= self.reserve
+
+    def timeout(self, default: float) -> float:
+        """`default`, cut to the time left; raises DeadlineExceeded if too little is left for a request"""
+        if self.expired:
+            raise DeadlineExceeded(f"run deadline of {self.seconds:.0f}s reached")
+        return min(default, self.remaining())
+
+    def watch(self, chunks: Iterable[T]) -> Iterator[T]:
+        """Pass chunks through, raising DeadlineExceeded once the budget is used up"""
+        for chunk in chunks:
+            if self.remaining() <= 0:
+                raise DeadlineExceeded(f"run deadline of {self.seconds:.0f}s reached during download")
+            yield chunk
+
+
+def request_timeout(deadline: Optional[Deadline], default: float) -> float:
+    """Timeout for one request: `default` without a deadline"""
+    return deadline.timeout(default) if deadline is not None else default
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Bing Wallpaper Downloader - Library-wide near-duplicate detection
+
+Computes perceptual hashes for wallpapers that do not have one yet (stored in
+the library index), then groups images whose pHash differs by at most
+--threshold bits. The oldest file of each group is kept as the original.
+
+Usage:
+    python dedupe.py
+    python dedupe.py --threshold 8 --mark
+"""
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+from bing_wallpaper import load_config
+from library_index import LibraryIndex
+from logger import setup_logger
+from phash import DEFAULT_THRESHOLD, DuplicateFinder, hash_many
+
+logger = setup_logger('dedupe')
+
+BATCH_SIZE = 64
+
+
+def backfill_hashes(index: LibraryIndex, workers: int = 4) -> int:
+    """Hash every indexed image that has no pHash yet; returns the number hashed"""
+    missing = [name for name, entry in index.oldest_first() if not entry.get("phash")]
+    batches = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+
+    def work(names: List[str]):
+        # Decoding dominates and Pillow releases the GIL while decoding
+        try:
+            return names, hash_many(index.folder / n for n in names)
+        except Exception:
+            # One unreadable file should not lose the whole batch
+            out = []
+            for n in names:
+                try:
+                    out.append(hash_many([index.folder / n])[0])
+                except Exception as e:
+                    logger.warning(f"Could not hash {n}: {e}")
+                    out.append(None)
+            return names, out
+
+    hashed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for names, results in pool.map(work, batches):
+            for name, hashes in zip(names, results):
+                if hashes:
+                    index.update(name, **hashes)
+                    hashed += 1
+    return hashed
+
+
+def find_duplicates(index: LibraryIndex, threshold: int = DEFAULT_THRESHOLD) -> Dict[str, List[str]]:
+    """Group near-duplicates: {original name: [duplicate names]}, oldest file first"""
+    finder = DuplicateFinder(threshold)
+    groups: Dict[str, List[str]] = {}
+    for name, entry in index.oldest_first():
+        if not entry.get("phash"):
+            continue
+        match = finder.find(entry["phash"])
+        if match:
+            groups.setdefault(match[1], []).append(name)
+        else:
+            finder.add(entry["phash"], name)
+    return groups
+
+
+def main():
+    config = load_config()
+    p = argparse.ArgumentParser("Find near-duplicate Bing wallpapers")
+    p.add_argument("--folder", default=config.get("download_folder", str(Path.home() / "Pictures" / "BingWallpapers")))
+    p.add_argument("--threshold", type=int, default=config.get("dedupe_threshold", DEFAULT_THRESHOLD),
+                   help="Maximum pHash distance in bits (0-64)")
+    p.add_argument("--workers", type=int, default=4, help="Decoder threads")
+    p.add_argument("--mark", action="store_true", help="Record duplicate_of in the library index")
+    args = p.parse_args()
+
+    folder = Path(args.folder)
+    if not folder.exists():
+        print(f"Ordner nicht gefunden: {folder}", file=sys.stderr)
+        return 1
+
+    index = LibraryIndex.open(folder)
+    hashed = backfill_hashes(index, args.workers)
+    logger.info(f"Hashed {hashed} new image(s)")
+    groups = find_duplicates(index, args.threshold)
+
+    for original, dups in groups.items():
+        print(f"{original}:")
+        for name in dups:
+            print(f"  ~ {name}")
+            if args.mark:
+                index.update(name, duplicate_of=original)
+    index.save()
+
+    total = sum(len(d) for d in groups.values())
+    logger.info(f"Found {total} near-duplicate(s) in {len(groups)} group(s)")
+    print(f"{total} Duplikat(e) in {len(groups)} Gruppe(n) gefunden.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
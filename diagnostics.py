@@ -0,0 +1,206 @@
+"""
+Opt-in diagnostics for the long-running tray process
+
+With `diagnostics_enabled` in config.json the tray wraps its menu handlers to
+record a latency histogram per action (tray_action_seconds{action=...}) and
+offers a "Profile" command. Without it nothing is wrapped and no thread is
+started, so the normal tray pays nothing.
+
+A profile samples the stacks of all threads every few milliseconds for N
+seconds (no tracing hooks, so the tray keeps its normal speed) and traces
+allocations with tracemalloc for the same window. The results land in the
+logs folder:
+
+    tray_profile_<time>.pstats      sampled stacks, for pstats/snakeviz
+    tray_profile_<time>_stacks.txt  collapsed stacks, for flame graph tools
+    tray_profile_<time>.tracemalloc allocation snapshot (tracemalloc.Snapshot.load)
+    tray_profile_<time>.txt         top functions, top allocations, action timings
+"""
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds between two stack samples
+SAMPLE_INTERVAL = 0.005
+# Frames kept per allocation traceback
+TRACEMALLOC_FRAMES = 10
+DEFAULT_PROFILE_SECONDS = 30
+# Lines per section of the text summary
+SUMMARY_LINES = 25
+
+Function = Tuple[str, int, str]
+Stack = Tuple[Function, ...]
+
+
+def sample_stacks(seconds: float, interval: float = SAMPLE_INTERVAL,
+                  stop: Optional[threading.Event] = None) -> Counter:
+    """Stacks (root first) of all other threads, counted per sample, for `seconds`"""
+    own = threading.get_ident()
+    samples: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and not (stop and stop.is_set()):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            samples[tuple(reversed(stack))] += 1
+        time.sleep(interval)
+    return samples
+
+
+def pstats_dict(samples: Counter, interval: float = SAMPLE_INTERVAL) -> dict:
+    """
+    Samples in the marshalled layout of cProfile, so pstats.Stats can load them.
+
+    Call counts are sample counts; inclusive time counts each function once per
+    sample even when it recurses.
+    """
+    stats: Dict[Function, list] = {}
+    for stack, count in samples.items():
+        if not stack:
+            continue
+        seconds = count * interval
+        seen = set()
+        for depth, func in enumerate(stack):
+            entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+            leaf = depth == len(stack) - 1
+            if leaf:
+                entry[2] += seconds
+            if func in seen:
+                continue
+            seen.add(func)
+            entry[0] += count
+            entry[1] += count
+            entry[3] += seconds
+            if depth:
+                caller = stack[depth - 1]
+                nc, cc, tt, ct = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                entry[4][caller] = (nc + count, cc + count, tt + (seconds if leaf else 0.0), ct + seconds)
+    return {func: tuple(entry) for func, entry in stats.items()}
+
+
+def collapsed_stacks(samples: Counter) -> str:
+    """One "outer;inner count" line per stack, the input format of flame graph tools"""
+    lines = []
+    for stack, count in samples.most_common():
+        names = ";".join(f"{Path(filename).stem}:{name}" for filename, _, name in stack)
+        lines.append(f"{names} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class Diagnostics:
+    """
+    Action timings and on-demand profiles for one tray process.
+
+    `metrics` is the tray's MetricsRegistry; `log_dir` receives the profiles.
+    """
+
+    def __init__(self, metrics, log_dir: Path, logger=None, interval: float = SAMPLE_INTERVAL):
+        self.metrics = metrics
+        self.log_dir = Path(log_dir)
+        self.logger = logger
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_profile: List[Path] = []
+
+    def timed(self, action: str, handler: Callable) -> Callable:
+        """`handler` recording its wall time under tray_action_seconds{action}"""
+        @wraps(handler)
+        def timed_handler(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.metrics.observe('tray_action_seconds', time.perf_counter() - start, action=action)
+        return timed_handler
+
+    def instrument(self, obj, names: Iterable[str]):
+        """Replace the bound methods `names` of `obj` by timed versions (instance attributes)"""
+        for name in names:
+            setattr(obj, name, self.timed(name, getattr(obj, name)))
+
+    @property
+    def profiling(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start_profile(self, seconds: float = DEFAULT_PROFILE_SECONDS) -> bool:
+        """Profile in the background; False if a profile is already running"""
+        if self.profiling:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._profile_quietly, args=(seconds,),
+                                        name="tray-profile", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """End a running profile early (its files are still written)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _profile_quietly(self, seconds: float):
+        try:
+            self.profile(seconds)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Profile failed: {e}", exc_info=True)
+
+    def profile(self, seconds: float) -> List[Path]:
+        """Sample for `seconds` on the calling thread and write the result files"""
+        if self.logger:
+            self.logger.info(f"Profiling for {seconds:.0f}s")
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        try:
+            samples = sample_stacks(seconds, self.interval, self._stop)
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        base = self.log_dir / f"tray_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        paths = [base.with_suffix('.pstats'), base.with_name(base.name + '_stacks.txt'),
+                 base.with_suffix('.tracemalloc'), base.with_suffix('.txt')]
+        with open(paths[0], 'wb') as f:
+            marshal.dump(pstats_dict(samples, self.interval), f)
+        paths[1].write_text(collapsed_stacks(samples), encoding='utf-8')
+        snapshot.dump(str(paths[2]))
+        paths[3].write_text(self.summary(paths[0], snapshot, sum(samples.values())), encoding='utf-8')
+        self.last_profile = paths
+        if self.logger:
+            self.logger.info(f"Profile written to {paths[0]}")
+        return paths
+
+    def summary(self, pstats_path: Path, snapshot: tracemalloc.Snapshot, sample_count: int) -> str:
+        """Readable report: hottest functions, largest allocations, action timings"""
+        out = io.StringIO()
+        out.write(f"Samples: {sample_count} (every {self.interval * 1000:.0f} ms, all threads)\n\n")
+        if sample_count:
+            pstats.Stats(str(pstats_path), stream=out).sort_stats('tottime').print_stats(SUMMARY_LINES)
+
+        out.write("Allocations since the profile started:\n")
+        for stat in snapshot.statistics('lineno')[:SUMMARY_LINES]:
+            out.write(f"  {stat}\n")
+
+        out.write("\nAction timings (count, mean):\n")
+        for labels, entry in sorted(self.metrics.samples('tray_action_seconds').items()):
+            mean = entry["sum"] / entry["count"] if entry["count"] else 0.0
+            out.write(f"  {dict(labels).get('action')}: {entry['count']}, {mean * 1000:.1f} ms\n")
+        return out.getvalue()
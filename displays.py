@@ -0,0 +1,170 @@
+"""
+Display-aware resolution selection for Bing Wallpaper Downloader
+
+With "resolution": "auto" the downloader asks a display provider for the
+attached monitors, takes the largest one and tries the smallest Bing
+resolution that still covers it first. Providers are plain callables that
+return a list of (width, height) tuples and can be registered by name.
+
+Machines sharing one config file can use different settings through
+"resolution_policies", e.g.:
+
+    "resolution_policies": [
+        {"hosts": "LAPTOP-*", "resolution": "auto"},
+        {"hosts": "KIOSK-01", "resolution": "1920x1080"}
+    ]
+"""
+import fnmatch
+import platform
+import re
+import sys
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+Size = Tuple[int, int]
+
+AUTO = "auto"
+# Candidate resolutions for auto mode, largest first
+AUTO_RESOLUTIONS = ["UHD", "2560x1440", "1920x1200", "1920x1080", "1366x768", "1280x720"]
+NAMED_SIZES: Dict[str, Size] = {"UHD": (3840, 2160)}
+# Keys a resolution policy may override
+POLICY_KEYS = ("resolution", "display_provider", "display")
+
+_RES_RE = re.compile(r"^(\d+)x(\d+)$")
+_URL_RES_RE = re.compile(r"_(UHD|\d+x\d+)\.(?:jpg|png|webp)", re.IGNORECASE)
+
+
+def parse_resolution(res: str) -> Optional[Size]:
+    """Map "UHD" or "WxH" to (width, height)"""
+    res = res.strip()
+    if res.upper() in NAMED_SIZES:
+        return NAMED_SIZES[res.upper()]
+    m = _RES_RE.match(res)
+    return (int(m[1]), int(m[2])) if m else None
+
+
+def url_resolution(url: str) -> Optional[Size]:
+    """Resolution encoded in a Bing image URL (…_1920x1080.jpg…), if any"""
+    m = _URL_RES_RE.search(url)
+    return parse_resolution(m[1]) if m else None
+
+
+def _landscape(size: Size) -> Size:
+    # Wallpapers are landscape; a portrait monitor needs the same pixel count
+    return max(size), min(size)
+
+
+def covers(res: Size, display: Size) -> bool:
+    w, h = _landscape(display)
+    return res[0] >= w and res[1] >= h
+
+
+def _coverage_key(res: Optional[Size], display: Size):
+    """Sort key: covering sizes smallest first, then non-covering largest first, unknown last"""
+    if res is None:
+        return (2, 0)
+    area = res[0] * res[1]
+    return (0, area) if covers(res, display) else (1, -area)
+
+
+def order_resolutions(resolutions: Sequence[str], display: Optional[Size]) -> List[str]:
+    """Order resolution names so the smallest one covering `display` comes first"""
+    if display is None:
+        return list(resolutions)
+    return sorted(resolutions, key=lambda r: _coverage_key(parse_resolution(r), display))
+
+
+def order_urls(urls: Sequence[str], display: Optional[Size]) -> List[str]:
+    """Same ordering for candidate URLs, using the resolution in each URL"""
+    if display is None:
+        return list(urls)
+    return sorted(urls, key=lambda u: _coverage_key(url_resolution(u), display))
+
+
+def largest_display(displays: Sequence[Size]) -> Optional[Size]:
+    return max(displays, key=lambda s: s[0] * s[1]) if displays else None
+
+
+def windows_displays() -> List[Size]:
+    """Physical resolution of every attached monitor (Win32 EnumDisplayMonitors)"""
+    import ctypes
+    from ctypes import wintypes
+
+    class MONITORINFO(ctypes.Structure):
+        _fields_ = [("cbSize", wintypes.DWORD), ("rcMonitor", wintypes.RECT),
+                    ("rcWork", wintypes.RECT), ("dwFlags", wintypes.DWORD)]
+
+    user32 = ctypes.windll.user32
+    try:
+        # Without this, scaled monitors report DPI-virtualised sizes
+        user32.SetProcessDPIAware()
+    except Exception:
+        pass
+
+    sizes: List[Size] = []
+    MonitorEnumProc = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HMONITOR, wintypes.HDC,
+                                         ctypes.POINTER(wintypes.RECT), wintypes.LPARAM)
+
+    def callback(hmonitor, hdc, rect, lparam):
+        info = MONITORINFO()
+        info.cbSize = ctypes.sizeof(MONITORINFO)
+        if user32.GetMonitorInfoW(hmonitor, ctypes.byref(info)):
+            r = info.rcMonitor
+            sizes.append((r.right - r.left, r.bottom - r.top))
+        return True
+
+    user32.EnumDisplayMonitors(None, None, MonitorEnumProc(callback), 0)
+    return sizes
+
+
+def static_displays(config: dict) -> List[Size]:
+    """Displays listed in config ("display": "1366x768" or "1366x768,2560x1440")"""
+    spec = config.get("display", "")
+    return [s for s in (parse_resolution(p) for p in spec.split(",")) if s]
+
+
+PROVIDERS: Dict[str, Callable[[dict], List[Size]]] = {
+    "windows": lambda config: windows_displays(),
+    "static": static_displays,
+}
+
+
+def register_provider(name: str, provider: Callable[[dict], List[Size]]):
+    """Add a display provider; it receives the config and returns [(width, height), ...]"""
+    PROVIDERS[name] = provider
+
+
+def detect_display(config: dict, logger=None) -> Optional[Size]:
+    """Largest attached display according to the configured provider, or None if unknown"""
+    name = config.get("display_provider", "auto")
+    if name == "auto":
+        name = "static" if config.get("display") else ("windows" if sys.platform == "win32" else None)
+    provider = PROVIDERS.get(name) if name else None
+    if provider is None:
+        if logger:
+            logger.warning(f"No display provider available ({name}), using default resolutions")
+        return None
+    try:
+        return largest_display(provider(config))
+    except Exception as e:
+        if logger:
+            logger.warning(f"Display provider {name} failed: {e}")
+        return None
+
+
+def auto_resolutions(display: Optional[Size]) -> List[str]:
+    """Candidate resolutions for auto mode, best fit for `display` first"""
+    return order_resolutions(AUTO_RESOLUTIONS, display)
+
+
+def apply_resolution_policy(config: dict, hostname: Optional[str] = None) -> dict:
+    """Return config with the first resolution policy matching this machine applied"""
+    hostname = (hostname or platform.node()).lower()
+    for policy in config.get("resolution_policies", []):
+        patterns = policy.get("hosts", "*")
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        if any(fnmatch.fnmatch(hostname, p.lower()) for p in patterns):
+            merged = dict(config)
+            merged.update({k: v for k, v in policy.items() if k in POLICY_KEYS})
+            return merged
+    return config
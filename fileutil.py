@@ -0,0 +1,81 @@
+"""
+Small file helpers shared by Bing Wallpaper Downloader modules
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def atomic_write_bytes(path: Path, data: bytes, durable: bool = True):
+    """Write data to a temp file in the same folder, then rename it over `path`
+
+    Readers see either the old file or the complete new one, never a partial
+    write, and a crash leaves at most a hidden .tmp file behind.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if durable:
+                # Make sure the data is on disk before the rename makes it visible
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_text(path: Path, text: str, durable: bool = True):
+    """Text variant of atomic_write_bytes (UTF-8, LF line endings)"""
+    atomic_write_bytes(path, text.encode("utf-8"), durable)
+
+
+@contextmanager
+def lock_file(path: Path, wait: float, stale: float, poll: float = 0.05):
+    """Cross-process lock using an O_EXCL lock file; yields False if not acquired within `wait`
+
+    A lock file older than `stale` seconds was left behind by a killed
+    process and is taken over. Works on local disks and SMB shares. If the
+    lock file cannot be created at all (read-only or vanished share, a
+    Windows lock file pending delete), the lock is given up at once rather
+    than raising, so the caller can carry on without it.
+    """
+    deadline = time.monotonic() + wait
+    acquired = False
+    while True:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            acquired = True
+            break
+        except FileExistsError:
+            try:
+                if time.time() - path.stat().st_mtime > stale:
+                    path.unlink()
+                    continue
+            except FileNotFoundError:
+                # Released between our open and stat: try again at once
+                continue
+            except OSError:
+                # Stale lock we may not remove (another user's, on a share): wait like for a busy one
+                pass
+            if time.monotonic() > deadline:
+                break
+            time.sleep(poll)
+        except OSError:
+            break
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,148 @@
+"""
+Persistent circuit breakers and latency scores for markets and hosts
+
+Every run records how each market's metadata request and each host's
+requests went. A market (or host) that failed FAILURE_THRESHOLD times in a
+row is "open": later runs skip it instead of waiting out its timeouts. After
+a cool-down it becomes "half-open" and gets one cheap probe, run in parallel
+with the healthy markets instead of in front of them; a successful probe
+closes the breaker, a failed one opens it again for twice as long.
+
+Latency is kept as an exponentially weighted moving average, so a market
+that has become slow is tried after the fast ones before it times out.
+
+The state lives in health.json next to the config and is shown in the run
+summary.
+"""
+import json
+import time
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fileutil import atomic_write_text
+
+HEALTH_FILE_NAME = "health.json"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Consecutive failures that open a breaker
+FAILURE_THRESHOLD = 3
+# First cool-down; doubled after every failed probe, up to a day
+OPEN_SECONDS = 30 * 60
+MAX_OPEN_SECONDS = 24 * 3600
+# Weight of the newest sample in the latency average
+EWMA_ALPHA = 0.3
+# Markets slower than this on average are tried after the others
+SLOW_SECONDS = 10.0
+# Timeout of the metadata probe for a half-open market
+PROBE_TIMEOUT = 5.0
+
+
+@dataclass
+class Breaker:
+    """Breaker and latency score of one market or host"""
+
+    state: str = CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    open_seconds: float = OPEN_SECONDS
+    latency: Optional[float] = None
+    successes: int = 0
+    total_failures: int = 0
+    last_error: str = ""
+
+    def state_at(self, now: float) -> str:
+        if self.state == OPEN and now >= self.opened_at + self.open_seconds:
+            return HALF_OPEN
+        return self.state
+
+    def record(self, ok: bool, seconds: float, now: float, error: str = ""):
+        self.latency = seconds if self.latency is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+        if ok:
+            self.state, self.failures, self.open_seconds = CLOSED, 0, OPEN_SECONDS
+            self.successes += 1
+            return
+        self.failures += 1
+        self.total_failures += 1
+        self.last_error = error[:200]
+        if self.state_at(now) == HALF_OPEN:
+            # The probe failed: back off for longer
+            self.state, self.opened_at = OPEN, now
+            self.open_seconds = min(self.open_seconds * 2, MAX_OPEN_SECONDS)
+        elif self.state == CLOSED and self.failures >= FAILURE_THRESHOLD:
+            self.state, self.opened_at = OPEN, now
+
+
+class HealthStore:
+    """Breakers by (kind, name), kind being "market" or "host"; see the module docstring"""
+
+    def __init__(self, path: Path, clock: Callable[[], float] = time.time):
+        self.path = Path(path)
+        self.clock = clock
+        self.breakers: Dict[Tuple[str, str], Breaker] = {}
+
+    def load(self) -> bool:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        known = {f.name for f in fields(Breaker)}
+        for kind, entries in data.items():
+            if not isinstance(entries, dict):
+                continue
+            for name, entry in entries.items():
+                self.breakers[(kind, name)] = Breaker(**{k: v for k, v in entry.items() if k in known})
+        return True
+
+    def save(self):
+        data: Dict[str, dict] = {}
+        for (kind, name), breaker in sorted(self.breakers.items()):
+            data.setdefault(kind, {})[name] = asdict(breaker)
+        atomic_write_text(self.path, json.dumps(data, indent=2), durable=False)
+
+    def state(self, kind: str, name: str) -> str:
+        breaker = self.breakers.get((kind, name))
+        return breaker.state_at(self.clock()) if breaker else CLOSED
+
+    def allow(self, kind: str, name: str) -> bool:
+        """False while the breaker is open; half-open lets a probe through"""
+        return self.state(kind, name) != OPEN
+
+    def record(self, kind: str, name: str, ok: bool, seconds: float, error: str = ""):
+        self.breakers.setdefault((kind, name), Breaker()).record(ok, seconds, self.clock(), error)
+
+    def plan(self, markets: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        (markets to try in order, half-open markets to probe alongside).
+
+        Open markets are left out; slow ones move behind the fast ones. If
+        every market is open the primary is still tried, so a run is never
+        empty by construction.
+        """
+        fast, slow, probes = [], [], []
+        for market in markets:
+            state = self.state("market", market)
+            if state == HALF_OPEN:
+                probes.append(market)
+            elif state == CLOSED:
+                breaker = self.breakers.get(("market", market))
+                slow_market = breaker is not None and (breaker.latency or 0) > SLOW_SECONDS
+                (slow if slow_market else fast).append(market)
+        ordered = fast + slow
+        if not ordered and not probes and markets:
+            ordered = markets[:1]
+        return ordered, probes
+
+    def summary(self) -> Dict[str, dict]:
+        """Compact state for the run summary"""
+        now = self.clock()
+        out: Dict[str, dict] = {}
+        for (kind, name), breaker in sorted(self.breakers.items()):
+            entry = {"state": breaker.state_at(now), "failures": breaker.failures}
+            if breaker.latency is not None:
+                entry["latency_ms"] = round(breaker.latency * 1000)
+            out.setdefault(kind + "s", {})[name] = entry
+        return out
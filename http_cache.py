@@ -0,0 +1,234 @@
+"""
+On-disk HTTP cache shared by all Bing Wallpaper Downloader processes
+
+Stores small responses (metadata JSON, negative probe results such as 404s)
+as one JSON file per URL. Freshness follows Cache-Control (no-store,
+no-cache, max-age) and Expires; responses without either use the caller's
+default TTL. Stale entries with an ETag or Last-Modified are revalidated
+with a conditional request.
+
+Concurrent processes are safe: entries are replaced atomically, and a lock
+file per URL makes a second process wait for the first one's request
+instead of repeating it. The cache is capped in size; the least recently
+used entries are evicted first.
+"""
+import base64
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from fileutil import atomic_write_text, lock_file
+
+CACHE_DIR_NAME = "http_cache"
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+# Only these headers are stored with an entry
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Expires", "Date")
+LOCK_WAIT = 30.0
+LOCK_STALE = 60.0
+LOCK_POLL = 0.05
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    content: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+    from_cache: bool = False
+
+    def json(self):
+        return json.loads(self.content)
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+
+def canonical_headers(headers) -> Dict[str, str]:
+    """The KEPT_HEADERS of a response, matched case-insensitively (HTTP/2 lower-cases names)"""
+    lowered = {k.lower(): v for k, v in dict(headers).items()}
+    return {k: lowered[k.lower()] for k in KEPT_HEADERS if lowered.get(k.lower())}
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers: Dict[str, str], default_ttl: float) -> Optional[float]:
+    """Seconds a response stays fresh, or None if it must not be stored"""
+    cc = parse_cache_control(headers.get("Cache-Control", ""))
+    if "no-store" in cc:
+        return None
+    if "no-cache" in cc:
+        return 0.0
+    if cc.get("max-age") is not None:
+        try:
+            return max(0.0, float(cc["max-age"]))
+        except ValueError:
+            return 0.0
+    if headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+            date = parsedate_to_datetime(headers["Date"]).timestamp() if headers.get("Date") else time.time()
+            return max(0.0, expires - date)
+        except (TypeError, ValueError):
+            # Invalid Expires means "already expired"
+            return 0.0
+    return default_ttl
+
+
+class HttpCache:
+    """Filesystem-backed cache of small HTTP responses"""
+
+    def __init__(self, folder: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "probe_misses": 0, "revalidated": 0, "stores": 0, "evictions": 0}
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    def _entry_path(self, key: str) -> Path:
+        return self.folder / f"{key}.json"
+
+    def _read(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads(self._entry_path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _fresh(entry: Optional[dict], now: float) -> bool:
+        return entry is not None and entry.get("expires", 0) > now
+
+    def _response(self, entry: dict) -> CachedResponse:
+        return CachedResponse(entry["status"], base64.b64decode(entry.get("body", "")),
+                              dict(entry.get("headers", {})), from_cache=True)
+
+    def _touch(self, key: str):
+        # Entry mtime doubles as "last used" for LRU eviction
+        try:
+            os.utime(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _lock(self, key: str, max_wait: Optional[float] = None):
+        """Cross-process lock per URL; gives up after LOCK_WAIT (or max_wait if shorter)"""
+        wait = LOCK_WAIT if max_wait is None else max(0.0, min(LOCK_WAIT, max_wait))
+        return lock_file(self.folder / f"{key}.lock", wait, LOCK_STALE, LOCK_POLL)
+
+    def _lookup(self, key: str, now: Optional[float] = None) -> Optional[CachedResponse]:
+        entry = self._read(key)
+        if not self._fresh(entry, now or time.time()):
+            return None
+        self.stats["hits"] += 1
+        self._touch(key)
+        return self._response(entry)
+
+    def lookup(self, url: str, now: Optional[float] = None) -> Optional[CachedResponse]:
+        """Return a fresh cached response for `url` without any network access"""
+        cached = self._lookup(self._key(url), now)
+        if cached is None:
+            # Not a "miss": fetch() counts those, and a probe may be followed by one
+            self.stats["probe_misses"] += 1
+        return cached
+
+    def store(self, url: str, status: int, content: bytes, headers: Dict[str, str], default_ttl: float,
+              now: Optional[float] = None) -> bool:
+        """Store a response if its headers allow it; returns True if stored"""
+        headers = canonical_headers(headers)
+        lifetime = freshness_lifetime(headers, default_ttl)
+        if lifetime is None:
+            return False
+        now = now or time.time()
+        entry = {
+            "url": url,
+            "status": status,
+            "headers": headers,
+            "stored": now,
+            "expires": now + lifetime,
+            "body": base64.b64encode(content).decode("ascii"),
+        }
+        self.folder.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(self._entry_path(self._key(url)), json.dumps(entry, separators=(",", ":")),
+                          durable=False)
+        self.stats["stores"] += 1
+        self.prune()
+        return True
+
+    def fetch(self, url: str, fetcher: Callable[[str, Dict[str, str]], object], default_ttl: float,
+              cacheable=(200, 404), max_wait: Optional[float] = None) -> CachedResponse:
+        """
+        Return the response for `url`, from cache if fresh.
+
+        `fetcher(url, extra_headers)` performs the request and returns an
+        object with status_code, content and headers (e.g. requests.Response).
+        Waiting for another process's lock on `url` is limited to `max_wait`.
+        """
+        key = self._key(url)
+        cached = self._lookup(key)
+        if cached:
+            return cached
+        with self._lock(key, max_wait):
+            # Another process may have fetched it while we waited for the lock
+            cached = self._lookup(key)
+            if cached:
+                return cached
+            entry = self._read(key)
+            conditional = {}
+            if entry:
+                if entry["headers"].get("ETag"):
+                    conditional["If-None-Match"] = entry["headers"]["ETag"]
+                if entry["headers"].get("Last-Modified"):
+                    conditional["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+            resp = fetcher(url, conditional)
+            headers = canonical_headers(resp.headers)
+            if resp.status_code == 304 and entry:
+                self.stats["revalidated"] += 1
+                merged = dict(entry["headers"])
+                merged.update(headers)
+                body = base64.b64decode(entry.get("body", ""))
+                self.store(url, entry["status"], body, merged, default_ttl)
+                return CachedResponse(entry["status"], body, merged, from_cache=True)
+            self.stats["misses"] += 1
+            if resp.status_code in cacheable:
+                self.store(url, resp.status_code, resp.content, headers, default_ttl)
+            return CachedResponse(resp.status_code, resp.content, headers)
+
+    def size(self) -> int:
+        total = 0
+        if self.folder.exists():
+            with os.scandir(self.folder) as it:
+                total = sum(e.stat().st_size for e in it if e.name.endswith(".json"))
+        return total
+
+    def prune(self) -> int:
+        """Evict least recently used entries until the cache fits max_bytes"""
+        if not self.folder.exists():
+            return 0
+        with os.scandir(self.folder) as it:
+            entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in it if e.name.endswith(".json")]
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        self.stats["evictions"] += evicted
+        return evicted
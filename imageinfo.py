@@ -0,0 +1,214 @@
+"""
+Header-only image validation for Bing Wallpaper Downloader
+
+ImageProbe is fed the body of a download chunk by chunk. It checks the magic
+bytes, walks the JPEG segments up to the frame header (SOF) or reads the
+PNG/WebP/BMP header, and so knows the real format and size after the first
+few kilobytes - without decoding any pixels. An HTML error page or an
+unknown format is rejected on the first chunk, before the rest is
+downloaded. finish() then checks that the image is complete (JPEG EOI, PNG
+IEND, WebP/BMP length from the header).
+"""
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+# The frame header of a JPEG normally sits behind EXIF/XMP/ICC segments;
+# a file without one in the first MB is not something we want
+HEADER_LIMIT = 1024 * 1024
+MAGIC_SIZE = 12
+TAIL_SIZE = 16
+CHUNK_SIZE = 64 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+# SOF0-SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+FORMATS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp", "bmp": ".bmp"}
+
+
+class InvalidImage(ValueError):
+    """The data is not a complete image of a supported format"""
+
+
+@dataclass
+class ImageInfo:
+    format: str
+    width: int
+    height: int
+    size: int
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.format}"
+
+    @property
+    def extension(self) -> str:
+        return FORMATS[self.format]
+
+
+def _le(data, start: int, length: int) -> int:
+    return int.from_bytes(bytes(data[start:start + length]), "little")
+
+
+def _be(data, start: int, length: int) -> int:
+    return int.from_bytes(bytes(data[start:start + length]), "big")
+
+
+class ImageProbe:
+    """Incremental format/dimension/truncation check over a streamed body"""
+
+    def __init__(self):
+        self.head = bytearray()
+        self.tail = b""
+        self.size = 0
+        self.format: Optional[str] = None
+        self.dims: Optional[Tuple[int, int]] = None
+        # Total length announced by the header (WebP, BMP)
+        self.expected_size: Optional[int] = None
+        self._jpeg_pos = len(JPEG_SOI)
+
+    def feed(self, chunk):
+        """Add the next chunk; raises InvalidImage as soon as the data cannot be a valid image"""
+        if not chunk:
+            return
+        self.size += len(chunk)
+        self.tail = (self.tail + bytes(chunk[-TAIL_SIZE:]))[-TAIL_SIZE:]
+        if self.dims is None:
+            self.head += chunk
+            self._parse()
+            if self.dims is not None:
+                # Header done; only the tail is needed from now on
+                self.head = bytearray()
+            elif len(self.head) > HEADER_LIMIT:
+                raise InvalidImage(f"No {self.format or 'image'} header in the first {HEADER_LIMIT} bytes")
+        if self.expected_size is not None and self.size > self.expected_size:
+            raise InvalidImage(f"Data after the end of the {self.format} image")
+
+    def watch(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass chunks through, feeding each one to the probe first"""
+        for chunk in chunks:
+            self.feed(chunk)
+            yield chunk
+
+    def finish(self) -> ImageInfo:
+        """Check the end of the image; returns its format and real dimensions"""
+        if self.format is None:
+            raise InvalidImage(f"Too short to be an image ({self.size} bytes)")
+        if self.dims is None:
+            raise InvalidImage(f"Truncated {self.format} header ({self.size} bytes)")
+        if self.format == "jpeg":
+            # Some encoders pad after EOI
+            if not self.tail.rstrip(b"\x00\r\n ").endswith(JPEG_EOI):
+                raise InvalidImage(f"Truncated JPEG: no end-of-image marker after {self.size} bytes")
+        elif self.format == "png":
+            if not self.tail.endswith(PNG_IEND):
+                raise InvalidImage(f"Truncated PNG: no IEND chunk after {self.size} bytes")
+        elif self.size < self.expected_size:
+            raise InvalidImage(f"Truncated {self.format}: {self.size} of {self.expected_size} bytes")
+        return ImageInfo(self.format, self.dims[0], self.dims[1], self.size)
+
+    def _parse(self):
+        h = self.head
+        if self.format is None:
+            if len(h) < MAGIC_SIZE:
+                return
+            self.format = self._detect(h)
+        getattr(self, f"_parse_{self.format}")(h)
+
+    @staticmethod
+    def _detect(h) -> str:
+        if h.startswith(JPEG_SOI + b"\xff"):
+            return "jpeg"
+        if h.startswith(PNG_SIGNATURE):
+            return "png"
+        if h[0:4] == b"RIFF" and h[8:12] == b"WEBP":
+            return "webp"
+        if h[0:2] == b"BM":
+            return "bmp"
+        if bytes(h).lstrip().startswith(b"<"):
+            raise InvalidImage("Got an HTML/XML page instead of an image")
+        raise InvalidImage(f"Unknown image format (starts with {bytes(h[:8]).hex()})")
+
+    def _parse_jpeg(self, h):
+        pos = self._jpeg_pos
+        while pos + 4 <= len(h):
+            if h[pos] != 0xFF:
+                raise InvalidImage(f"Corrupt JPEG: no segment marker at offset {pos}")
+            marker = h[pos + 1]
+            if marker == 0xFF:
+                # Fill byte before a marker
+                pos += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                pos += 2
+                continue
+            if marker in (0xD9, 0xDA):
+                raise InvalidImage("Corrupt JPEG: image data before the frame header")
+            length = _be(h, pos + 2, 2)
+            if length < 2:
+                raise InvalidImage(f"Corrupt JPEG: segment length {length} at offset {pos}")
+            if marker in JPEG_SOF:
+                if pos + 9 > len(h):
+                    break
+                height, width = _be(h, pos + 5, 2), _be(h, pos + 7, 2)
+                self._set_dims(width, height)
+                break
+            pos += 2 + length
+        self._jpeg_pos = pos
+
+    def _parse_png(self, h):
+        if len(h) < 24:
+            return
+        if h[12:16] != b"IHDR":
+            raise InvalidImage("Corrupt PNG: first chunk is not IHDR")
+        self._set_dims(_be(h, 16, 4), _be(h, 20, 4))
+
+    def _parse_webp(self, h):
+        if len(h) < 30:
+            return
+        self.expected_size = _le(h, 4, 4) + 8
+        chunk = bytes(h[12:16])
+        if chunk == b"VP8X":
+            width, height = _le(h, 24, 3) + 1, _le(h, 27, 3) + 1
+        elif chunk == b"VP8 ":
+            if h[23:26] != b"\x9d\x01\x2a":
+                raise InvalidImage("Corrupt WebP: missing VP8 start code")
+            width, height = _le(h, 26, 2) & 0x3FFF, _le(h, 28, 2) & 0x3FFF
+        elif chunk == b"VP8L":
+            if h[20] != 0x2F:
+                raise InvalidImage("Corrupt WebP: missing VP8L signature")
+            bits = _le(h, 21, 4)
+            width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        else:
+            raise InvalidImage(f"Unsupported WebP chunk {chunk!r}")
+        self._set_dims(width, height)
+
+    def _parse_bmp(self, h):
+        if len(h) < 26:
+            return
+        self.expected_size = _le(h, 2, 4)
+        # Height is negative for top-down bitmaps
+        height = int.from_bytes(bytes(h[22:26]), "little", signed=True)
+        self._set_dims(_le(h, 18, 4), abs(height))
+
+    def _set_dims(self, width: int, height: int):
+        if width <= 0 or height <= 0:
+            raise InvalidImage(f"Invalid {self.format} dimensions {width}x{height}")
+        self.dims = (width, height)
+
+
+def inspect(data) -> ImageInfo:
+    """Validate a complete image held in memory (bytes, mmap, memoryview)"""
+    view = memoryview(data)
+    probe = ImageProbe()
+    pos = 0
+    # Header in small steps, then the rest in one go (only its tail is looked at)
+    while probe.dims is None and pos < len(view):
+        probe.feed(view[pos:pos + CHUNK_SIZE])
+        pos += CHUNK_SIZE
+    if pos < len(view):
+        probe.feed(view[pos:])
+    return probe.finish()
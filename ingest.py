@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Bing Wallpaper Downloader - Library ingest and verification
+
+Brings files the downloader did not write itself (collections copied into the
+download folder, folders restored from backup) into the library index in one
+pass. A thread pool hashes files through memory-mapped reads (SHA-256),
+checks format, dimensions and completeness from the same mapping (imageinfo,
+no decoding) and maps filenames back to date and slug.
+
+- ingest (default): only files that are new or changed (size/mtime) are read
+- --verify: every file is re-hashed and compared with the stored digest
+
+Usage:
+    python ingest.py
+    python ingest.py --verify --workers 8
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from bing_wallpaper import load_config
+from imageinfo import ImageInfo, InvalidImage, inspect
+from library_index import CONTENT_FIELDS, LibraryIndex, is_image_name
+from logger import setup_logger
+
+logger = setup_logger('ingest')
+
+# Files below this size are cheaper to read() than to map
+MMAP_MIN_SIZE = 64 * 1024
+
+
+@dataclass
+class IngestReport:
+    files: int = 0
+    nbytes: int = 0
+    seconds: float = 0.0
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    mismatched: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    invalid: Dict[str, str] = field(default_factory=dict)
+    exact_duplicates: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def files_per_s(self) -> float:
+        return round(self.files / self.seconds, 1) if self.seconds else 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        return round(self.nbytes / 1024 / 1024 / self.seconds, 1) if self.seconds else 0.0
+
+
+def _hash_and_inspect(path: Path, inspect_image: bool) -> Tuple[str, int, Optional[ImageInfo], Optional[str]]:
+    h = hashlib.sha256()
+    info, problem = None, None
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_MIN_SIZE:
+            data = f.read()
+            m = None
+        else:
+            data = m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # hashlib releases the GIL for large buffers, so threads hash in parallel
+            h.update(data)
+            if inspect_image:
+                try:
+                    info = inspect(data)
+                except InvalidImage as e:
+                    problem = str(e)
+        finally:
+            if m is not None:
+                m.close()
+    return h.hexdigest(), size, info, problem
+
+
+def sha256_file(path: Path) -> Tuple[str, int]:
+    """SHA-256 and size of a file, hashed straight from a memory map"""
+    digest, size, _, _ = _hash_and_inspect(path, False)
+    return digest, size
+
+
+def scan_file(path: Path) -> dict:
+    """Digest, size, mtime, format and dimensions of one file (header only, no decode)"""
+    digest, size, info, problem = _hash_and_inspect(path, True)
+    fields = {"sha256": digest, "size": size, "mtime": path.stat().st_mtime}
+    if info:
+        fields.update(format=info.format, width=info.width, height=info.height)
+    else:
+        fields["invalid"] = problem
+    return fields
+
+
+def _needs_scan(entry: Optional[dict], size: int, mtime: float, verify: bool) -> bool:
+    if verify or entry is None or not entry.get("sha256"):
+        return True
+    return entry.get("size") != size or entry.get("mtime") != mtime
+
+
+def ingest(folder: Path, workers: int = 4, verify: bool = False) -> Tuple[LibraryIndex, IngestReport]:
+    """Build or repair the library index for `folder`; see the module docstring"""
+    start = time.perf_counter()
+    report = IngestReport()
+    index = LibraryIndex(folder)
+    index.load()
+
+    listing: Dict[str, os.stat_result] = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            if is_image_name(entry.name) and entry.is_file():
+                listing[entry.name] = entry.stat()
+
+    for name in [n for n in index.names() if n not in listing]:
+        index.remove(name)
+        report.removed += 1
+
+    todo = [name for name, st in listing.items()
+            if _needs_scan(index.get(name), st.st_size, st.st_mtime, verify)]
+    report.unchanged = len(listing) - len(todo)
+
+    def work(name: str):
+        try:
+            return name, scan_file(folder / name), None
+        except OSError as e:
+            return name, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for name, fields, error in pool.map(work, todo):
+            if error is not None:
+                logger.warning(f"Could not read {name}: {error}")
+                report.errors.append(name)
+                continue
+            report.files += 1
+            report.nbytes += fields["size"]
+            old = index.get(name)
+            same_file = old is not None and old.get("size") == fields["size"] and old.get("mtime") == fields["mtime"]
+            if old is None:
+                report.added += 1
+            elif same_file and old.get("sha256") == fields["sha256"]:
+                report.unchanged += 1
+            else:
+                if same_file and old.get("sha256"):
+                    # Same size and date but other content: bit rot or a bad restore
+                    report.mismatched.append(name)
+                report.updated += 1
+            # Without a recorded digest, a new size or mtime is the only sign of other content
+            replaced = old is not None and (old["sha256"] != fields["sha256"] if old.get("sha256") else not same_file)
+            if replaced:
+                # Restored or replaced by another image: analytics, hashes and duplicate marks are stale
+                for key in CONTENT_FIELDS:
+                    old.pop(key, None)
+            if fields.get("invalid"):
+                report.invalid[name] = fields["invalid"]
+            elif old is not None:
+                # Replaced by a good copy since the last scan
+                old.pop("invalid", None)
+            size, mtime = fields.pop("size"), fields.pop("mtime")
+            index.record(name, size, mtime, **fields)
+
+    by_digest: Dict[str, List[str]] = {}
+    for name, entry in index.oldest_first():
+        if entry.get("sha256"):
+            by_digest.setdefault(entry["sha256"], []).append(name)
+    report.exact_duplicates = {names[0]: names[1:] for names in by_digest.values() if len(names) > 1}
+
+    index.save()
+    report.seconds = time.perf_counter() - start
+    return index, report
+
+
+def main():
+    config = load_config()
+    p = argparse.ArgumentParser("Add existing wallpapers to the library index and verify them")
+    p.add_argument("--folder", default=config.get("download_folder", str(Path.home() / "Pictures" / "BingWallpapers")))
+    p.add_argument("--verify", action="store_true", help="Re-hash every file and compare with the index")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Hashing threads")
+    args = p.parse_args()
+
+    folder = Path(args.folder)
+    if not folder.exists():
+        print(f"Ordner nicht gefunden: {folder}", file=sys.stderr)
+        return 1
+
+    _, report = ingest(folder, args.workers, args.verify)
+    logger.info(f"Ingest: {report.files} file(s), {report.nbytes} bytes in {report.seconds:.2f}s "
+                f"({report.files_per_s} files/s, {report.mb_per_s} MB/s), added={report.added} "
+                f"updated={report.updated} removed={report.removed} mismatched={len(report.mismatched)}")
+    print(f"Gelesen: {report.files} Datei(en), {report.nbytes / 1024 / 1024:.1f} MB in {report.seconds:.2f}s "
+          f"({report.files_per_s} Dateien/s, {report.mb_per_s} MB/s)")
+    print(f"Neu: {report.added}, aktualisiert: {report.updated}, entfernt: {report.removed}, "
+          f"unverändert: {report.unchanged}")
+    for name in report.mismatched:
+        print(f"  ! Inhalt geändert: {name}")
+    for name in report.errors:
+        print(f"  ! Nicht lesbar: {name}")
+    for name, problem in report.invalid.items():
+        print(f"  ! Beschädigt: {name} ({problem})")
+    for original, copies in report.exact_duplicates.items():
+        print(f"{original}:")
+        for name in copies:
+            print(f"  = {name}")
+    return 1 if report.mismatched or report.errors or report.invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
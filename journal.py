@@ -0,0 +1,169 @@
+"""
+Crash-safe run journal for Bing Wallpaper Downloader
+
+Each run records the images it plans to save and moves every image through
+planned -> downloading -> written -> verified. The journal is rewritten
+atomically on every transition and deleted when the run completes. If a run
+is killed (logoff, sleep), the next run on the same day picks the journal up:
+it skips the metadata request, does not download verified images again and
+reuses the filenames it already chose, so "unique" mode does not create stray
+_1 copies. A journal from an earlier day is not resumed, since Bing has a new
+image by then; its saved images are carried over into the new run instead.
+"""
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fileutil import atomic_write_text
+
+JOURNAL_NAME = "run_journal.json"
+JOURNAL_VERSION = 1
+
+PLANNED = "planned"
+DOWNLOADING = "downloading"
+WRITTEN = "written"
+VERIFIED = "verified"
+STATES = (PLANNED, DOWNLOADING, WRITTEN, VERIFIED)
+
+
+def image_key(img: dict) -> str:
+    """Stable identifier of a Bing image across runs"""
+    return f"{img.get('startdate', '')}:{img.get('urlbase') or img.get('url', '')}"
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def same_day(a: float, b: float) -> bool:
+    """Both timestamps fall on the same local calendar day (Bing publishes one image per day)"""
+    return time.localtime(a)[:3] == time.localtime(b)[:3]
+
+
+class RunJournal:
+    """Per-run image state, persisted next to the config file"""
+
+    def __init__(self, path: Path, out_dir: Path, mode: str, logger=None):
+        self.path = Path(path)
+        self.out_dir = Path(out_dir)
+        self.mode = mode
+        self.logger = logger
+        self.data: dict = {}
+        # Saved images of an earlier day's journal, merged into the next begin()
+        self.carried: Dict[str, dict] = {}
+
+    @property
+    def active(self) -> bool:
+        return bool(self.data.get("images"))
+
+    def load(self, now: Optional[float] = None) -> bool:
+        """
+        Load an unfinished journal for the same folder and mode; returns True if resumable.
+
+        Only a journal started today is resumed. From an older one the saved
+        images are kept for begin(), so the fresh run does not download them again.
+        """
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        now = now if now is not None else time.time()
+        if data.get("version") != JOURNAL_VERSION or data.get("out_dir") != str(self.out_dir) \
+                or data.get("mode") != self.mode:
+            self.discard()
+            return False
+        if not same_day(data.get("started", 0), now):
+            self.carried = {key: entry for key, entry in data.get("images", {}).items()
+                            if entry["state"] in (WRITTEN, VERIFIED)}
+            return False
+        self.data = data
+        return self.active
+
+    def begin(self, market: str, imgs: List[dict]):
+        """Start a new journal for the images returned by the metadata request"""
+        images = {}
+        for i, img in enumerate(imgs):
+            key = image_key(img)
+            images[key] = {**self.carried.get(key, {"state": PLANNED}), "order": i, "img": img}
+        self.data = {
+            "version": JOURNAL_VERSION,
+            "started": time.time(),
+            "out_dir": str(self.out_dir),
+            "mode": self.mode,
+            "market": market,
+            "images": images,
+        }
+        self.save()
+
+    def save(self):
+        try:
+            # No fsync: losing the journal on power loss only means starting over
+            atomic_write_text(self.path, json.dumps(self.data, separators=(",", ":")), durable=False)
+        except OSError as e:
+            # The journal only makes resuming cheaper; never fail the run because of it
+            if self.logger:
+                self.logger.warning(f"Could not write run journal: {e}")
+
+    def entry(self, img: dict) -> Optional[dict]:
+        return self.data.get("images", {}).get(image_key(img))
+
+    def order(self, img: dict, default: int) -> int:
+        """Position of an image in the original metadata response"""
+        entry = self.entry(img)
+        return entry["order"] if entry else default
+
+    def mark(self, img: dict, state: str, **fields):
+        """Move an image to `state` and persist the journal"""
+        entry = self.entry(img)
+        if entry is None:
+            return
+        entry["state"] = state
+        entry.update(fields)
+        self.save()
+
+    def images(self) -> List[dict]:
+        """Image metadata in the original order"""
+        entries = sorted(self.data.get("images", {}).values(), key=lambda e: e["order"])
+        return [e["img"] for e in entries]
+
+    def verify(self, img: dict) -> Optional[Path]:
+        """
+        Return the saved file of an image if it is complete on disk.
+
+        A "written" entry whose file matches the recorded size and digest is
+        promoted to "verified"; anything else has to be downloaded again.
+        """
+        entry = self.entry(img)
+        if not entry or entry["state"] not in (WRITTEN, VERIFIED) or not entry.get("filename"):
+            return None
+        path = self.out_dir / entry["filename"]
+        try:
+            if path.stat().st_size != entry.get("size"):
+                return None
+            if entry["state"] == WRITTEN and sha256_bytes(path.read_bytes()) != entry.get("sha256"):
+                return None
+        except OSError:
+            return None
+        if entry["state"] != VERIFIED:
+            self.mark(img, VERIFIED)
+        return path
+
+    def counts(self) -> Dict[str, int]:
+        counts = {state: 0 for state in STATES}
+        for entry in self.data.get("images", {}).values():
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        return counts
+
+    def finish(self):
+        """The run completed: remove the journal"""
+        self.discard()
+        self.data = {}
+        self.carried = {}
+
+    def discard(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,159 @@
+"""
+Persistent index of the wallpaper library for Bing Wallpaper Downloader
+
+The index lives next to the wallpapers (.library_index.json) and records size,
+modification time, date and slug per file. Keeping it up to date only needs a
+directory listing: files already in the index are not stat'ed again.
+"""
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fileutil import atomic_write_text
+
+INDEX_NAME = ".library_index.json"
+INDEX_VERSION = 1
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+# Entry fields that describe the file's bytes rather than the picture in it
+FILE_FIELDS = ("size", "mtime", "sha256")
+# Entry fields computed from the picture; stale once a file is replaced by another image
+CONTENT_FIELDS = ("luma", "contrast", "colors", "phash", "dhash", "duplicate_of", "archived")
+
+# build_filename() produces "<YYYY-MM-DD>_<slug or title>[_N].<ext>"
+_FILENAME_RE = re.compile(r"^(?P<date>\d{4}-\d{2}-\d{2})_(?P<slug>.+?)(?:_(?P<n>\d+))?$")
+# Files saved straight from Bing: "OHR.<slug>_<market><id>_<resolution>"
+_BING_NAME_RE = re.compile(r"^(?:th\?id=)?OHR\.(?P<slug>[^_]+)_")
+
+
+def parse_filename(name: str) -> Tuple[Optional[str], Optional[str]]:
+    """Map a wallpaper filename back to (date, slug) using the build_filename conventions"""
+    stem = Path(name).stem
+    m = _FILENAME_RE.match(stem)
+    if m:
+        return m["date"], m["slug"]
+    m = _BING_NAME_RE.match(stem)
+    if m:
+        # Same slug as extract_slug(); the date is not part of these names
+        return None, m["slug"]
+    return None, None
+
+
+def entry_date(entry: dict) -> str:
+    """Date of an index entry, falling back to its modification day for foreign filenames"""
+    return entry.get("date") or time.strftime("%Y-%m-%d", time.localtime(entry.get("mtime", 0)))
+
+
+def is_image_name(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class LibraryIndex:
+    """Filename-keyed index of the images in one download folder"""
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.path = self.folder / INDEX_NAME
+        self.entries: Dict[str, dict] = {}
+        self.dirty = False
+
+    @classmethod
+    def open(cls, folder: Path, sync: bool = True) -> "LibraryIndex":
+        """Load the index for `folder` and optionally reconcile it with the folder listing"""
+        index = cls(folder)
+        index.load()
+        if sync:
+            index.sync()
+        return index
+
+    def load(self) -> bool:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != INDEX_VERSION:
+            return False
+        self.entries = data.get("files", {})
+        return True
+
+    def save(self, force: bool = False):
+        """Write the index atomically if anything changed"""
+        if not (self.dirty or force):
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(self.path, json.dumps({"version": INDEX_VERSION, "files": self.entries},
+                                                separators=(",", ":")))
+        self.dirty = False
+
+    def sync(self) -> Tuple[int, int]:
+        """
+        Reconcile with the folder: add unknown images, drop entries whose file is gone.
+
+        Returns (added, removed). Only files that are new to the index are stat'ed.
+        """
+        if not self.folder.exists():
+            removed = len(self.entries)
+            if removed:
+                self.entries.clear()
+                self.dirty = True
+            return 0, removed
+        seen = set()
+        added = 0
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not is_image_name(entry.name) or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                if entry.name not in self.entries:
+                    st = entry.stat()
+                    self._put(entry.name, st.st_size, st.st_mtime)
+                    added += 1
+        gone = [name for name in self.entries if name not in seen]
+        for name in gone:
+            del self.entries[name]
+        if gone:
+            self.dirty = True
+        return added, len(gone)
+
+    def _put(self, name: str, size: int, mtime: float, **fields) -> dict:
+        date, slug = parse_filename(name)
+        entry = self.entries.get(name, {})
+        entry.update({"size": size, "mtime": mtime, "date": date, "slug": slug})
+        entry.update(fields)
+        self.entries[name] = entry
+        self.dirty = True
+        return entry
+
+    def add(self, path: Path, **fields) -> dict:
+        """Record (or refresh) a file that was just written"""
+        st = path.stat()
+        return self._put(path.name, st.st_size, st.st_mtime, added=time.time(), **fields)
+
+    def record(self, name: str, size: int, mtime: float, **fields) -> dict:
+        """Record a file whose size and mtime the caller already has (e.g. from a scan)"""
+        return self._put(name, size, mtime, **fields)
+
+    def update(self, name: str, **fields):
+        """Attach extra fields to an existing entry"""
+        if name in self.entries:
+            self.entries[name].update(fields)
+            self.dirty = True
+
+    def remove(self, name: str):
+        if self.entries.pop(name, None) is not None:
+            self.dirty = True
+
+    def get(self, name: str) -> Optional[dict]:
+        return self.entries.get(name)
+
+    def names(self) -> Iterable[str]:
+        return self.entries.keys()
+
+    def total_bytes(self) -> int:
+        return sum(e.get("size", 0) for e in self.entries.values())
+
+    def oldest_first(self) -> List[Tuple[str, dict]]:
+        """Entries ordered oldest first by filename date, then modification time"""
+        return sorted(self.entries.items(), key=lambda kv: (entry_date(kv[1]), kv[1].get("mtime", 0)))
@@ -1,10 +1,76 @@
 """
 Shared logging configuration for Bing Wallpaper Downloader
+
+Log calls only put records on an in-memory queue; a QueueListener thread does
+the formatting and disk I/O, so download and tray code never wait on the disk.
 """
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
+from typing import Dict
+
+# Default log directory: %APPDATA%/BingWallpaperDownloader/logs
+LOG_DIR = Path.home() / "AppData" / "Roaming" / "BingWallpaperDownloader" / "logs"
+
+# Minimum seconds between two scans of the log directory for old files
+CLEANUP_INTERVAL = 3600
+
+# Running listeners by logger name, stopped (and flushed) at interpreter exit
+_listeners: Dict[str, logging.handlers.QueueListener] = {}
+
+
+class DailyFileHandler(logging.FileHandler):
+    """
+    File handler writing to <log_dir>/<prefix>_YYYYMMDD.log.
+
+    The file is switched when the first record after local midnight arrives,
+    so a process running for weeks still writes one file per day. Old logs are
+    removed from the emitting thread at most once per `cleanup_interval`.
+    """
+
+    def __init__(self, log_dir: Path, prefix: str, max_age_days: int = 7,
+                 cleanup_interval: float = CLEANUP_INTERVAL):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.max_age_days = max_age_days
+        self.cleanup_interval = cleanup_interval
+        self._next_cleanup = 0.0
+        now = time.time()
+        self._rollover_at = self._next_midnight(now)
+        super().__init__(self._path_for(now), encoding='utf-8', delay=True)
+
+    def _path_for(self, timestamp: float) -> Path:
+        return self.log_dir / f"{self.prefix}_{datetime.fromtimestamp(timestamp).strftime('%Y%m%d')}.log"
+
+    @staticmethod
+    def _next_midnight(timestamp: float) -> float:
+        day = datetime.fromtimestamp(timestamp).date() + timedelta(days=1)
+        return datetime(day.year, day.month, day.day).timestamp()
+
+    def do_rollover(self, timestamp: float):
+        """Close the current file and continue in the file for `timestamp`'s day"""
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = str(self._path_for(timestamp).absolute())
+        self._rollover_at = self._next_midnight(timestamp)
+        # A new day is a good moment to drop logs that just aged out
+        self._next_cleanup = 0.0
+
+    def emit(self, record: logging.LogRecord):
+        if record.created >= self._rollover_at:
+            self.do_rollover(record.created)
+        now = time.time()
+        if now >= self._next_cleanup:
+            self._next_cleanup = now + self.cleanup_interval
+            cleanup_old_logs(self.log_dir, self.max_age_days)
+        super().emit(record)
+
 
 def setup_logger(name: str, log_dir: Path = None, max_age_days: int = 7) -> logging.Logger:
     """
@@ -20,15 +86,11 @@ def setup_logger(name: str, log_dir: Path = None, max_age_days: int = 7) -> logg
     """
     # Determine log directory
     if log_dir is None:
-        appdata = Path.home() / "AppData" / "Roaming" / "BingWallpaperDownloader"
-        log_dir = appdata / "logs"
+        log_dir = LOG_DIR
     
     # Create log directory if it doesn't exist
     log_dir.mkdir(parents=True, exist_ok=True)
     
-    # Clean up old log files
-    cleanup_old_logs(log_dir, max_age_days)
-    
     # Create logger
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
@@ -37,9 +99,8 @@ def setup_logger(name: str, log_dir: Path = None, max_age_days: int = 7) -> logg
     if logger.handlers:
         return logger
     
-    # File handler - daily log file
-    log_file = log_dir / f"{name}_{datetime.now().strftime('%Y%m%d')}.log"
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    # File handler - one file per day, rolled at midnight
+    file_handler = DailyFileHandler(log_dir, name, max_age_days)
     file_handler.setLevel(logging.INFO)
     
     # Console handler (only if console is available)
@@ -54,13 +115,33 @@ def setup_logger(name: str, log_dir: Path = None, max_age_days: int = 7) -> logg
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
     
-    # Add handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # The logger only enqueues; the listener thread writes to the real handlers
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    _listeners[name] = listener
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
     
     return logger
 
 
+def shutdown_logging():
+    """Stop all queue listeners, writing out any records still queued"""
+    while _listeners:
+        _, listener = _listeners.popitem()
+        try:
+            listener.stop()
+        except Exception:
+            pass
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(shutdown_logging)
+
+
 def cleanup_old_logs(log_dir: Path, max_age_days: int):
     """Delete log files older than max_age_days"""
     try:
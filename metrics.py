@@ -0,0 +1,234 @@
+"""
+Machine-readable metrics export for Bing Wallpaper Downloader
+
+Counters, gauges and histograms are kept in plain dicts so recording is a
+dict update. The registry is persisted as JSON (so counters keep growing
+across short-lived downloader runs) and exported as an OpenMetrics text file
+that a node-exporter style textfile collector can scrape. Both files are
+replaced atomically; update_locked() serialises the load-update-write of
+processes sharing one state file.
+"""
+import bisect
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from fileutil import atomic_write_text, lock_file
+
+# Default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Buckets for interactive actions, which should finish within milliseconds
+ACTION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Cross-process lock around read-modify-write of a state file
+LOCK_WAIT = 10.0
+LOCK_STALE = 60.0
+LOCK_POLL = 0.05
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    Minimal metrics registry with OpenMetrics and JSON export.
+
+    Metric families are declared once with a type and help text; samples are
+    addressed by family name plus optional labels.
+    """
+
+    def __init__(self, prefix: str = "bing_wallpaper"):
+        self.prefix = prefix
+        self._families: Dict[str, dict] = {}
+        self._last_flush = 0.0
+
+    # --- declaration -----------------------------------------------------
+
+    def counter(self, name: str, help_text: str):
+        self._families.setdefault(name, {"type": "counter", "help": help_text, "samples": {}})
+
+    def gauge(self, name: str, help_text: str):
+        self._families.setdefault(name, {"type": "gauge", "help": help_text, "samples": {}})
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._families.setdefault(name, {
+            "type": "histogram", "help": help_text, "buckets": list(buckets), "samples": {},
+        })
+
+    # --- recording -------------------------------------------------------
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        samples = self._families[name]["samples"]
+        key = _label_key(labels) if labels else ()
+        samples[key] = samples.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        self._families[name]["samples"][_label_key(labels) if labels else ()] = value
+
+    def observe(self, name: str, value: float, **labels):
+        family = self._families[name]
+        key = _label_key(labels) if labels else ()
+        sample = family["samples"].get(key)
+        if sample is None:
+            sample = family["samples"][key] = {"counts": [0] * len(family["buckets"]), "count": 0, "sum": 0.0}
+        # Non-cumulative bucket counts; cumulated on export
+        i = bisect.bisect_left(family["buckets"], value)
+        if i < len(sample["counts"]):
+            sample["counts"][i] += 1
+        sample["count"] += 1
+        sample["sum"] += value
+
+    def value(self, name: str, **labels):
+        """Current value of a counter/gauge sample (or histogram state)"""
+        return self._families[name]["samples"].get(_label_key(labels) if labels else ())
+
+    def samples(self, name: str) -> dict:
+        """All samples of a family by label key"""
+        return dict(self._families[name]["samples"])
+
+    # --- persistence -----------------------------------------------------
+
+    def to_json(self) -> dict:
+        families = {}
+        for name, family in self._families.items():
+            entry = {k: v for k, v in family.items() if k != "samples"}
+            entry["samples"] = [{"labels": dict(key), "value": value} for key, value in family["samples"].items()]
+            families[name] = entry
+        return {"prefix": self.prefix, "updated": time.time(), "metrics": families}
+
+    def load(self, path: Path) -> bool:
+        """Continue from a previously written JSON state; declared families keep their buckets"""
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        for name, entry in data.get("metrics", {}).items():
+            family = self._families.get(name)
+            if family is None or family["type"] != entry.get("type"):
+                continue
+            if family["type"] == "histogram" and entry.get("buckets") != family["buckets"]:
+                # Bucket layout changed; start this histogram over
+                continue
+            for sample in entry.get("samples", []):
+                family["samples"][_label_key(sample.get("labels", {}))] = sample["value"]
+        return True
+
+    def to_openmetrics(self) -> str:
+        lines = []
+        for name, family in sorted(self._families.items()):
+            full = f"{self.prefix}_{name}"
+            kind = family["type"]
+            lines.append(f"# TYPE {full} {kind}")
+            lines.append(f"# HELP {full} {family['help']}")
+            for key, value in family["samples"].items():
+                if kind == "counter":
+                    lines.append(f"{full}_total{_format_labels(key)} {value}")
+                elif kind == "gauge":
+                    lines.append(f"{full}{_format_labels(key)} {value}")
+                else:
+                    cumulative = 0
+                    for bound, count in zip(family["buckets"], value["counts"]):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{_format_labels(key, ('le', repr(float(bound))))} {cumulative}")
+                    lines.append(f"{full}_bucket{_format_labels(key, ('le', '+Inf'))} {value['count']}")
+                    lines.append(f"{full}_count{_format_labels(key)} {value['count']}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {value['sum']}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, out_dir: Path, name: str):
+        """Atomically write <name>.json (state) and <name>.prom (OpenMetrics) into out_dir"""
+        atomic_write_text(out_dir / f"{name}.json", json.dumps(self.to_json(), indent=2))
+        atomic_write_text(out_dir / f"{name}.prom", self.to_openmetrics())
+        self._last_flush = time.monotonic()
+
+    def flush_if_due(self, out_dir: Path, name: str, interval: float = 60.0) -> bool:
+        """Write at most once per `interval` seconds; for long-running processes"""
+        if time.monotonic() - self._last_flush < interval:
+            return False
+        self.write(out_dir, name)
+        return True
+
+
+def update_locked(registry: MetricsRegistry, out_dir: Path, name: str,
+                  update: Callable[[MetricsRegistry], None]):
+    """Load <name>.json into registry, apply `update` and write it back under <name>.lock
+
+    Without the lock, two downloader runs finishing together both load the
+    same state and the second write drops the first run's increments.
+    """
+    with lock_file(out_dir / f"{name}.lock", LOCK_WAIT, LOCK_STALE, LOCK_POLL):
+        registry.load(out_dir / f"{name}.json")
+        update(registry)
+        registry.write(out_dir, name)
+
+
+def downloader_registry() -> MetricsRegistry:
+    """Registry with the metric families reported by the downloader"""
+    r = MetricsRegistry()
+    r.counter("runs", "Downloader runs by result")
+    r.histogram("run_duration_seconds", "Wall time of a downloader run")
+    r.counter("bytes_downloaded", "Image bytes downloaded from Bing")
+    r.counter("bytes_skipped", "Downloaded bytes not written because the file already existed")
+    r.counter("images_written", "Image files written to the download folder")
+    r.counter("candidate_404", "Candidate image URLs that returned HTTP 404")
+    r.counter("candidate_misses", "Candidate image URLs that failed for any reason")
+    r.counter("candidate_invalid", "Candidate images rejected as truncated or not an image")
+    r.counter("market_fallbacks", "Runs that had to use a fallback market")
+    r.counter("http_cache_requests", "HTTP cache lookups by result (hit, miss, probe_miss, revalidated)")
+    r.counter("http_cache_evictions", "HTTP cache entries evicted by the size cap")
+    r.counter("shared_cache_requests", "Shared (fleet) image cache lookups by result (hit, miss)")
+    r.histogram("wallpaper_set_seconds", "Latency of setting the desktop wallpaper")
+    r.gauge("last_run_timestamp_seconds", "Unix time of the last finished run")
+    r.gauge("last_run_success", "1 if the last run succeeded, 0 otherwise")
+    return r
+
+
+def record_run(registry: MetricsRegistry, summary: dict, success: bool):
+    """Fold a telemetry run summary into the cumulative downloader metrics"""
+    counters = summary.get("counters", {})
+    spans = summary.get("spans", {})
+    registry.inc("runs", result="success" if success else "failure")
+    registry.observe("run_duration_seconds", summary.get("wall_s", 0.0))
+    registry.inc("bytes_downloaded", counters.get("bytes_downloaded", 0))
+    registry.inc("bytes_skipped", counters.get("bytes_skipped", 0))
+    registry.inc("images_written", counters.get("files_written", 0))
+    registry.inc("candidate_404", counters.get("candidate_404s", 0))
+    registry.inc("candidate_misses", counters.get("candidate_misses", 0))
+    registry.inc("candidate_invalid", counters.get("candidate_invalid", 0))
+    registry.inc("market_fallbacks", counters.get("market_fallbacks", 0))
+    for result, key in (("hit", "http_cache_hits"), ("miss", "http_cache_misses"),
+                        ("probe_miss", "http_cache_probe_misses"), ("revalidated", "http_cache_revalidated")):
+        registry.inc("http_cache_requests", counters.get(key, 0), result=result)
+    registry.inc("http_cache_evictions", counters.get("http_cache_evictions", 0))
+    for result, key in (("hit", "shared_cache_hits"), ("miss", "shared_cache_misses")):
+        registry.inc("shared_cache_requests", counters.get(key, 0), result=result)
+    if "set_wallpaper" in spans:
+        registry.observe("wallpaper_set_seconds", spans["set_wallpaper"]["total_s"])
+    registry.set("last_run_timestamp_seconds", round(time.time()))
+    registry.set("last_run_success", 1 if success else 0)
+
+
+def tray_registry() -> MetricsRegistry:
+    """Registry with the metric families reported by the tray app"""
+    r = MetricsRegistry()
+    r.counter("tray_actions", "Tray menu actions by name")
+    r.histogram("tray_wallpaper_set_seconds", "Latency of setting the desktop wallpaper from the tray")
+    r.counter("tray_wallpaper_set_failures", "Failed attempts to set the wallpaper from the tray")
+    r.counter("tray_menu_redraws", "Menu redraws after coalesced state changes")
+    r.histogram("tray_action_seconds", "Tray menu action latency by handler (diagnostics mode only)",
+                buckets=ACTION_BUCKETS)
+    return r
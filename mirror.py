@@ -0,0 +1,227 @@
+"""
+Caching HTTP mirror of Bing's wallpaper endpoints
+
+One machine runs `bing_wallpaper.py --mirror`; the desktops set
+"bing_base" in their config to that machine (e.g. "http://wallpaper-mirror:8080").
+The mirror answers /HPImageArchive.aspx and the image paths (/th?id=…) from
+its own cache and only asks Bing on a miss, so a fleet of desktops causes one
+upstream request per image.
+
+- Metadata is kept in an HttpCache (short TTL, revalidated like on a desktop).
+- Images are immutable and stored as plain files, which are sent to clients
+  with socket.sendfile() (zero-copy where the OS supports it). They are
+  validated (imageinfo) while streaming in; bad upstream data is not cached.
+- Concurrent misses for the same resource share one upstream request.
+- Every connection is handled in its own thread (ThreadingHTTPServer).
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import urllib.parse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from http_cache import HttpCache
+from imageinfo import ImageProbe, InvalidImage
+
+METADATA_PATH = "/HPImageArchive.aspx"
+# Paths Bing serves wallpaper images from
+IMAGE_PREFIXES = ("/th", "/az/")
+IMAGES_DIR = "images"
+METADATA_DIR = "metadata"
+CHUNK_SIZE = 64 * 1024
+# Clients may keep images forever; metadata only as long as the mirror does
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _discard(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class MirrorStore:
+    """Upstream access and on-disk storage behind the request handler"""
+
+    def __init__(self, folder: Path, upstream: str, headers: Dict[str, str],
+                 metadata_ttl: float, negative_ttl: float, logger=None):
+        self.folder = Path(folder)
+        self.upstream = upstream.rstrip("/")
+        self.headers = dict(headers)
+        self.metadata_ttl = metadata_ttl
+        self.negative_ttl = negative_ttl
+        self.logger = logger
+        self.metadata = HttpCache(self.folder / METADATA_DIR)
+        self.session = requests.Session()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "upstream_errors": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _get(self, url: str, extra: Optional[Dict[str, str]] = None, stream: bool = False):
+        return self.session.get(url, headers={**self.headers, **(extra or {})}, timeout=30, stream=stream)
+
+    def image_path(self, path_qs: str) -> Tuple[Path, Path]:
+        """Data file and its .json sidecar (content type) for a request path"""
+        key = hashlib.sha256(path_qs.encode("utf-8")).hexdigest()
+        base = self.folder / IMAGES_DIR / key[:2] / key
+        return base, base.with_suffix(".json")
+
+    def metadata_response(self, path_qs: str):
+        """Cached (or freshly fetched) HPImageArchive response"""
+        url = self.upstream + path_qs
+        before = self.metadata.stats["misses"]
+        response = self.metadata.fetch(url, self._get, self.metadata_ttl, cacheable=(200,))
+        self._count("misses" if self.metadata.stats["misses"] > before else "hits")
+        return response
+
+    def image_file(self, path_qs: str) -> Tuple[int, Optional[Path], str]:
+        """
+        (status, file, content_type) for an image path, fetching it on a miss.
+
+        The upstream body is streamed into a temp file and renamed into place,
+        so concurrent readers only ever see complete files.
+        """
+        data, sidecar = self.image_path(path_qs)
+        if data.exists():
+            self._count("hits")
+            return HTTPStatus.OK, data, self._content_type(sidecar)
+        url = self.upstream + path_qs
+        with self._lock_for(path_qs):
+            if data.exists():
+                self._count("hits")
+                return HTTPStatus.OK, data, self._content_type(sidecar)
+            known = self.metadata.lookup(url)
+            if known is not None and known.status_code == 404:
+                self._count("hits")
+                return HTTPStatus.NOT_FOUND, None, ""
+            self._count("misses")
+            with self._get(url, stream=True) as r:
+                if r.status_code == 404:
+                    self.metadata.store(url, 404, b"", r.headers, self.negative_ttl)
+                    return HTTPStatus.NOT_FOUND, None, ""
+                content_type = r.headers.get("Content-Type", "")
+                if r.status_code != 200 or not content_type.startswith("image/"):
+                    # Error pages and redirects to HTML are not worth keeping
+                    self._count("upstream_errors")
+                    return HTTPStatus.BAD_GATEWAY, None, ""
+                data.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=str(data.parent), prefix=f".{data.name}.", suffix=".tmp")
+                probe = ImageProbe()
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        for chunk in probe.watch(r.iter_content(CHUNK_SIZE)):
+                            f.write(chunk)
+                    info = probe.finish()
+                    content_type = info.content_type
+                    sidecar.write_text(json.dumps({"content_type": content_type, "url": url}), encoding="utf-8")
+                    os.replace(tmp, data)
+                except InvalidImage as e:
+                    # Never hand a truncated or fake image to the whole fleet
+                    _discard(tmp)
+                    self._count("upstream_errors")
+                    if self.logger:
+                        self.logger.warning(f"Rejected upstream {path_qs}: {e}")
+                    return HTTPStatus.BAD_GATEWAY, None, ""
+                except BaseException:
+                    _discard(tmp)
+                    raise
+            if self.logger:
+                self.logger.info(f"Mirrored {path_qs} ({data.stat().st_size} bytes)")
+            return HTTPStatus.OK, data, content_type
+
+    @staticmethod
+    def _content_type(sidecar: Path) -> str:
+        try:
+            return json.loads(sidecar.read_text(encoding="utf-8"))["content_type"]
+        except (OSError, ValueError, KeyError):
+            return "image/jpeg"
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """GET handler serving metadata and images from a MirrorStore"""
+
+    store: MirrorStore = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        try:
+            if path == METADATA_PATH:
+                self._send_metadata()
+            elif path.startswith(IMAGE_PREFIXES):
+                self._send_image()
+            else:
+                self._send_status(HTTPStatus.NOT_FOUND)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-transfer
+            pass
+        except requests.RequestException as e:
+            self.store._count("upstream_errors")
+            self.log_error(f"Upstream request for {self.path} failed: {e}")
+            self._send_status(HTTPStatus.BAD_GATEWAY)
+
+    def _send_status(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _send_metadata(self):
+        response = self.store.metadata_response(self.path)
+        self.send_response(response.status_code)
+        self.send_header("Content-Type", response.headers.get("Content-Type", "application/json"))
+        self.send_header("Content-Length", str(len(response.content)))
+        self.send_header("Cache-Control", f"max-age={int(self.store.metadata_ttl)}")
+        self.end_headers()
+        self.wfile.write(response.content)
+
+    def _send_image(self):
+        status, path, content_type = self.store.image_file(self.path)
+        if path is None:
+            self._send_status(status)
+            return
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(size))
+            self.send_header("Cache-Control", IMAGE_CACHE_CONTROL)
+            self.end_headers()
+            self.wfile.flush()
+            try:
+                # Kernel copies file -> socket without going through Python buffers
+                self.connection.sendfile(f)
+            except (AttributeError, OSError, ValueError):
+                f.seek(0)
+                shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def log_message(self, format, *args):
+        if self.store.logger:
+            self.store.logger.debug(f"{self.address_string()} {format % args}")
+
+
+class MirrorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def create_server(store: MirrorStore, bind: str = "0.0.0.0", port: int = 8080) -> MirrorServer:
+    """HTTP server for `store`; call serve_forever() on it"""
+    handler = type("BoundMirrorHandler", (MirrorHandler,), {"store": store})
+    return MirrorServer((bind, port), handler)
@@ -0,0 +1,169 @@
+"""
+Perceptual hashing and near-duplicate lookup for Bing Wallpaper Downloader
+
+Bing serves the same photo with different crops and resolutions across markets,
+so byte digests miss these duplicates. Images are decoded at reduced size
+(JPEG draft mode), converted to grayscale and hashed with NumPy:
+
+- dHash: 9x8 horizontal gradient signs
+- pHash: signs of the low 8x8 DCT coefficients of a 32x32 image vs. their median
+
+Both are 64-bit integers compared by Hamming distance. A BK-tree keeps lookups
+sub-linear in the size of the library.
+"""
+import io
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+HASH_KINDS = ("phash", "dhash")
+DEFAULT_THRESHOLD = 10
+
+_DCT_SIZE = 32
+_LOW_FREQ = 8
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis, so dct2(x) = C @ x @ C.T"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    c = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    c[0] /= np.sqrt(2.0)
+    return c.astype(np.float32)
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _pack(bits: np.ndarray) -> List[int]:
+    """Pack rows of 64 booleans into Python ints (first bit = most significant)"""
+    packed = np.packbits(bits.reshape(len(bits), -1).astype(np.uint8), axis=1)
+    return [int.from_bytes(row.tobytes(), "big") for row in packed]
+
+
+def dhash_batch(pixels: np.ndarray) -> List[int]:
+    """dHash for a (n, 8, 9) grayscale batch"""
+    return _pack(pixels[:, :, 1:] > pixels[:, :, :-1])
+
+
+def phash_batch(pixels: np.ndarray) -> List[int]:
+    """pHash for a (n, 32, 32) grayscale batch"""
+    coeffs = (_DCT @ pixels.astype(np.float32) @ _DCT.T)[:, :_LOW_FREQ, :_LOW_FREQ]
+    flat = coeffs.reshape(len(coeffs), -1)
+    # The DC term only reflects overall brightness; leave it out of the median
+    median = np.median(flat[:, 1:], axis=1, keepdims=True)
+    return _pack(flat > median)
+
+
+def load_gray(source: Union[bytes, Path, str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode an image at reduced size and return its (8x9, 32x32) grayscale thumbnails"""
+    from PIL import Image
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    with Image.open(fp) as img:
+        # JPEG only: let the decoder scale down by up to 1/8 instead of decoding full UHD
+        img.draft("L", (_DCT_SIZE * 4, _DCT_SIZE * 4))
+        gray = img.convert("L")
+    small = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.float32)
+    large = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.BILINEAR), dtype=np.float32)
+    return small, large
+
+
+def image_hashes(source: Union[bytes, Path, str]) -> Dict[str, str]:
+    """Compute {"phash": hex, "dhash": hex} for one image (bytes or path)"""
+    return hash_many([source])[0]
+
+
+def hash_many(sources: Iterable[Union[bytes, Path, str]]) -> List[Dict[str, str]]:
+    """Decode each image once and hash the whole batch with vectorised NumPy operations"""
+    thumbs = [load_gray(s) for s in sources]
+    if not thumbs:
+        return []
+    dh = dhash_batch(np.stack([t[0] for t in thumbs]))
+    ph = phash_batch(np.stack([t[1] for t in thumbs]))
+    return [{"phash": to_hex(p), "dhash": to_hex(d)} for p, d in zip(ph, dh)]
+
+
+def to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def from_hex(value: str) -> int:
+    return int(value, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance"""
+
+    def __init__(self):
+        # Node: [hash, items, {distance: child}]
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int, item):
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, object]]:
+        """All items within `max_distance`, closest first"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= max_distance:
+                found.extend((d, item) for item in node[1])
+            # Triangle inequality: only children with |k - d| <= max_distance can match
+            for k, child in node[2].items():
+                if d - max_distance <= k <= d + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda t: t[0])
+        return found
+
+
+class DuplicateFinder:
+    """Near-duplicate lookup over the hashes stored in the library index"""
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, kind: str = "phash"):
+        self.threshold = threshold
+        self.kind = kind
+        self.tree = BKTree()
+
+    @classmethod
+    def from_index(cls, index, threshold: int = DEFAULT_THRESHOLD, kind: str = "phash") -> "DuplicateFinder":
+        """Build a finder from index entries that already carry a hash"""
+        finder = cls(threshold, kind)
+        for name, entry in index.oldest_first():
+            if entry.get(kind) and not entry.get("duplicate_of"):
+                finder.add(entry[kind], name)
+        return finder
+
+    def add(self, hash_hex: str, name: str):
+        self.tree.add(from_hex(hash_hex), name)
+
+    def find(self, hash_hex: str, exclude: Iterable[str] = ()) -> Optional[Tuple[int, str]]:
+        """Closest known image within the threshold as (distance, name), or None"""
+        exclude = set(exclude)
+        for d, name in self.tree.search(from_hex(hash_hex), self.threshold):
+            if name not in exclude:
+                return d, name
+        return None
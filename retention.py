@@ -0,0 +1,119 @@
+"""
+Disk quota and eviction policy for the wallpaper folder
+
+Eviction candidates are chosen from the library index (oldest first) rather
+than by re-scanning and stat'ing the folder. Pinned favourites and protected
+files (the current and the newest wallpaper) are never removed.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from library_index import LibraryIndex, entry_date
+
+
+@dataclass
+class RetentionPolicy:
+    max_bytes: Optional[int] = None
+    max_count: Optional[int] = None
+    max_age_days: Optional[int] = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RetentionPolicy":
+        """Build a policy from retention_max_mb / retention_max_count / retention_max_age_days"""
+        max_mb = config.get("retention_max_mb")
+        return cls(
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+            max_count=config.get("retention_max_count") or None,
+            max_age_days=config.get("retention_max_age_days") or None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_bytes or self.max_count or self.max_age_days)
+
+
+def select_evictions(index: LibraryIndex, policy: RetentionPolicy, protected: Iterable[str] = (),
+                     now: Optional[datetime] = None) -> List[str]:
+    """Return the filenames to delete so the library satisfies `policy`"""
+    if not policy.enabled:
+        return []
+    protected_names: Set[str] = set(protected)
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=policy.max_age_days)).strftime("%Y-%m-%d") if policy.max_age_days else None
+
+    count = len(index.entries)
+    total = index.total_bytes()
+    evict = []
+    for name, entry in index.oldest_first():
+        too_old = cutoff is not None and entry_date(entry) < cutoff
+        over_count = policy.max_count is not None and count > policy.max_count
+        over_bytes = policy.max_bytes is not None and total > policy.max_bytes
+        if not (too_old or over_count or over_bytes):
+            # Entries are oldest first, so nothing newer can be too old either
+            break
+        if name in protected_names:
+            continue
+        evict.append(name)
+        count -= 1
+        total -= entry.get("size", 0)
+    return evict
+
+
+def select_unwanted(index: LibraryIndex, policy: RetentionPolicy, dates: Sequence[str],
+                    protected: Iterable[str] = (), now: Optional[datetime] = None) -> Set[int]:
+    """
+    Positions in `dates` (images about to be downloaded, newest first) that
+    select_evictions would delete again right after they are written.
+
+    An image whose date is already in the library counts as that file. The
+    newest image is kept like the latest wallpaper. Only max_count and
+    max_age_days are considered.
+    """
+    # Sizes are unknown before the download
+    policy = RetentionPolicy(max_count=policy.max_count, max_age_days=policy.max_age_days)
+    if not policy.enabled or not dates:
+        return set()
+    now = now or datetime.now()
+    by_date = {entry.get("date"): name for name, entry in index.entries.items()}
+    view = LibraryIndex(index.folder)
+    view.entries = dict(index.entries)
+    names = []
+    for pos, date in enumerate(dates):
+        name = by_date.get(date)
+        if name is None:
+            name = f"<incoming {pos}>"
+            view.entries[name] = {"date": date, "mtime": now.timestamp(), "size": 0}
+        names.append(name)
+    evicted = set(select_evictions(view, policy, set(protected) | {names[0]}, now))
+    return {pos for pos, name in enumerate(names) if name in evicted}
+
+
+def apply_retention(index: LibraryIndex, policy: RetentionPolicy, protected: Iterable[str] = (),
+                    logger=None) -> Tuple[List[str], int]:
+    """Delete the selected files, update the index and return (removed names, freed bytes)"""
+    removed, freed = [], 0
+    for name in select_evictions(index, policy, protected):
+        entry = index.get(name) or {}
+        try:
+            (index.folder / name).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            if logger:
+                logger.warning(f"Could not evict {name}: {e}")
+            continue
+        index.remove(name)
+        removed.append(name)
+        freed += entry.get("size", 0)
+    if removed and logger:
+        logger.info(f"Retention removed {len(removed)} file(s), freed {freed} bytes")
+    return removed, freed
+
+
+def protected_names(config: dict, *paths: Optional[Path]) -> Set[str]:
+    """Favourites from config plus the names of the given paths"""
+    names = set(config.get("favorites", []))
+    names.update(p.name for p in paths if p is not None)
+    return names
@@ -0,0 +1,155 @@
+"""
+Shared content cache for fleets of machines
+
+Machines in one office download the same images every day. With
+"shared_cache_folder" pointing at a network share (or any folder several
+machines can reach), only the first machine downloads an image from Bing;
+the others copy it from the pool.
+
+Layout:
+
+    <folder>/objects/ab/ab12…ef.jpg   image bytes, named by SHA-256
+    <folder>/refs/<key>.json          which object a candidate list resolved to
+    <folder>/locks/<key>.lock         held while one machine downloads
+
+A ref is keyed by the image's candidate URLs, so machines with the same
+resolution settings share a download, while a machine preferring another
+resolution fetches its own. Objects are written to a temp file and renamed,
+so a reader never sees a partial image, and every read is checked against
+the digest in its name.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from fileutil import atomic_write_bytes, atomic_write_text, lock_file
+
+OBJECTS_DIR = "objects"
+REFS_DIR = "refs"
+LOCKS_DIR = "locks"
+# How long to wait for another machine's download before fetching ourselves
+LOCK_WAIT = 120.0
+# A lock this old belongs to a machine that went away mid-download
+LOCK_STALE = 600.0
+LOCK_POLL = 0.5
+DEFAULT_MAX_AGE_DAYS = 14
+
+
+def candidates_key(urls: List[str]) -> str:
+    return hashlib.sha256("\n".join(urls).encode("utf-8")).hexdigest()[:32]
+
+
+class SharedCache:
+    """Content-addressed image pool on a shared folder"""
+
+    def __init__(self, folder: Path, logger=None):
+        self.folder = Path(folder)
+        self.logger = logger
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    def _object_path(self, digest: str, ext: str) -> Path:
+        return self.folder / OBJECTS_DIR / digest[:2] / f"{digest}{ext}"
+
+    def _ref_path(self, key: str) -> Path:
+        return self.folder / REFS_DIR / f"{key}.json"
+
+    def _warn(self, message: str):
+        self.stats["errors"] += 1
+        if self.logger:
+            self.logger.warning(message)
+
+    def get(self, urls: List[str]) -> Optional[Tuple[bytes, str]]:
+        """(data, content_type) from the pool for these candidate URLs, or None"""
+        key = candidates_key(urls)
+        try:
+            ref = json.loads(self._ref_path(key).read_text(encoding="utf-8"))
+            data = self._object_path(ref["sha256"], ref.get("ext", "")).read_bytes()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            self._warn(f"Shared cache entry {key} unreadable: {e}")
+            return None
+        if hashlib.sha256(data).hexdigest() != ref["sha256"]:
+            self._warn(f"Shared cache object {ref['sha256']} is corrupt, ignoring it")
+            return None
+        return data, ref.get("content_type", "")
+
+    def put(self, urls: List[str], data: bytes, content_type: str, ext: str = ""):
+        """Add a downloaded image to the pool; failures are logged, never raised"""
+        digest = hashlib.sha256(data).hexdigest()
+        ref = {
+            "sha256": digest,
+            "ext": ext,
+            "content_type": content_type,
+            "size": len(data),
+            "stored": time.time(),
+        }
+        try:
+            obj = self._object_path(digest, ext)
+            if obj.exists() and obj.stat().st_size == len(data):
+                # Keep a shared object alive for prune()
+                os.utime(obj)
+            else:
+                # Missing, or a damaged copy that get() rejected
+                atomic_write_bytes(obj, data)
+            atomic_write_text(self._ref_path(candidates_key(urls)), json.dumps(ref), durable=False)
+            self.stats["stores"] += 1
+        except OSError as e:
+            self._warn(f"Could not add {digest} to shared cache: {e}")
+
+    def fetch(self, urls: List[str], download: Callable[[List[str]], Tuple[bytes, str]],
+              ext_for: Callable[[str], str] = lambda ct: "",
+              max_wait: Optional[float] = None) -> Tuple[bytes, str]:
+        """
+        Return (data, content_type) for an image, downloading it at most once per fleet.
+
+        The first machine takes the lock and calls `download(urls)`; the others
+        wait for it and read the result from the pool. If the share is
+        unreachable or the lock is not released within LOCK_WAIT (or
+        `max_wait` if shorter), this machine downloads on its own.
+        """
+        cached = self.get(urls)
+        if cached:
+            self.stats["hits"] += 1
+            return cached
+        try:
+            (self.folder / LOCKS_DIR).mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            self._warn(f"Shared cache unavailable: {e}")
+            self.stats["misses"] += 1
+            return download(urls)
+        lock = self.folder / LOCKS_DIR / f"{candidates_key(urls)}.lock"
+        wait = LOCK_WAIT if max_wait is None else max(0.0, min(LOCK_WAIT, max_wait))
+        with lock_file(lock, wait, LOCK_STALE, LOCK_POLL) as acquired:
+            if acquired:
+                # Another machine may have finished while we waited
+                cached = self.get(urls)
+                if cached:
+                    self.stats["hits"] += 1
+                    return cached
+            self.stats["misses"] += 1
+            data, ct = download(urls)
+            self.put(urls, data, ct, ext_for(ct))
+            return data, ct
+
+    def prune(self, max_age_days: float = DEFAULT_MAX_AGE_DAYS, now: Optional[float] = None) -> int:
+        """Remove refs and objects older than max_age_days; returns the number of objects removed"""
+        cutoff = (now or time.time()) - max_age_days * 86400
+        removed = 0
+        for sub in (REFS_DIR, OBJECTS_DIR):
+            root = self.folder / sub
+            if not root.exists():
+                continue
+            for dirpath, _, files in os.walk(root):
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        if os.stat(path).st_mtime < cutoff:
+                            os.unlink(path)
+                            removed += sub == OBJECTS_DIR
+                    except OSError:
+                        continue
+        return removed
@@ -0,0 +1,300 @@
+"""
+Wallpaper rotation (slideshow) for the tray app
+
+The slideshow steps through a playlist taken from the tray's wallpaper list:
+everything, the last N days, the favourites or a date range. It runs on one
+daemon thread that sleeps on a condition variable until the next switch is
+due, so between switches it costs no CPU and exactly one wakeup per interval.
+
+The image after the current one is picked and read into the OS file cache
+right after each switch, so the switch itself is only the SystemParametersInfo
+call. Nothing is switched while the user has picked a wallpaper by hand
+(user_paused), or - if a PowerProvider reports it - while on battery or
+while the session is locked.
+
+Config keys:
+
+    slideshow_mode              "off", "all", "recent", "favorites" or "dates"
+    slideshow_interval_minutes  time between switches (default 30)
+    slideshow_recent_days       N for "recent" (default 7)
+    slideshow_from/_to          "YYYY-MM-DD" bounds for "dates" (empty = open)
+    slideshow_pause_on_battery  default true
+    slideshow_pause_on_lock     default true
+"""
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+from library_index import parse_filename
+
+MODES = ("off", "all", "recent", "favorites", "dates")
+INTERVALS_MINUTES = (5, 15, 30, 60, 240)
+_DATE_PREFIX = re.compile(r"\d{4}-\d{2}-\d{2}_")
+# Bytes read per call when warming the file cache for the next image
+PRELOAD_CHUNK = 1024 * 1024
+
+
+def wallpaper_date(path: Path) -> str:
+    """Date of a wallpaper from its filename, else its modification day"""
+    name = path.name
+    # Fast path for build_filename() names; called for every file of the library
+    if _DATE_PREFIX.match(name):
+        return name[:10]
+    day, _ = parse_filename(name)
+    if day:
+        return day
+    try:
+        return time.strftime("%Y-%m-%d", time.localtime(path.stat().st_mtime))
+    except OSError:
+        return ""
+
+
+@dataclass(frozen=True)
+class SlideshowSettings:
+    mode: str = "off"
+    interval: float = 30 * 60
+    recent_days: int = 7
+    date_from: str = ""
+    date_to: str = ""
+    pause_on_battery: bool = True
+    pause_on_lock: bool = True
+
+    @classmethod
+    def from_config(cls, config: dict) -> "SlideshowSettings":
+        mode = config.get("slideshow_mode", "off")
+        return cls(
+            mode=mode if mode in MODES else "off",
+            interval=max(60.0, float(config.get("slideshow_interval_minutes", 30)) * 60),
+            recent_days=int(config.get("slideshow_recent_days", 7)),
+            date_from=config.get("slideshow_from", ""),
+            date_to=config.get("slideshow_to", ""),
+            pause_on_battery=config.get("slideshow_pause_on_battery", True),
+            pause_on_lock=config.get("slideshow_pause_on_lock", True),
+        )
+
+    def to_config(self) -> dict:
+        return {
+            "slideshow_mode": self.mode,
+            "slideshow_interval_minutes": self.interval / 60,
+            "slideshow_recent_days": self.recent_days,
+            "slideshow_from": self.date_from,
+            "slideshow_to": self.date_to,
+            "slideshow_pause_on_battery": self.pause_on_battery,
+            "slideshow_pause_on_lock": self.pause_on_lock,
+        }
+
+    @property
+    def active(self) -> bool:
+        return self.mode != "off"
+
+    def with_changes(self, **changes) -> "SlideshowSettings":
+        return replace(self, **changes)
+
+
+def select_playlist(wallpapers: Iterable[Path], settings: SlideshowSettings,
+                    favorites: Iterable[str] = (), today: Optional[date] = None) -> List[Path]:
+    """The wallpapers the slideshow rotates through, in list order"""
+    wallpapers = list(wallpapers)
+    if settings.mode == "favorites":
+        favorites = set(favorites)
+        return [p for p in wallpapers if p.name in favorites]
+    if settings.mode == "recent":
+        since = ((today or date.today()) - timedelta(days=max(settings.recent_days - 1, 0))).isoformat()
+        return [p for p in wallpapers if wallpaper_date(p) >= since]
+    if settings.mode == "dates":
+        low, high = settings.date_from or "0000-00-00", settings.date_to or "9999-99-99"
+        return [p for p in wallpapers if low <= wallpaper_date(p) <= high]
+    return wallpapers if settings.mode == "all" else []
+
+
+class PowerProvider:
+    """Reports when the slideshow should hold still; the default never does"""
+
+    def on_battery(self) -> bool:
+        return False
+
+    def session_locked(self) -> bool:
+        return False
+
+
+class WindowsPowerProvider(PowerProvider):
+    """Battery state from GetSystemPowerStatus, lock state from the input desktop"""
+
+    def on_battery(self) -> bool:
+        import ctypes
+        from ctypes import wintypes
+
+        class SYSTEM_POWER_STATUS(ctypes.Structure):
+            _fields_ = [("ACLineStatus", wintypes.BYTE), ("BatteryFlag", wintypes.BYTE),
+                        ("BatteryLifePercent", wintypes.BYTE), ("SystemStatusFlag", wintypes.BYTE),
+                        ("BatteryLifeTime", wintypes.DWORD), ("BatteryFullLifeTime", wintypes.DWORD)]
+
+        status = SYSTEM_POWER_STATUS()
+        if not ctypes.windll.kernel32.GetSystemPowerStatus(ctypes.byref(status)):
+            return False
+        # 0 = offline (battery), 1 = online, 255 = unknown
+        return status.ACLineStatus == 0
+
+    def session_locked(self) -> bool:
+        import ctypes
+        user32 = ctypes.windll.user32
+        DESKTOP_SWITCHDESKTOP = 0x0100
+        # While the lock screen is up the input desktop cannot be opened/switched to
+        desktop = user32.OpenInputDesktop(0, False, DESKTOP_SWITCHDESKTOP)
+        if not desktop:
+            return True
+        try:
+            return not user32.SwitchDesktop(desktop)
+        finally:
+            user32.CloseDesktop(desktop)
+
+
+def default_power_provider() -> PowerProvider:
+    return WindowsPowerProvider() if sys.platform == "win32" else PowerProvider()
+
+
+def preload(path: Path) -> bool:
+    """Read a file once so the switch finds it in the OS file cache"""
+    try:
+        with open(path, "rb", buffering=0) as f:
+            while f.read(PRELOAD_CHUNK):
+                pass
+        return True
+    except OSError:
+        return False
+
+
+class Slideshow:
+    """
+    Timer thread that switches wallpapers every `settings.interval` seconds.
+
+    playlist() returns the current candidates, apply(path) sets one and
+    is_paused() reports a manual selection. step() does one switch and is
+    what the thread calls; tests call it directly.
+    """
+
+    def __init__(self, playlist: Callable[[], List[Path]], apply: Callable[[Path], bool],
+                 settings: SlideshowSettings, power: Optional[PowerProvider] = None,
+                 is_paused: Callable[[], bool] = lambda: False, logger=None):
+        self.playlist = playlist
+        self.apply = apply
+        self.settings = settings
+        self.power = power or PowerProvider()
+        self.is_paused = is_paused
+        self.logger = logger
+        self.current: Optional[Path] = None
+        self.next_path: Optional[Path] = None
+        self.switches = 0
+        self.wakeups = 0
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._stopped = True
+        self._thread: Optional[threading.Thread] = None
+
+    # --- scheduling ------------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the timer thread if the settings ask for a slideshow"""
+        with self._cond:
+            if not self.settings.active or self.running:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="slideshow", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+
+    def configure(self, settings: SlideshowSettings):
+        """Apply new settings; the interval restarts from now"""
+        with self._cond:
+            self.settings = settings
+            self.next_path = None
+            self._generation += 1
+            self._cond.notify_all()
+        if settings.active:
+            self.start()
+        else:
+            self.stop()
+
+    def _run(self):
+        self.prepare()
+        while True:
+            with self._cond:
+                generation = self._generation
+                # Sleeps in the kernel until the interval is over or something changed
+                self._cond.wait_for(lambda: self._stopped or self._generation != generation,
+                                    timeout=self.settings.interval)
+                if self._stopped:
+                    return
+                changed = self._generation != generation
+            self.wakeups += 1
+            if changed:
+                self.prepare()
+                continue
+            try:
+                self.step()
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Slideshow switch failed: {e}")
+
+    # --- switching -------------------------------------------------------
+
+    def pause_reason(self) -> Optional[str]:
+        if self.is_paused():
+            return "manual selection"
+        if self.settings.pause_on_battery and self.power.on_battery():
+            return "on battery"
+        if self.settings.pause_on_lock and self.power.session_locked():
+            return "session locked"
+        return None
+
+    def prepare(self) -> Optional[Path]:
+        """Pick the image after the current one and warm the file cache for it"""
+        playlist = self.playlist()
+        if not playlist:
+            self.next_path = None
+            return None
+        try:
+            position = playlist.index(self.current) + 1 if self.current is not None else 0
+        except ValueError:
+            position = 0
+        candidate = playlist[position % len(playlist)]
+        if candidate == self.current and len(playlist) > 1:
+            candidate = playlist[(position + 1) % len(playlist)]
+        self.next_path = candidate if preload(candidate) else None
+        return self.next_path
+
+    def step(self) -> bool:
+        """Switch to the prepared image unless paused; prepares the one after it"""
+        reason = self.pause_reason()
+        if reason:
+            if self.logger:
+                self.logger.debug(f"Slideshow paused ({reason})")
+            return False
+        path = self.next_path
+        if path is None or not path.exists():
+            path = self.prepare()
+        if path is None:
+            return False
+        ok = self.apply(path)
+        if ok:
+            self.current = path
+            self.switches += 1
+        self.prepare()
+        return ok
@@ -0,0 +1,114 @@
+"""
+Lightweight per-run timing and profiling for Bing Wallpaper Downloader
+"""
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class RunStats:
+    """
+    Collects phase durations and counters for a single downloader run.
+
+    Spans are aggregated per name (count, total, max) so repeated phases such as
+    one download per image stay cheap to record and small to report.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start a fresh run"""
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self.spans: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.extra: Dict[str, object] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block and aggregate it under `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        """Add one measured duration to the span `name`"""
+        s = self.spans.get(name)
+        if s is None:
+            self.spans[name] = {"count": 1, "total_s": seconds, "max_s": seconds}
+        else:
+            s["count"] += 1
+            s["total_s"] += seconds
+            if seconds > s["max_s"]:
+                s["max_s"] = seconds
+
+    def add(self, counter: str, n: int = 1):
+        """Increment a counter"""
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def summary(self) -> dict:
+        """Build the structured run summary"""
+        wall = time.perf_counter() - self._t0
+        spans = {
+            name: {
+                "count": int(s["count"]),
+                "total_s": round(s["total_s"], 4),
+                "max_s": round(s["max_s"], 4),
+            }
+            for name, s in self.spans.items()
+        }
+        downloaded = self.counters.get("bytes_downloaded", 0)
+        download_time = self.spans.get("download", {}).get("total_s", 0.0)
+        summary = {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_s": round(wall, 4),
+            "spans": spans,
+            "counters": dict(self.counters),
+            "throughput_bytes_per_s": round(downloaded / download_time) if download_time > 0 else None,
+        }
+        summary.update(self.extra)
+        return summary
+
+    def write_summary(self, path: Path) -> dict:
+        """Write the run summary as JSON and return it"""
+        summary = self.summary()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+class RunProfiler:
+    """Opt-in cProfile + tracemalloc recording for one run"""
+
+    def __init__(self, out_dir: Path, name: str = "downloader"):
+        self.out_dir = out_dir
+        self.name = name
+        self._profile: Optional[cProfile.Profile] = None
+
+    def start(self):
+        tracemalloc.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> dict:
+        """Stop recording, write the pstats file and return a summary for the run report"""
+        self._profile.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stats_file = self.out_dir / f"{self.name}_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pstats"
+        self._profile.dump_stats(str(stats_file))
+        return {"pstats_file": str(stats_file), "tracemalloc_peak_bytes": peak}
+
+
+# Shared instance used by the downloader
+run_stats = RunStats()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for brightness and dominant-colour analytics
+"""
+import io
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from analytics import (analyze_batch, from_hex_color, kmeans_batch, matches_filter,
+                       update_analytics)
+from library_index import LibraryIndex
+
+
+def solid(rgb, n=64):
+    return np.tile(np.array(rgb, dtype=np.float32), (n, 1))
+
+
+def png_bytes(image_module, color, size=(120, 80)) -> bytes:
+    buf = io.BytesIO()
+    image_module.new("RGB", size, color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class TestAnalyzeBatch:
+    """Test luminance, contrast and colour clustering"""
+
+    def test_luma_and_contrast(self):
+        black, white = solid((0, 0, 0)), solid((255, 255, 255))
+        half = np.concatenate([solid((0, 0, 0), 32), solid((255, 255, 255), 32)])
+        results = analyze_batch(np.stack([black, white, half]))
+        assert results[0]["luma"] == 0.0
+        assert results[1]["luma"] == pytest.approx(1.0, abs=1e-3)
+        assert results[0]["contrast"] == 0.0
+        assert results[2]["contrast"] == pytest.approx(0.5, abs=1e-3)
+
+    def test_kmeans_finds_both_colours(self):
+        pixels = np.concatenate([solid((200, 30, 30), 48), solid((20, 40, 220), 16)])
+        results = analyze_batch(pixels[None])
+        colors = results[0]["colors"]
+        assert colors[0] == ["#c81e1e", 0.75]
+        assert colors[1] == ["#1428dc", 0.25]
+
+    def test_batch_is_independent_per_image(self):
+        a = np.concatenate([solid((255, 0, 0), 32), solid((0, 255, 0), 32)])
+        b = solid((10, 10, 10))
+        batch, _ = kmeans_batch(np.stack([a, b]))
+        single, _ = kmeans_batch(a[None])
+        np.testing.assert_allclose(batch[0], single[0])
+
+
+class TestFilters:
+    """Test the tray filters on index entries"""
+
+    def test_dark_and_light(self):
+        assert matches_filter({"luma": 0.1}, "dark")
+        assert not matches_filter({"luma": 0.1}, "light")
+        assert matches_filter({"luma": 0.8}, "light")
+
+    def test_unanalysed_entries_only_pass_all(self):
+        assert matches_filter({"size": 1}, "all")
+        assert not matches_filter({"size": 1}, "dark")
+        assert not matches_filter(None, "light")
+
+    def test_accent(self):
+        entry = {"luma": 0.4, "colors": [["#1428dc", 0.6], ["#c81e1e", 0.05]]}
+        assert matches_filter(entry, "accent", (0, 50, 230))
+        # A colour covering only 5% of the image does not count
+        assert not matches_filter(entry, "accent", (200, 30, 30))
+        assert from_hex_color("#1428dc") == (20, 40, 220)
+
+
+class TestUpdateAnalytics:
+    """Test incremental analysis of the library"""
+
+    def test_only_new_images_are_analysed(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            (folder / "2025-01-01_Night.png").write_bytes(png_bytes(real_pil, (10, 10, 30)))
+            (folder / "2025-01-02_Snow.png").write_bytes(png_bytes(real_pil, (240, 240, 250)))
+            index = LibraryIndex.open(folder)
+
+            assert update_analytics(index) == 2
+            assert update_analytics(index) == 0
+            assert matches_filter(index.get("2025-01-01_Night.png"), "dark")
+            assert matches_filter(index.get("2025-01-02_Snow.png"), "light")
+
+            (folder / "2025-01-03_Dusk.png").write_bytes(png_bytes(real_pil, (90, 60, 40)))
+            index.sync()
+            assert update_analytics(index) == 1
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for archive re-encoding
+"""
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from archive import run_archive, select_candidates, target_path
+from bing_wallpaper import existing_variant
+from library_index import LibraryIndex
+
+
+def make_jpeg(image_module, path: Path, day: str):
+    """Write a noisy JPEG at high quality so re-encoding has something to save"""
+    img = image_module.effect_noise((256, 256), 40).convert("RGB")
+    img.save(path, "JPEG", quality=98)
+    ts = datetime.strptime(day, "%Y-%m-%d").timestamp()
+    os.utime(path, (ts, ts))
+
+
+class TestSelectCandidates:
+    """Test which files are picked for archiving"""
+
+    def test_only_old_unprotected_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            for name in ["2025-01-01_Old.jpg", "2025-01-02_Pinned.jpg", "2025-01-03_Done.webp",
+                         "2025-01-19_New.jpg"]:
+                (folder / name).write_bytes(b"x")
+            index = LibraryIndex.open(folder)
+            index.update("2025-01-03_Done.webp", archived="webp")
+            result = select_candidates(index, 7, "webp", {"2025-01-02_Pinned.jpg"}, now=datetime(2025, 1, 20))
+            assert [p.name for p in result] == ["2025-01-01_Old.jpg"]
+
+    def test_target_path_keeps_stem(self):
+        assert target_path(Path("2025-01-01_Old.jpg"), "webp").name == "2025-01-01_Old.webp"
+
+
+class TestRunArchive:
+    """Test end-to-end re-encoding in-process"""
+
+    def test_reencode_updates_files_and_index(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            source = folder / "2020-01-01_Old.jpg"
+            make_jpeg(real_pil, source, "2020-01-01")
+            old_mtime = source.stat().st_mtime
+
+            report = run_archive(folder, older_than_days=30, fmt="webp", quality=60, workers=0)
+
+            target = folder / "2020-01-01_Old.webp"
+            assert report["converted"] == 1
+            assert report["bytes_saved"] > 0
+            assert target.exists()
+            assert not source.exists()
+            assert target.stat().st_mtime == pytest.approx(old_mtime)
+
+            index = LibraryIndex.open(folder)
+            assert index.get(target.name)["archived"] == "webp"
+            assert index.get(source.name) is None
+
+    def test_reencode_keeps_picture_fields(self, real_pil):
+        """Test that analytics and hashes move to the new file and only byte-level fields are dropped"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            source = folder / "2020-01-01_Old.jpg"
+            make_jpeg(real_pil, source, "2020-01-01")
+            (folder / "2020-01-02_Again.png").write_bytes(b"x")
+            index = LibraryIndex.open(folder)
+            index.update(source.name, luma=0.2, contrast=0.1, colors=[[[1, 2, 3], 1.0]], phash="ab", sha256="old")
+            index.update("2020-01-02_Again.png", duplicate_of=source.name)
+            index.save()
+
+            run_archive(folder, older_than_days=30, fmt="webp", quality=60, workers=0,
+                        protected={"2020-01-02_Again.png"})
+
+            index = LibraryIndex.open(folder)
+            entry = index.get("2020-01-01_Old.webp")
+            assert (entry["luma"], entry["contrast"], entry["phash"]) == (0.2, 0.1, "ab")
+            assert entry["colors"] == [[[1, 2, 3], 1.0]]
+            assert "sha256" not in entry
+            assert entry["size"] == (folder / "2020-01-01_Old.webp").stat().st_size
+            assert index.get("2020-01-02_Again.png")["duplicate_of"] == "2020-01-01_Old.webp"
+
+    def test_same_format_at_lower_quality(self, real_pil):
+        """Test that JPEG files are re-encoded to JPEG, once"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            source = folder / "2020-01-01_Old.jpg"
+            make_jpeg(real_pil, source, "2020-01-01")
+            old_size = source.stat().st_size
+
+            report = run_archive(folder, older_than_days=30, fmt="jpeg", quality=50, workers=0)
+
+            assert report["candidates"] == 1 and report["converted"] == 1
+            assert source.stat().st_size < old_size
+            assert LibraryIndex.open(folder).get(source.name)["archived"] == "jpeg"
+            assert run_archive(folder, older_than_days=30, fmt="jpeg", quality=50, workers=0)["candidates"] == 0
+
+    def test_downloader_skip_finds_archived_variant(self):
+        """Test that skip mode does not re-download a file archive.py converted"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            archived = folder / "2020-01-01_Old.webp"
+            archived.write_bytes(b"x")
+            assert existing_variant(folder / "2020-01-01_Old.jpg") == archived
+            assert existing_variant(folder / "2020-01-02_Other.jpg") is None
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -18,8 +18,11 @@ from bing_wallpaper import (
     date_from_img,
     build_filename,
     guess_ext_from_ct,
-    build_candidate_urls
+    build_candidate_urls,
+    download_first,
 )
+from conftest import make_jpeg
+from telemetry import run_stats
 
 
 class TestConfigLoading:
@@ -317,6 +320,29 @@ class TestBuildCandidateUrls:
         assert all("bing.com" in url for url in urls)
 
 
+class TestDownloadTelemetry:
+    """Test that download_first records timing and counters"""
+
+    def test_download_first_counts_misses_and_bytes(self):
+        """Test candidate misses and downloaded bytes are recorded"""
+        run_stats.reset()
+        miss = mock.MagicMock()
+        miss.raise_for_status.side_effect = Exception("404")
+        hit = mock.MagicMock()
+        hit.iter_content.return_value = [make_jpeg()]
+        hit.headers = {"Content-Type": "image/jpeg"}
+        with mock.patch("bing_wallpaper.requests.Session") as session_cls:
+            session = session_cls.return_value.__enter__.return_value
+            session.get.side_effect = [miss, hit]
+            data, ct = download_first(["http://a/1.jpg", "http://a/2.jpg"])
+
+        assert ct == "image/jpeg"
+        summary = run_stats.summary()
+        assert summary["counters"]["candidate_misses"] == 1
+        assert summary["counters"]["bytes_downloaded"] == len(data)
+        assert summary["spans"]["download"]["count"] == 1
+
+
 class TestIntegration:
     """Integration tests for main workflow"""
     
@@ -3,6 +3,7 @@
 Unit tests for Bing Wallpaper Tray Manager
 """
 import json
+import subprocess
 import sys
 import tempfile
 from pathlib import Path
@@ -17,6 +18,14 @@ sys.modules['PIL.Image'] = mock.MagicMock()
 sys.modules['PIL.ImageDraw'] = mock.MagicMock()
 
 
+@pytest.fixture
+def config_file(tmp_path):
+    """Empty config in a temporary folder, so tests neither wait for one nor write one into the working tree"""
+    path = tmp_path / "config.json"
+    path.write_text("{}", encoding='utf-8')
+    return path
+
+
 class TestWallpaperManagerConfig:
     """Test WallpaperManager configuration handling"""
     
@@ -147,9 +156,9 @@ class TestWallpaperManagerWallpaperList:
 class TestTaskManagement:
     """Test scheduled task management"""
     
-    def test_is_task_enabled_task_not_found(self):
+    def test_is_task_enabled_task_not_found(self, config_file):
         """Test checking task status when task doesn't exist"""
-        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
             from bing_wallpaper_tray import WallpaperManager
             
             with mock.patch('bing_wallpaper_tray.WallpaperManager.refresh_wallpaper_list'):
@@ -163,9 +172,9 @@ class TestTaskManagement:
                     
                     assert result == False
     
-    def test_is_task_enabled_task_ready(self):
+    def test_is_task_enabled_task_ready(self, config_file):
         """Test checking task status when task is ready"""
-        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
             from bing_wallpaper_tray import WallpaperManager
             
             with mock.patch('bing_wallpaper_tray.WallpaperManager.refresh_wallpaper_list'):
@@ -183,9 +192,9 @@ class TestTaskManagement:
 class TestWallpaperInfo:
     """Test wallpaper info display"""
     
-    def test_get_current_wallpaper_info_no_wallpapers(self):
+    def test_get_current_wallpaper_info_no_wallpapers(self, config_file):
         """Test info display when no wallpapers exist"""
-        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
             from bing_wallpaper_tray import WallpaperManager
             
             with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -196,13 +205,13 @@ class TestWallpaperInfo:
                     info = manager.get_current_wallpaper_info()
                     assert "No wallpapers found" in info
     
-    def test_get_current_wallpaper_info_with_wallpapers(self):
+    def test_get_current_wallpaper_info_with_wallpapers(self, config_file):
         """Test info display with wallpapers"""
         with tempfile.TemporaryDirectory() as tmpdir:
             test_file = Path(tmpdir) / "test_wallpaper.jpg"
             test_file.touch()
             
-            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
                 from bing_wallpaper_tray import WallpaperManager
                 
                 with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -219,14 +228,14 @@ class TestWallpaperInfo:
 class TestWallpaperNavigation:
     """Test wallpaper navigation with boundary checks"""
     
-    def test_next_wallpaper_at_newest(self):
+    def test_next_wallpaper_at_newest(self, config_file):
         """Test that next_wallpaper returns False when at newest (index 0)"""
         with tempfile.TemporaryDirectory() as tmpdir:
             test_files = [Path(tmpdir) / f"wallpaper{i}.jpg" for i in range(3)]
             for f in test_files:
                 f.touch()
             
-            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
                 from bing_wallpaper_tray import WallpaperManager
                 
                 with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -240,14 +249,14 @@ class TestWallpaperNavigation:
                         assert result == False
                         assert manager.current_wallpaper_index == 0
     
-    def test_previous_wallpaper_at_oldest(self):
+    def test_previous_wallpaper_at_oldest(self, config_file):
         """Test that previous_wallpaper returns False when at oldest (last index)"""
         with tempfile.TemporaryDirectory() as tmpdir:
             test_files = [Path(tmpdir) / f"wallpaper{i}.jpg" for i in range(3)]
             for f in test_files:
                 f.touch()
             
-            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
                 from bing_wallpaper_tray import WallpaperManager
                 
                 with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -261,14 +270,14 @@ class TestWallpaperNavigation:
                         assert result == False
                         assert manager.current_wallpaper_index == 2
     
-    def test_next_wallpaper_middle(self):
+    def test_next_wallpaper_middle(self, config_file):
         """Test that next_wallpaper moves to newer wallpaper in middle"""
         with tempfile.TemporaryDirectory() as tmpdir:
             test_files = [Path(tmpdir) / f"wallpaper{i}.jpg" for i in range(3)]
             for f in test_files:
                 f.touch()
             
-            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
                 from bing_wallpaper_tray import WallpaperManager
                 
                 with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -283,14 +292,14 @@ class TestWallpaperNavigation:
                             assert result == True
                             assert manager.current_wallpaper_index == 0
     
-    def test_previous_wallpaper_middle(self):
+    def test_previous_wallpaper_middle(self, config_file):
         """Test that previous_wallpaper moves to older wallpaper in middle"""
         with tempfile.TemporaryDirectory() as tmpdir:
             test_files = [Path(tmpdir) / f"wallpaper{i}.jpg" for i in range(3)]
             for f in test_files:
                 f.touch()
             
-            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
                 from bing_wallpaper_tray import WallpaperManager
                 
                 with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -309,14 +318,14 @@ class TestWallpaperNavigation:
 class TestJumpToLatest:
     """Test jump to latest wallpaper functionality"""
     
-    def test_jump_to_latest_from_middle(self):
+    def test_jump_to_latest_from_middle(self, config_file):
         """Test jumping to latest wallpaper from middle of list"""
         with tempfile.TemporaryDirectory() as tmpdir:
             test_files = [Path(tmpdir) / f"wallpaper{i}.jpg" for i in range(5)]
             for f in test_files:
                 f.touch()
             
-            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
                 from bing_wallpaper_tray import WallpaperManager
                 
                 with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -331,14 +340,14 @@ class TestJumpToLatest:
                             assert result == True
                             assert manager.current_wallpaper_index == 0
     
-    def test_jump_to_latest_already_at_latest(self):
+    def test_jump_to_latest_already_at_latest(self, config_file):
         """Test that jump_to_latest returns False when already at latest"""
         with tempfile.TemporaryDirectory() as tmpdir:
             test_files = [Path(tmpdir) / f"wallpaper{i}.jpg" for i in range(3)]
             for f in test_files:
                 f.touch()
             
-            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
                 from bing_wallpaper_tray import WallpaperManager
                 
                 with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -352,9 +361,9 @@ class TestJumpToLatest:
                         assert result == False
                         assert manager.current_wallpaper_index == 0
     
-    def test_jump_to_latest_no_wallpapers(self):
+    def test_jump_to_latest_no_wallpapers(self, config_file):
         """Test that jump_to_latest handles no wallpapers"""
-        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', Path("test_config.json")):
+        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
             from bing_wallpaper_tray import WallpaperManager
             
             with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
@@ -367,6 +376,112 @@ class TestJumpToLatest:
                     assert result == False
 
 
+class TestFavoritesAndRetention:
+    """Test pinning and navigation after files were evicted"""
+    
+    def test_toggle_favorite_pins_and_unpins(self):
+        """Test that toggling adds and removes the current wallpaper from favorites"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config_file = Path(tmpdir) / "config.json"
+            config_file.write_text(json.dumps({"download_folder": tmpdir}), encoding='utf-8')
+            test_file = Path(tmpdir) / "2025-01-17_Test.jpg"
+            test_file.touch()
+            
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
+                from bing_wallpaper_tray import WallpaperManager
+                
+                with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
+                    with mock.patch('bing_wallpaper_tray.WallpaperManager.refresh_wallpaper_list'):
+                        manager = WallpaperManager()
+                        manager.wallpapers = [test_file]
+                        manager.current_wallpaper_index = 0
+                        
+                        assert manager.toggle_favorite() == True
+                        assert manager.is_favorite()
+                        saved = json.loads(config_file.read_text(encoding='utf-8'))
+                        assert saved["favorites"] == [test_file.name]
+                        
+                        manager.toggle_favorite()
+                        assert not manager.is_favorite()
+    
+    def test_previous_wallpaper_skips_evicted_file(self, config_file):
+        """Test that navigating to a deleted file refreshes the list instead of failing later"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            test_files = [Path(tmpdir) / f"wallpaper{i}.jpg" for i in range(3)]
+            for f in test_files[:2]:
+                f.touch()
+            
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
+                from bing_wallpaper_tray import WallpaperManager
+                
+                with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
+                    with mock.patch('bing_wallpaper_tray.WallpaperManager.refresh_wallpaper_list') as refresh:
+                        with mock.patch('bing_wallpaper_tray.WallpaperManager.set_wallpaper', return_value=True) as set_wp:
+                            manager = WallpaperManager()
+                            manager.wallpapers = test_files
+                            manager.current_wallpaper_index = 1
+                            
+                            result = manager.previous_wallpaper()
+                            assert result == False
+                            assert manager.current_wallpaper_index == 1
+                            set_wp.assert_not_called()
+                            assert refresh.called
+
+
+class TestWallpaperFilter:
+    """Test filtering the wallpaper list by stored analytics"""
+    
+    def test_set_filter_uses_index_without_decoding(self):
+        """Test that dark/light filters read the library index and report unanalysed files"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config_file = Path(tmpdir) / "config.json"
+            config_file.write_text(json.dumps({"download_folder": tmpdir}), encoding='utf-8')
+            names = ["2025-01-01_Night.jpg", "2025-01-02_Snow.jpg", "2025-01-03_New.jpg"]
+            for name in names:
+                (Path(tmpdir) / name).touch()
+            
+            from library_index import LibraryIndex
+            index = LibraryIndex.open(Path(tmpdir))
+            index.update(names[0], luma=0.1, colors=[])
+            index.update(names[1], luma=0.9, colors=[])
+            index.save()
+            
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
+                from bing_wallpaper_tray import WallpaperManager
+                
+                with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=False):
+                    with mock.patch('bing_wallpaper_tray.WallpaperManager.get_current_wallpaper', return_value=None):
+                        manager = WallpaperManager()
+                        assert len(manager.wallpapers) == 3
+                        
+                        assert manager.set_filter('dark') == True
+                        assert [w.name for w in manager.wallpapers] == [names[0]]
+                        assert manager.pending_analysis == 1
+                        
+                        manager.set_filter('light')
+                        assert [w.name for w in manager.wallpapers] == [names[1]]
+                        
+                        saved = json.loads(config_file.read_text(encoding='utf-8'))
+                        assert saved["wallpaper_filter"] == 'light'
+                        assert manager.set_filter('bogus') == False
+
+    
+    def test_tray_starts_without_numpy(self):
+        """Test that numpy (needed by analytics) is only loaded once a filter is used"""
+        code = (
+            "import sys\n"
+            "from unittest import mock\n"
+            "for name in ('pystray', 'PIL', 'PIL.Image', 'PIL.ImageDraw'):\n"
+            "    sys.modules[name] = mock.MagicMock()\n"
+            "sys.modules['numpy'] = None\n"
+            "import bing_wallpaper_tray\n"
+            "assert 'analytics' not in sys.modules\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent,
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+
+
 # Run tests if executed directly
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the tray's Browse menu and its date index
+"""
+import json
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+# Mock pystray and PIL before importing bing_wallpaper_tray
+sys.modules.setdefault('pystray', mock.MagicMock())
+sys.modules.setdefault('PIL', mock.MagicMock())
+sys.modules.setdefault('PIL.Image', mock.MagicMock())
+sys.modules.setdefault('PIL.ImageDraw', mock.MagicMock())
+
+from browse import BROWSE_MONTHS, MAX_PER_DAY, DateIndex, wallpaper_label
+
+
+def dated_paths(days: int, per_day: int = 1, start: date = date(2021, 1, 1)):
+    """Synthetic wallpaper paths, newest first (dates come from the names, no files needed)"""
+    paths = []
+    for d in range(days - 1, -1, -1):
+        day = (start + timedelta(days=d)).isoformat()
+        paths.extend(Path(f"/lib/{day}_Slug{d}" + (f"_{n}" if n else "") + ".jpg") for n in range(per_day))
+    return paths
+
+
+class FakeMenu:
+    """Stand-in for pystray.Menu that keeps its items (or item generator) uncalled"""
+
+    SEPARATOR = object()
+
+    def __init__(self, *items):
+        self.items = items
+
+    def expand(self):
+        if len(self.items) == 1 and callable(self.items[0]):
+            return list(self.items[0]())
+        return list(self.items)
+
+
+def fake_item(text, action, **kwargs):
+    return {"text": text, "action": action, **kwargs}
+
+
+@pytest.fixture
+def app():
+    import bing_wallpaper_tray
+    with mock.patch.object(bing_wallpaper_tray, 'item', fake_item), \
+            mock.patch.object(bing_wallpaper_tray.pystray, 'Menu', FakeMenu):
+        app = bing_wallpaper_tray.TrayApp.__new__(bing_wallpaper_tray.TrayApp)
+        app.manager = mock.MagicMock()
+        app.view = {}
+        yield app
+
+
+class TestDateIndex:
+    """Test grouping by year, month and day"""
+
+    def test_levels(self):
+        """Test that each level lists its own entries, newest first"""
+        index = DateIndex(dated_paths(400, per_day=2))
+        assert index.years() == ['2022', '2021']
+        months = index.months('2022')
+        assert [m for m, _ in months] == ['02', '01']
+        assert dict(months)['01'] == 31
+        days = index.days('2021', '02')
+        assert len(days) == 28
+        assert days[0][0] == '2021-02-28'
+        assert [p.name for p in days[0][1]] == ['2021-02-28_Slug58.jpg', '2021-02-28_Slug58_1.jpg']
+        assert index.days('2023', '01') == []
+
+    def test_labels_and_equality(self):
+        """Test menu labels and that equal lists give equal indexes"""
+        assert wallpaper_label(Path("2025-01-17_Waterfall.jpg")) == "Waterfall"
+        assert wallpaper_label(Path("holiday.jpg")) == "holiday"
+        assert DateIndex(dated_paths(3)) == DateIndex(dated_paths(3))
+        assert DateIndex(dated_paths(3)) != DateIndex(dated_paths(4))
+        assert not DateIndex([])
+
+
+class TestBrowseMenu:
+    """Test that the menu is generated one level at a time"""
+
+    def test_levels_are_lazy(self, app):
+        """Test that opening the Browse menu only creates items for the recent months of a large library"""
+        app.view['browse'] = DateIndex(dated_paths(5 * 365, per_day=20))
+        entries = list(app.browse_years())
+        assert entries[0]["text"] == '2025'
+        assert entries[1] is FakeMenu.SEPARATOR
+        assert entries[2]["text"] == '📂 Older…'
+        # Submenus hold generators that have not run yet
+        assert callable(entries[0]["action"].items[0])
+
+        months = entries[0]["action"].expand()
+        assert len(months) == BROWSE_MONTHS
+        assert months[0]["text"] == "December (30)"
+        days = months[1]["action"].expand()
+        assert len(days) == 30
+        assert days[0]["text"] == "30. (20 wallpapers)"
+        assert len(days[0]["action"].expand()) == MAX_PER_DAY
+
+    def test_recent_months_span_years(self, app):
+        """Test that the window of recent months continues into the previous year"""
+        # 2021-01-01 .. 2022-03-31
+        app.view['browse'] = DateIndex(dated_paths(455))
+        entries = list(app.browse_years())
+        assert [e["text"] for e in entries[:2]] == ['2022', '2021']
+        assert len(entries[0]["action"].expand()) == 3
+        months = entries[1]["action"].expand()
+        assert [m["text"] for m in months][-1] == "April (30)"
+        assert len(months) == BROWSE_MONTHS - 3
+        entries[-1]["action"]()
+        app.manager.open_wallpaper_folder.assert_called_once()
+
+    def test_small_library_has_no_older_entry(self, app):
+        """Test that "Older…" only appears when wallpapers fall outside the window"""
+        app.view['browse'] = DateIndex(dated_paths(365))
+        entries = list(app.browse_years())
+        assert [e["text"] for e in entries] == ['2021']
+        assert len(entries[0]["action"].expand()) == BROWSE_MONTHS
+
+    def test_day_item_selects_wallpaper(self, app):
+        """Test that a single wallpaper per day is a direct action"""
+        paths = dated_paths(2)
+        app.view['browse'] = DateIndex(paths)
+        month = list(app.browse_years())[0]["action"].expand()[0]
+        day = month["action"].expand()[1]
+        assert day["text"] == "1. Slug0"
+        day["action"]()
+        app.manager.browse_to.assert_called_once_with(paths[1])
+
+    def test_empty_library(self, app):
+        """Test the placeholder for an empty library"""
+        app.view['browse'] = DateIndex([])
+        entries = list(app.browse_years())
+        assert entries[0]["text"] == 'No wallpapers found'
+        assert entries[0]["enabled"] is False
+
+
+class TestBrowseTo:
+    """Test selecting a wallpaper from the Browse menu"""
+
+    def test_older_wallpaper_pauses(self):
+        """Test that picking anything but the newest wallpaper pauses auto-update"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config_file = Path(tmpdir) / "config.json"
+            config_file.write_text(json.dumps({"download_folder": tmpdir, "metrics_enabled": False}),
+                                   encoding='utf-8')
+            paths = [Path(tmpdir) / p.name for p in dated_paths(3)]
+            for p in paths:
+                p.touch()
+            with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
+                from bing_wallpaper_tray import WallpaperManager
+
+                with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=True), \
+                        mock.patch('bing_wallpaper_tray.WallpaperManager.refresh_wallpaper_list'), \
+                        mock.patch('bing_wallpaper_tray.WallpaperManager.set_wallpaper', return_value=True):
+                    manager = WallpaperManager()
+                    manager.wallpapers = paths
+                    assert manager.browse_to(paths[0])
+                    assert not manager.user_paused
+                    assert manager.browse_to(paths[2])
+                    assert manager.current_wallpaper_index == 2
+                    assert manager.user_paused
+                    assert json.loads(config_file.read_text(encoding='utf-8'))["user_paused"] is True
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the connectivity probe and run deferral
+"""
+import socket
+from unittest import mock
+
+import pytest
+
+import bing_wallpaper
+from connectivity import ConnectivityProvider, SocketProvider, probe_target, wait_for_network
+from telemetry import run_stats
+
+
+class FakeClock:
+    """Monotonic clock that only advances when sleep() is called"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeProvider(ConnectivityProvider):
+    """Offline until `online_at` (fake time); the link comes up at `link_at`"""
+
+    def __init__(self, clock, online_at=float("inf"), link_at=None):
+        self.clock = clock
+        self.online_at = online_at
+        self.link_at = link_at
+        self.probe_times = []
+
+    def reachable(self):
+        self.probe_times.append(self.clock.now)
+        return self.clock.now >= self.online_at
+
+    def link_state(self):
+        if self.link_at is None:
+            return None
+        return "up" if self.clock.now >= self.link_at else "down"
+
+
+class TestWaitForNetwork:
+    """Test backoff and early wakeup"""
+
+    def test_online_returns_at_once(self):
+        clock = FakeClock()
+        provider = FakeProvider(clock, online_at=0)
+        assert wait_for_network(provider, 300, clock=clock, sleep=clock.sleep)
+        assert provider.probe_times == [0] and clock.sleeps == []
+
+    def test_exponential_backoff(self):
+        """Test that probes are spaced 2, 4, 8... seconds apart and give up at max_wait"""
+        clock = FakeClock()
+        provider = FakeProvider(clock)
+        assert not wait_for_network(provider, 100, initial=2, cap=32, clock=clock, sleep=clock.sleep)
+        assert provider.probe_times == [0, 2, 6, 14, 30, 62, 94, 100]
+        assert clock.now == 100
+
+    def test_link_change_probes_immediately(self):
+        """Test that a link coming up ends the backoff pause within one poll interval"""
+        clock = FakeClock()
+        provider = FakeProvider(clock, online_at=33, link_at=33)
+        assert wait_for_network(provider, 300, initial=2, cap=60, poll=1, clock=clock, sleep=clock.sleep)
+        # The pause 30..62 is cut short when the link changes at 33
+        assert provider.probe_times == [0, 2, 6, 14, 30, 33]
+
+
+class TestSocketProvider:
+    """Test the TCP probe"""
+
+    def test_reachable_and_unreachable(self):
+        with socket.socket() as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen()
+            port = server.getsockname()[1]
+            with mock.patch("connectivity.urllib.request.getproxies", return_value={}):
+                assert SocketProvider(f"http://127.0.0.1:{port}").reachable()
+        with mock.patch("connectivity.urllib.request.getproxies", return_value={}):
+            assert not SocketProvider(f"http://127.0.0.1:{port}", timeout=0.5).reachable()
+
+    def test_probe_target_uses_proxy(self):
+        """Test that behind a proxy the proxy is probed, since Bing itself may be blocked"""
+        with mock.patch("connectivity.urllib.request.getproxies", return_value={}):
+            assert probe_target("https://www.bing.com") == ("www.bing.com", 443)
+            assert probe_target("http://mirror:8080") == ("mirror", 8080)
+        with mock.patch("connectivity.urllib.request.getproxies",
+                        return_value={"https": "http://proxy.local:3128"}), \
+                mock.patch("connectivity.urllib.request.proxy_bypass", return_value=False):
+            assert probe_target("https://www.bing.com") == ("proxy.local", 3128)
+
+
+class StaticProvider(ConnectivityProvider):
+    def __init__(self, online):
+        self.online = online
+        self.probes = 0
+
+    def reachable(self):
+        self.probes += 1
+        return self.online
+
+
+class TestDownloader:
+    """Test how the downloader uses the probe"""
+
+    def test_offline_run_is_skipped(self):
+        """Test that an unreachable server ends the run without any metadata request"""
+        run_stats.reset()
+        with mock.patch("bing_wallpaper.connectivity", StaticProvider(False)), \
+                mock.patch("bing_wallpaper.wait_for_network", return_value=False) as wait:
+            assert not bing_wallpaper.await_network({"connectivity_max_wait_seconds": 30})
+        assert wait.call_args.args[1] == 30
+        assert run_stats.summary()["network"] == "offline"
+        with mock.patch("bing_wallpaper.connectivity", None):
+            assert bing_wallpaper.await_network({})
+
+    def test_no_fallback_markets_when_offline(self):
+        """Test that fallback markets are not tried once the network is gone"""
+        provider = StaticProvider(False)
+        with mock.patch("bing_wallpaper.connectivity", provider), \
+                mock.patch("bing_wallpaper.fetch_images_json", return_value=[]) as fetch:
+            assert bing_wallpaper.fetch_all_images(["de-DE", "en-US", "fr-FR"], 8, ["1920x1080"]) == []
+        assert fetch.call_count == 1
+        assert provider.probes == 1
+
+    def test_downloads_stop_when_offline(self):
+        """Test that a failed image download followed by a failed probe skips the rest"""
+        imgs = [{"startdate": f"2025012{i}", "urlbase": f"/th?id=OHR.Img{i}_DE"} for i in range(4)]
+        with mock.patch("bing_wallpaper.connectivity", StaticProvider(False)), \
+                mock.patch("bing_wallpaper.download_first", side_effect=OSError("timed out")) as download:
+            assert bing_wallpaper.download_images(imgs, ["1920x1080"]) == []
+        assert download.call_count == 1
+
+        with mock.patch("bing_wallpaper.connectivity", StaticProvider(True)), \
+                mock.patch("bing_wallpaper.download_first", side_effect=OSError("404")) as download:
+            bing_wallpaper.download_images(imgs, ["1920x1080"])
+        assert download.call_count == 4
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the run deadline
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+import bing_wallpaper
+from conftest import make_jpeg
+from deadline import Deadline, DeadlineExceeded, request_timeout
+from http_cache import HttpCache
+from shared_cache import LOCKS_DIR, SharedCache, candidates_key
+from telemetry import run_stats
+
+
+class FakeClock:
+    """Monotonic clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_imgs(n=4):
+    return [{"startdate": f"2025012{i}", "urlbase": f"/th?id=OHR.Img{i}_DE{i}"} for i in range(n)]
+
+
+class TestDeadline:
+    """Test the budget arithmetic"""
+
+    def test_timeouts_shrink(self):
+        """Test that request timeouts are cut to the remaining time and refused below one second"""
+        clock = FakeClock()
+        deadline = Deadline(60, clock=clock)
+        assert deadline.reserve == 6
+        assert deadline.timeout(15) == 15
+        clock.now = 50
+        assert deadline.timeout(15) == 10
+        assert not deadline.low
+        clock.now = 55
+        assert deadline.low and not deadline.expired
+        clock.now = 59.5
+        assert deadline.expired
+        with pytest.raises(DeadlineExceeded):
+            deadline.timeout(15)
+        assert request_timeout(None, 15) == 15
+
+    def test_watch_stops_stream(self):
+        """Test that a streamed body is cut off once the budget is gone"""
+        clock = FakeClock()
+        deadline = Deadline(10, clock=clock)
+        chunks = []
+        with pytest.raises(DeadlineExceeded):
+            for chunk in deadline.watch(iter([b"a", b"b", b"c"])):
+                chunks.append(chunk)
+                clock.now += 6
+        assert chunks == [b"a", b"b"]
+
+    def test_reserve_is_capped(self):
+        assert Deadline(600).reserve == 10
+        assert Deadline(600, reserve=30).reserve == 30
+
+
+class TestDownloaderDeadline:
+    """Test how the downloader spends the budget"""
+
+    def test_metadata_timeout_follows_budget(self):
+        clock = FakeClock()
+        deadline = Deadline(8, clock=clock)
+        response = mock.MagicMock()
+        response.json.return_value = {"images": make_imgs(1)}
+        with mock.patch("bing_wallpaper.http_cache", None), \
+                mock.patch("bing_wallpaper.requests.get", return_value=response) as get:
+            assert bing_wallpaper.fetch_images_json("de-DE", 0, 1, deadline) == make_imgs(1)
+        assert get.call_args.kwargs["timeout"] == 8
+
+        clock.now = 7.5
+        with pytest.raises(DeadlineExceeded):
+            bing_wallpaper.fetch_images_json("de-DE", 0, 1, deadline)
+
+    def test_download_first_uses_remaining_time(self):
+        """Test that candidates get the remaining time and the rest are not tried once it is gone"""
+        clock = FakeClock()
+        deadline = Deadline(20, clock=clock)
+
+        def slow_404(*args, **kwargs):
+            clock.now += 19.5
+            raise OSError("timed out")
+        with mock.patch("bing_wallpaper.http_cache", None), \
+                mock.patch("bing_wallpaper.requests.Session") as session_cls:
+            session = session_cls.return_value.__enter__.return_value
+            session.get.side_effect = slow_404
+            with pytest.raises(DeadlineExceeded):
+                bing_wallpaper.download_first(["http://a/1.jpg", "http://a/2.jpg"], deadline=deadline)
+        assert session.get.call_count == 1
+        assert session.get.call_args.kwargs["timeout"] == 20
+
+    def test_older_images_are_dropped_first(self):
+        """Test that once only the reserve is left, older images are skipped and today's is kept"""
+        clock = FakeClock()
+        deadline = Deadline(100, clock=clock)
+        downloaded = []
+
+        def download(urls, deadline=None):
+            downloaded.append(urls[0].split("OHR.")[1][:4])
+            clock.now += 45
+            return make_jpeg(), "image/jpeg"
+
+        run_stats.reset()
+        with mock.patch("bing_wallpaper.download_first", side_effect=download):
+            results = bing_wallpaper.download_images(make_imgs(4), ["1920x1080"], deadline=deadline)
+        assert downloaded == ["Img0", "Img1"]
+        assert len(results) == 2
+        assert run_stats.summary()["counters"]["images_dropped"] == 2
+
+    def test_deadline_stops_market_fallback(self):
+        """Test that running out of time on one market does not start the next"""
+        with mock.patch("bing_wallpaper.connectivity", None), \
+                mock.patch("bing_wallpaper.fetch_images_json", side_effect=DeadlineExceeded("late")) as fetch:
+            assert bing_wallpaper.fetch_all_images(["de-DE", "en-US"], 8, ["1920x1080"],
+                                                   deadline=Deadline(0)) == []
+        assert fetch.call_count == 1
+
+    def test_held_cache_locks_follow_budget(self):
+        """Test that a lock held by another process is only waited for until the budget runs out"""
+        img = make_imgs(1)[0]
+        urls = bing_wallpaper.build_candidate_urls(img, ["1920x1080"])
+        url = f"{bing_wallpaper.BING_BASE}/HPImageArchive.aspx?format=js&idx=0&n=1&mkt=de-DE"
+        response = mock.MagicMock(status_code=200, content=json.dumps({"images": [img]}).encode(), headers={})
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            http, shared = HttpCache(tmp / "http"), SharedCache(tmp / "shared")
+            (tmp / "shared" / LOCKS_DIR).mkdir(parents=True)
+            (tmp / "shared" / LOCKS_DIR / f"{candidates_key(urls)}.lock").touch()
+            (tmp / "http").mkdir()
+            (tmp / "http" / f"{http._key(url)}.lock").touch()
+            with mock.patch("bing_wallpaper.http_cache", http), \
+                    mock.patch("bing_wallpaper.shared_cache", shared), \
+                    mock.patch("http_cache.LOCK_WAIT", 10), \
+                    mock.patch("shared_cache.LOCK_WAIT", 10), \
+                    mock.patch("shared_cache.LOCK_POLL", 0.05), \
+                    mock.patch("bing_wallpaper.requests.get", return_value=response), \
+                    mock.patch("bing_wallpaper.download_first", return_value=(make_jpeg(), "image/jpeg")) as download:
+                start = time.monotonic()
+                assert bing_wallpaper.fetch_images_json("de-DE", 0, 1, Deadline(1.5)) == [img]
+                assert len(bing_wallpaper.download_images([img], ["1920x1080"], deadline=Deadline(1.5))) == 1
+                elapsed = time.monotonic() - start
+        assert elapsed < 5
+        assert download.call_count == 1
+
+    def test_write_loop_keeps_todays_image(self):
+        """Test that after the deadline only today's image is still written"""
+        clock = FakeClock()
+        deadline = Deadline(30, clock=clock)
+        imgs = make_imgs(3)
+
+        def download_all(*args, **kwargs):
+            clock.now = 31
+            return [(make_jpeg(), "image/jpeg", img) for img in imgs]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            args = argparse.Namespace(out=str(tmp / "out"), res="1920x1080", mkt="de-DE", fallback_mkts="",
+                                      count=3, mode="skip", name_mode="slug", set_latest=False)
+            with mock.patch("bing_wallpaper.CONFIG_FILE", tmp / "config.json"), \
+                    mock.patch("bing_wallpaper.fetch_all_images", side_effect=download_all):
+                assert bing_wallpaper.run(args, {"analytics_enabled": False}, deadline) == 0
+            names = [p.name for p in (tmp / "out").iterdir() if not p.name.startswith(".")]
+            assert names == ["2025-01-20_Img0.jpg"]
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
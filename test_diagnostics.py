@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the tray diagnostics mode
+"""
+import json
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+# Mock pystray and PIL before importing bing_wallpaper_tray
+sys.modules.setdefault('pystray', mock.MagicMock())
+sys.modules.setdefault('PIL', mock.MagicMock())
+sys.modules.setdefault('PIL.Image', mock.MagicMock())
+sys.modules.setdefault('PIL.ImageDraw', mock.MagicMock())
+
+from diagnostics import Diagnostics, collapsed_stacks, pstats_dict, sample_stacks
+from metrics import tray_registry
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+MAIN = ("app.py", 1, "main")
+WORK = ("app.py", 10, "work")
+LEAF = ("lib.py", 5, "leaf")
+
+
+class TestSampling:
+    """Test stack sampling and the pstats conversion"""
+
+    def test_samples_other_threads(self):
+        """Test that a busy thread shows up in the samples and the sampler itself does not"""
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,))
+        worker.start()
+        try:
+            samples = sample_stacks(0.1, interval=0.002)
+        finally:
+            stop.set()
+            worker.join()
+        names = {func[2] for stack in samples for func in stack}
+        assert "busy_loop" in names
+        assert "sample_stacks" not in names
+
+    def test_pstats_layout(self):
+        """Test self/inclusive times and callers, and that pstats can load the result"""
+        samples = Counter({(MAIN, WORK, LEAF): 3, (MAIN, WORK): 1, (MAIN,): 2})
+        stats = pstats_dict(samples, interval=0.01)
+        assert stats[LEAF][:4] == (3, 3, pytest.approx(0.03), pytest.approx(0.03))
+        assert stats[WORK][2] == pytest.approx(0.01) and stats[WORK][3] == pytest.approx(0.04)
+        assert stats[MAIN][3] == pytest.approx(0.06)
+        assert stats[LEAF][4] == {WORK: (3, 3, pytest.approx(0.03), pytest.approx(0.03))}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            import marshal
+            path = Path(tmpdir) / "p.pstats"
+            with open(path, 'wb') as f:
+                marshal.dump(stats, f)
+            loaded = pstats.Stats(str(path))
+            assert loaded.total_tt == pytest.approx(0.06)
+
+    def test_recursion_counted_once(self):
+        """Test that a recursive function's inclusive time is not counted per frame"""
+        stats = pstats_dict(Counter({(MAIN, WORK, WORK, WORK): 2}), interval=0.01)
+        assert stats[WORK][3] == pytest.approx(0.02)
+        assert stats[WORK][2] == pytest.approx(0.02)
+
+    def test_collapsed_stacks(self):
+        """Test the flame graph input format"""
+        assert collapsed_stacks(Counter({(MAIN, WORK): 4})) == "app:main;app:work 4\n"
+
+
+class TestDiagnostics:
+    """Test action timing and profiles"""
+
+    def test_timed_handler(self):
+        """Test that a wrapped handler records its duration and passes arguments and errors through"""
+        metrics = tray_registry()
+        diagnostics = Diagnostics(metrics, Path("."))
+        handler = diagnostics.timed('on_set_filter', lambda mode: mode.upper())
+        assert handler('dark') == 'DARK'
+        failing = diagnostics.timed('on_refresh', lambda: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            failing()
+        assert metrics.value('tray_action_seconds', action='on_set_filter')["count"] == 1
+        assert metrics.value('tray_action_seconds', action='on_refresh')["count"] == 1
+
+    def test_profile_writes_files(self):
+        """Test that a profile writes loadable pstats and tracemalloc files plus a summary"""
+        metrics = tray_registry()
+        metrics.observe('tray_action_seconds', 0.004, action='on_next')
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,))
+        worker.start()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            try:
+                paths = Diagnostics(metrics, Path(tmpdir), interval=0.002).profile(0.1)
+            finally:
+                stop.set()
+                worker.join()
+            assert all(p.exists() for p in paths)
+            assert {p.suffix for p in paths} == {'.pstats', '.txt', '.tracemalloc'}
+            assert any(func[2] == 'busy_loop' for func in pstats.Stats(str(paths[0])).stats)
+            tracemalloc.Snapshot.load(str(paths[2]))
+            summary = paths[3].read_text(encoding='utf-8')
+            assert "on_next: 1, 4.0 ms" in summary
+            assert "Allocations since the profile started" in summary
+        assert not tracemalloc.is_tracing()
+
+    def test_one_profile_at_a_time(self):
+        """Test that a second start is refused while one runs, and stop ends it early"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            diagnostics = Diagnostics(tray_registry(), Path(tmpdir))
+            assert diagnostics.start_profile(60)
+            assert diagnostics.profiling
+            assert not diagnostics.start_profile(60)
+            start = time.monotonic()
+            diagnostics.stop()
+            assert time.monotonic() - start < 10
+            assert not diagnostics.profiling
+            assert len(list(Path(tmpdir).glob("tray_profile_*.pstats"))) == 1
+
+
+@pytest.fixture
+def make_app():
+    """Factory for a TrayApp on a temporary config; yields make_app(**config)"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config_file = Path(tmpdir) / "config.json"
+        import bing_wallpaper_tray
+
+        def make_app(**config):
+            config_file.write_text(json.dumps({"download_folder": tmpdir, "metrics_enabled": False, **config}),
+                                   encoding='utf-8')
+            return bing_wallpaper_tray.TrayApp()
+
+        with mock.patch.object(bing_wallpaper_tray, 'CONFIG_FILE', config_file), \
+                mock.patch.object(bing_wallpaper_tray, 'LOG_DIR', Path(tmpdir) / "logs"), \
+                mock.patch.object(bing_wallpaper_tray.WallpaperManager, 'is_task_enabled', return_value=True), \
+                mock.patch.object(bing_wallpaper_tray.WallpaperManager, 'get_current_wallpaper',
+                                  return_value=None):
+            yield make_app
+
+
+class TestTrayDiagnostics:
+    """Test the diagnostics hooks in TrayApp"""
+
+    def test_off_leaves_handlers_alone(self, make_app):
+        """Test that without the option no handler is wrapped and profiling is refused"""
+        import bing_wallpaper_tray
+        app = make_app()
+        assert app.diagnostics is None
+        assert 'on_refresh' not in vars(app)
+        assert app.on_refresh.__func__ is bing_wallpaper_tray.TrayApp.on_refresh
+        with pytest.raises(RuntimeError):
+            app.on_profile()
+        assert app.control_status()["profiling"] is False
+
+    def test_on_times_actions(self, make_app):
+        """Test that enabled diagnostics time each menu action by handler name"""
+        app = make_app(diagnostics_enabled=True, diagnostics_profile_seconds=5)
+        app.on_refresh()
+        app.on_refresh()
+        app.on_set_filter('all')
+        metrics = app.manager.metrics
+        assert metrics.value('tray_action_seconds', action='on_refresh')["count"] == 2
+        assert metrics.value('tray_action_seconds', action='on_set_filter')["count"] == 1
+        assert app.profile_seconds() == 5
+
+        app.on_profile()
+        assert app.control_status()["profiling"] is True
+        app.on_exit()
+        assert app.control_status()["profiling"] is False
+        assert app.diagnostics.last_profile and app.diagnostics.last_profile[0].exists()
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for display-aware resolution selection
+"""
+import pytest
+
+from bing_wallpaper import build_candidate_urls
+from displays import (apply_resolution_policy, auto_resolutions, detect_display, order_resolutions,
+                      register_provider, url_resolution)
+
+
+class TestOrdering:
+    """Test picking the smallest resolution that covers the display"""
+
+    def test_laptop_prefers_small(self):
+        assert auto_resolutions((1366, 768))[0] == "1366x768"
+
+    def test_full_hd(self):
+        assert auto_resolutions((1920, 1080))[:2] == ["1920x1080", "1920x1200"]
+
+    def test_4k_needs_uhd(self):
+        assert auto_resolutions((3840, 2160))[0] == "UHD"
+
+    def test_portrait_display(self):
+        assert auto_resolutions((1080, 1920))[0] == "1920x1080"
+
+    def test_non_covering_fall_back_largest_first(self):
+        order = order_resolutions(["1280x720", "1920x1080"], (2560, 1440))
+        assert order == ["1920x1080", "1280x720"]
+
+    def test_unknown_display_keeps_order(self):
+        assert order_resolutions(["UHD", "1920x1080"], None) == ["UHD", "1920x1080"]
+
+    def test_url_resolution(self):
+        url = "https://www.bing.com/th?id=OHR.Lake_DE123_1920x1080.jpg&rf=LaDigue_1920x1080.jpg"
+        assert url_resolution(url) == (1920, 1080)
+        assert url_resolution("https://www.bing.com/th?id=OHR.Lake_DE123_UHD.jpg") == (3840, 2160)
+
+
+class TestCandidateUrls:
+    """Test that auto mode reorders the candidate URLs including img['url']"""
+
+    def test_display_reorders_default_url(self):
+        img = {"url": "/th?id=OHR.Lake_DE123_1920x1080.jpg", "urlbase": "/th?id=OHR.Lake_DE123"}
+        urls = build_candidate_urls(img, ["UHD", "1366x768"], display=(1366, 768))
+        assert urls[0].endswith("_1366x768.jpg")
+        assert urls.index("https://www.bing.com/th?id=OHR.Lake_DE123_1920x1080.jpg") < \
+            urls.index("https://www.bing.com/th?id=OHR.Lake_DE123_UHD.jpg")
+
+    def test_no_display_keeps_url_first(self):
+        img = {"url": "/th?id=OHR.Lake_DE123_1920x1080.jpg", "urlbase": "/th?id=OHR.Lake_DE123"}
+        urls = build_candidate_urls(img, ["UHD"])
+        assert urls[0].endswith("_1920x1080.jpg")
+
+
+class TestProvidersAndPolicies:
+    """Test display providers and per-machine policies"""
+
+    def test_static_provider_uses_largest(self):
+        config = {"display_provider": "static", "display": "1366x768, 2560x1440"}
+        assert detect_display(config) == (2560, 1440)
+
+    def test_custom_provider(self):
+        register_provider("test", lambda config: [(1280, 720), (1920, 1200)])
+        assert detect_display({"display_provider": "test"}) == (1920, 1200)
+
+    def test_failing_provider_returns_none(self):
+        def broken(config):
+            raise OSError("no display")
+        register_provider("broken", broken)
+        assert detect_display({"display_provider": "broken"}) is None
+
+    def test_policy_matches_hostname(self):
+        config = {
+            "resolution": "UHD,1920x1080",
+            "resolution_policies": [
+                {"hosts": ["laptop-*"], "resolution": "auto", "image_count": 1},
+                {"hosts": "*", "resolution": "1920x1080"},
+            ],
+        }
+        laptop = apply_resolution_policy(config, "LAPTOP-42")
+        assert laptop["resolution"] == "auto"
+        # Only resolution-related keys can be overridden
+        assert "image_count" not in laptop
+        assert apply_resolution_policy(config, "desk-1")["resolution"] == "1920x1080"
+        assert apply_resolution_policy({"resolution": "UHD"}, "x")["resolution"] == "UHD"
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the market/host circuit breakers
+"""
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+import requests
+
+import bing_wallpaper
+from conftest import make_jpeg
+from health import CLOSED, HALF_OPEN, OPEN, OPEN_SECONDS, SLOW_SECONDS, Breaker, HealthStore
+from telemetry import run_stats
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_store(tmpdir, clock=None):
+    return HealthStore(Path(tmpdir) / "health.json", clock=clock or FakeClock())
+
+
+class TestBreaker:
+    """Test state transitions and the latency average"""
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = Breaker()
+        breaker.record(False, 15, now=0)
+        breaker.record(False, 15, now=1)
+        breaker.record(True, 0.2, now=2)
+        breaker.record(False, 15, now=3)
+        breaker.record(False, 15, now=4)
+        assert breaker.state == CLOSED
+        breaker.record(False, 15, now=5, error="timed out")
+        assert breaker.state == OPEN and breaker.last_error == "timed out"
+        assert breaker.state_at(5 + OPEN_SECONDS - 1) == OPEN
+        assert breaker.state_at(5 + OPEN_SECONDS) == HALF_OPEN
+
+    def test_probe_outcome(self):
+        """Test that a failed probe doubles the cool-down and a successful one closes the breaker"""
+        breaker = Breaker(state=OPEN, opened_at=0, failures=3)
+        probe_time = OPEN_SECONDS
+        breaker.record(False, 5, now=probe_time)
+        assert breaker.state == OPEN and breaker.open_seconds == 2 * OPEN_SECONDS
+        assert breaker.state_at(probe_time + OPEN_SECONDS) == OPEN
+        breaker.record(True, 0.5, now=probe_time + 2 * OPEN_SECONDS)
+        assert breaker.state == CLOSED and breaker.failures == 0 and breaker.open_seconds == OPEN_SECONDS
+
+    def test_ewma(self):
+        breaker = Breaker()
+        breaker.record(True, 1.0, now=0)
+        breaker.record(True, 2.0, now=1)
+        assert breaker.latency == pytest.approx(1.3)
+
+
+class TestHealthStore:
+    """Test planning and persistence"""
+
+    def test_plan(self):
+        """Test that open markets are skipped, slow ones demoted and half-open ones probed"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            clock = FakeClock()
+            store = make_store(tmpdir, clock)
+            for _ in range(3):
+                store.record("market", "de-DE", False, 15)
+            store.record("market", "en-US", True, SLOW_SECONDS + 2)
+            store.record("market", "fr-FR", True, 0.3)
+            assert store.plan(["de-DE", "en-US", "fr-FR", "it-IT"]) == (["fr-FR", "it-IT", "en-US"], [])
+            clock.now += OPEN_SECONDS
+            assert store.plan(["de-DE", "fr-FR"]) == (["fr-FR"], ["de-DE"])
+
+    def test_all_open_still_tries_primary(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = make_store(tmpdir)
+            for market in ("de-DE", "en-US"):
+                for _ in range(3):
+                    store.record("market", market, False, 15)
+            assert store.plan(["de-DE", "en-US"]) == (["de-DE"], [])
+
+    def test_round_trip_and_summary(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = make_store(tmpdir)
+            for _ in range(3):
+                store.record("host", "mirror:8080", False, 2.0, "refused")
+            store.record("market", "de-DE", True, 0.25)
+            store.save()
+
+            loaded = make_store(tmpdir)
+            assert loaded.load()
+            assert loaded.breakers == store.breakers
+            assert not loaded.allow("host", "mirror:8080")
+            assert loaded.summary() == {
+                "hosts": {"mirror:8080": {"state": OPEN, "failures": 3, "latency_ms": 2000}},
+                "markets": {"de-DE": {"state": CLOSED, "failures": 0, "latency_ms": 250}},
+            }
+            (Path(tmpdir) / "health.json").write_text("{broken", encoding="utf-8")
+            assert not make_store(tmpdir).load()
+
+
+def open_market(store, market):
+    for _ in range(3):
+        store.record("market", market, False, 15)
+
+
+class TestDownloader:
+    """Test how the downloader uses the breakers"""
+
+    def test_open_market_is_skipped(self):
+        """Test that a market with an open breaker costs no request and the fallback is used"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = make_store(tmpdir)
+            open_market(store, "de-DE")
+            run_stats.reset()
+            with mock.patch("bing_wallpaper.health", store), \
+                    mock.patch("bing_wallpaper.connectivity", None), \
+                    mock.patch("bing_wallpaper.fetch_images_json", return_value=[{"startdate": "20250120"}]) as fetch, \
+                    mock.patch("bing_wallpaper.download_images", return_value=[(b"x", "image/jpeg", {})]):
+                assert bing_wallpaper.fetch_all_images(["de-DE", "en-US"], 8, ["1920x1080"])
+            assert [c.args[0] for c in fetch.call_args_list] == ["en-US"]
+            summary = run_stats.summary()
+            assert summary["markets_skipped"] == ["de-DE"]
+            assert summary["counters"]["market_fallbacks"] == 1
+            assert store.state("market", "en-US") == CLOSED
+
+    def test_half_open_market_is_probed_alongside(self):
+        """Test that a half-open primary is probed in parallel while the fallback downloads"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            clock = FakeClock()
+            store = make_store(tmpdir, clock)
+            open_market(store, "de-DE")
+            clock.now += OPEN_SECONDS
+            probed = threading.Event()
+
+            def probe(mkt, timeout):
+                probed.set()
+                return True, 0.4, ""
+
+            def fetch(mkt, idx, count, deadline=None):
+                # The probe runs while the normal attempt is still going
+                assert probed.wait(5)
+                return [{"startdate": "20250120"}]
+
+            with mock.patch("bing_wallpaper.health", store), \
+                    mock.patch("bing_wallpaper.connectivity", None), \
+                    mock.patch("bing_wallpaper.probe_market", side_effect=probe), \
+                    mock.patch("bing_wallpaper.fetch_images_json", side_effect=fetch) as fetch_mock, \
+                    mock.patch("bing_wallpaper.download_images", return_value=[(b"x", "image/jpeg", {})]):
+                assert bing_wallpaper.fetch_all_images(["de-DE", "en-US"], 8, ["1920x1080"])
+            assert [c.args[0] for c in fetch_mock.call_args_list] == ["en-US"]
+            assert store.state("market", "de-DE") == CLOSED
+
+    def test_successful_probe_is_used_when_others_fail(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            clock = FakeClock()
+            store = make_store(tmpdir, clock)
+            open_market(store, "de-DE")
+            clock.now += OPEN_SECONDS
+
+            def fetch(mkt, idx, count, deadline=None):
+                return [{"startdate": "20250120"}] if mkt == "de-DE" else []
+
+            with mock.patch("bing_wallpaper.health", store), \
+                    mock.patch("bing_wallpaper.connectivity", None), \
+                    mock.patch("bing_wallpaper.probe_market", return_value=(True, 0.4, "")), \
+                    mock.patch("bing_wallpaper.fetch_images_json", side_effect=fetch) as fetch_mock, \
+                    mock.patch("bing_wallpaper.download_images", return_value=[(b"x", "image/jpeg", {})]):
+                assert bing_wallpaper.fetch_all_images(["de-DE", "en-US"], 8, ["1920x1080"])
+            assert [c.args[0] for c in fetch_mock.call_args_list] == ["en-US", "de-DE"]
+            assert store.breakers[("market", "en-US")].failures == 1
+
+    def test_host_outcomes(self):
+        """Test that 5xx and connection errors count against a host, 404s do not"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = make_store(tmpdir)
+            not_found = mock.MagicMock(status_code=404)
+            not_found.raise_for_status.side_effect = requests.HTTPError("404", response=not_found)
+            server_error = mock.MagicMock(status_code=503)
+            server_error.raise_for_status.side_effect = requests.HTTPError("503", response=server_error)
+            hit = mock.MagicMock(status_code=200, headers={"Content-Type": "image/jpeg"})
+            hit.iter_content.return_value = [make_jpeg()]
+            with mock.patch("bing_wallpaper.health", store), \
+                    mock.patch("bing_wallpaper.http_cache", None), \
+                    mock.patch("bing_wallpaper.requests.Session") as session_cls:
+                session = session_cls.return_value.__enter__.return_value
+                session.get.side_effect = [requests.ConnectionError("refused"), server_error, not_found, hit]
+                bing_wallpaper.download_first([f"http://mirror:8080/{i}.jpg" for i in range(4)])
+            breaker = store.breakers[("host", "mirror:8080")]
+            assert breaker.total_failures == 2 and breaker.successes == 2
+            assert breaker.state == CLOSED
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the shared on-disk HTTP cache
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import bing_wallpaper
+from conftest import make_jpeg
+from http_cache import HttpCache, freshness_lifetime
+
+
+def response(status=200, content=b"{}", **headers):
+    return SimpleNamespace(status_code=status, content=content, headers=headers)
+
+
+class TestFreshness:
+    """Test Cache-Control / Expires handling"""
+
+    def test_max_age(self):
+        assert freshness_lifetime({"Cache-Control": "private, max-age=60"}, 5) == 60
+
+    def test_no_store_and_no_cache(self):
+        assert freshness_lifetime({"Cache-Control": "no-store"}, 5) is None
+        assert freshness_lifetime({"Cache-Control": "no-cache"}, 5) == 0
+
+    def test_expires(self):
+        headers = {"Date": "Mon, 20 Jan 2025 08:00:00 GMT", "Expires": "Mon, 20 Jan 2025 08:10:00 GMT"}
+        assert freshness_lifetime(headers, 5) == 600
+        assert freshness_lifetime({"Expires": "0"}, 5) == 0
+
+    def test_default_ttl(self):
+        assert freshness_lifetime({}, 5) == 5
+
+
+class TestHttpCache:
+    """Test hits, revalidation, sharing and eviction"""
+
+    def test_second_process_shares_response(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fetcher = mock.Mock(return_value=response(content=b'{"images": []}'))
+            first = HttpCache(Path(tmpdir))
+            second = HttpCache(Path(tmpdir))  # e.g. "Download Now" seconds after the scheduled run
+
+            assert first.fetch("http://x/meta", fetcher, 60).json() == {"images": []}
+            cached = second.fetch("http://x/meta", fetcher, 60)
+            assert cached.from_cache
+            assert fetcher.call_count == 1
+            assert first.stats["misses"] == 1
+            assert second.stats["hits"] == 1
+
+    def test_probe_before_fetch_is_not_a_miss(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HttpCache(Path(tmpdir))
+            assert cache.lookup("http://x/a") is None
+            cache.fetch("http://x/a", lambda u, h: response(), 60)
+            assert (cache.stats["misses"], cache.stats["probe_misses"]) == (1, 1)
+
+    def test_no_store_is_not_cached(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fetcher = mock.Mock(return_value=response(**{"Cache-Control": "no-store"}))
+            cache = HttpCache(Path(tmpdir))
+            cache.fetch("http://x/a", fetcher, 60)
+            cache.fetch("http://x/a", fetcher, 60)
+            assert fetcher.call_count == 2
+
+    def test_stale_entry_is_revalidated(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HttpCache(Path(tmpdir))
+            cache.fetch("http://x/a", lambda u, h: response(content=b"body", etag='"v1"',
+                                                            **{"Cache-Control": "max-age=0"}), 60)
+            seen = {}
+
+            def not_modified(url, headers):
+                seen.update(headers)
+                return response(status=304, content=b"", **{"Cache-Control": "max-age=60"})
+
+            result = cache.fetch("http://x/a", not_modified, 60)
+            assert seen == {"If-None-Match": '"v1"'}
+            assert result.content == b"body"
+            assert cache.stats["revalidated"] == 1
+            # Fresh again after the 304
+            assert cache.lookup("http://x/a").content == b"body"
+
+    def test_concurrent_fetch_makes_one_request(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            calls = []
+
+            def slow(url, headers):
+                calls.append(url)
+                time.sleep(0.2)
+                return response(content=b"shared")
+
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(HttpCache(Path(tmpdir)).fetch("http://x/a", slow, 60)))
+                       for _ in range(3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert len(calls) == 1
+            assert [r.content for r in results] == [b"shared"] * 3
+
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HttpCache(Path(tmpdir), max_bytes=10 ** 9)
+            for name in ("a", "b", "c"):
+                cache.store(f"http://x/{name}", 200, b"x" * 1000, {}, 60)
+            # Make "a" the most recently used, "b" the least
+            for i, name in enumerate(("b", "c", "a")):
+                os.utime(cache._entry_path(cache._key(f"http://x/{name}")), (1000 + i, 1000 + i))
+            cache.max_bytes = cache.size() - 1
+            assert cache.prune() == 1
+            assert cache.lookup("http://x/b") is None
+            assert cache.lookup("http://x/a") is not None
+            assert cache.stats["evictions"] == 1
+
+
+class TestDownloaderIntegration:
+    """Test that candidate probing remembers 404s"""
+
+    def test_known_missing_candidate_is_skipped(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HttpCache(Path(tmpdir))
+            cache.store("http://a/uhd.jpg", 404, b"", {}, 3600)
+            hit = mock.MagicMock()
+            hit.iter_content.return_value = [make_jpeg()]
+            hit.headers = {"Content-Type": "image/jpeg"}
+            with mock.patch("bing_wallpaper.http_cache", cache), \
+                    mock.patch("bing_wallpaper.requests.Session") as session_cls:
+                session = session_cls.return_value.__enter__.return_value
+                session.get.return_value = hit
+                bing_wallpaper.download_first(["http://a/uhd.jpg", "http://a/hd.jpg"])
+            assert [c.args[0] for c in session.get.call_args_list] == ["http://a/hd.jpg"]
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
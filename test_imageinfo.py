@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for header-only image validation
+"""
+import io
+from unittest import mock
+
+import numpy as np
+import pytest
+
+import bing_wallpaper
+from conftest import make_jpeg
+from imageinfo import ImageProbe, InvalidImage, inspect
+from telemetry import run_stats
+
+
+def encode(image_module, fmt: str, size=(96, 54), **options) -> bytes:
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    image_module.fromarray(pixels).save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def stream(data: bytes, chunk: int = 1000):
+    probe = ImageProbe()
+    for i in range(0, len(data), chunk):
+        probe.feed(data[i:i + chunk])
+    return probe.finish()
+
+
+class TestFormats:
+    """Test format and dimension detection against Pillow's encoders"""
+
+    @pytest.mark.parametrize("fmt,options,expected", [
+        ("JPEG", {}, "jpeg"),
+        ("JPEG", {"progressive": True, "exif": b"Exif\x00\x00" + b"\x00" * 5000}, "jpeg"),
+        ("PNG", {}, "png"),
+        ("WEBP", {"quality": 80}, "webp"),
+        ("WEBP", {"lossless": True}, "webp"),
+        ("BMP", {}, "bmp"),
+    ])
+    def test_dimensions(self, real_pil, fmt, options, expected):
+        data = encode(real_pil, fmt, (97, 55), **options)
+        info = stream(data, chunk=700)
+        assert (info.format, info.width, info.height, info.size) == (expected, 97, 55, len(data))
+        assert inspect(data) == info
+
+    def test_extended_webp(self, real_pil):
+        img = real_pil.new("RGBA", (33, 21), (1, 2, 3, 128))
+        buf = io.BytesIO()
+        img.save(buf, "WEBP", exif=b"Exif\x00\x00MM")
+        info = inspect(buf.getvalue())
+        assert (info.width, info.height) == (33, 21)
+        assert info.extension == ".webp"
+
+    def test_jpeg_stub(self):
+        info = inspect(make_jpeg(3840, 2160))
+        assert (info.content_type, info.width, info.height) == ("image/jpeg", 3840, 2160)
+
+
+class TestRejection:
+    """Test that broken data is rejected as early as possible"""
+
+    def test_html_rejected_on_first_chunk(self):
+        probe = ImageProbe()
+        with pytest.raises(InvalidImage, match="HTML"):
+            probe.feed(b"<!DOCTYPE html><html><body>Service unavailable")
+
+    def test_unknown_format(self):
+        with pytest.raises(InvalidImage, match="Unknown"):
+            inspect(b"GIF89a" + b"\x00" * 100)
+
+    @pytest.mark.parametrize("fmt", ["JPEG", "PNG", "WEBP", "BMP"])
+    def test_truncated(self, real_pil, fmt):
+        data = encode(real_pil, fmt)
+        with pytest.raises(InvalidImage, match="Truncated"):
+            stream(data[:len(data) - 100])
+
+    def test_truncated_header(self):
+        with pytest.raises(InvalidImage, match="header"):
+            inspect(b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00")
+
+    def test_too_short(self):
+        with pytest.raises(InvalidImage, match="Too short"):
+            inspect(b"\xff\xd8")
+
+    def test_corrupt_jpeg_segment(self):
+        with pytest.raises(InvalidImage, match="Corrupt JPEG"):
+            inspect(b"\xff\xd8\xff\xe0\x00\x10" + b"\x00" * 14 + b"garbage" * 10)
+
+
+class TestDownloadValidation:
+    """Test download_first with the streaming validator"""
+
+    def test_bad_candidate_stops_early(self):
+        run_stats.reset()
+        html = mock.MagicMock()
+        html.headers = {"Content-Type": "image/jpeg"}
+        sent = []
+
+        def html_chunks(size):
+            for i in range(100):
+                sent.append(i)
+                yield b"<html>" + b" " * 16000 if i == 0 else b" " * 16384
+
+        html.iter_content.side_effect = html_chunks
+        good = mock.MagicMock()
+        good.headers = {"Content-Type": "application/octet-stream"}
+        good.iter_content.return_value = [make_jpeg(1920, 1080)]
+        with mock.patch("bing_wallpaper.http_cache", None), \
+                mock.patch("bing_wallpaper.requests.Session") as session_cls:
+            session = session_cls.return_value.__enter__.return_value
+            session.get.side_effect = [html, good]
+            data, ct = bing_wallpaper.download_first(["http://a/uhd.jpg", "http://a/hd.png"])
+
+        assert sent == [0]
+        html.close.assert_called_once()
+        # Content type comes from the data, not the header
+        assert ct == "image/jpeg"
+        assert bing_wallpaper.guess_ext_from_ct(ct) == ".jpg"
+        assert run_stats.summary()["counters"]["candidate_invalid"] == 1
+
+    def test_truncated_body_is_rejected(self):
+        run_stats.reset()
+        cut = mock.MagicMock()
+        cut.iter_content.return_value = [make_jpeg()[:-500]]
+        with mock.patch("bing_wallpaper.http_cache", None), \
+                mock.patch("bing_wallpaper.requests.Session") as session_cls:
+            session_cls.return_value.__enter__.return_value.get.return_value = cut
+            with pytest.raises(InvalidImage):
+                bing_wallpaper.download_first(["http://a/uhd.jpg"])
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
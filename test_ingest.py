@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for library ingest and verification
+"""
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from ingest import MMAP_MIN_SIZE, ingest, sha256_file
+
+
+def write_image(image_module, path: Path, size=(64, 36), noise: bool = False) -> bytes:
+    img = image_module.new("RGB", size, (10, 80, 160))
+    if noise:
+        img = image_module.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    buf = io.BytesIO()
+    img.save(buf, "PNG" if path.suffix == ".png" else "JPEG")
+    path.write_bytes(buf.getvalue())
+    return buf.getvalue()
+
+
+class TestSha256File:
+    """Test memory-mapped hashing"""
+
+    def test_small_and_large_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for size in (0, 100, MMAP_MIN_SIZE + 1):
+                path = Path(tmpdir) / f"f{size}"
+                data = os.urandom(size)
+                path.write_bytes(data)
+                assert sha256_file(path) == (hashlib.sha256(data).hexdigest(), size)
+
+
+class TestIngest:
+    """Test building and repairing the index in one pass"""
+
+    def test_ingest_foreign_collection(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            data = write_image(real_pil, folder / "2024-05-01_Lake.jpg", (320, 180), noise=True)
+            write_image(real_pil, folder / "OHR.Desert_EN-US123_1920x1080.jpg")
+            write_image(real_pil, folder / "holiday.png", (40, 30))
+            (folder / "notes.txt").write_text("not an image")
+
+            index, report = ingest(folder, workers=3)
+            assert (report.files, report.added, report.errors) == (3, 3, [])
+            assert report.nbytes == sum(p.stat().st_size for p in folder.glob("*.*g"))
+            assert report.files_per_s > 0 and report.mb_per_s >= 0
+
+            lake = index.get("2024-05-01_Lake.jpg")
+            assert lake["sha256"] == hashlib.sha256(data).hexdigest()
+            assert (lake["width"], lake["height"], lake["date"], lake["slug"]) == (320, 180, "2024-05-01", "Lake")
+            assert index.get("OHR.Desert_EN-US123_1920x1080.jpg")["slug"] == "Desert"
+            assert index.get("holiday.png")["width"] == 40
+            assert (folder / ".library_index.json").exists()
+
+            # Second pass only lists the folder
+            _, report = ingest(folder)
+            assert (report.files, report.unchanged) == (0, 3)
+
+    def test_repair_removed_and_changed_files(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            write_image(real_pil, folder / "2024-05-01_Lake.jpg")
+            write_image(real_pil, folder / "2024-05-02_Hill.jpg")
+            ingest(folder)
+            (folder / "2024-05-02_Hill.jpg").unlink()
+            write_image(real_pil, folder / "2024-05-01_Lake.jpg", (128, 72))
+
+            index, report = ingest(folder)
+            assert (report.removed, report.updated, report.mismatched) == (1, 1, [])
+            assert index.get("2024-05-01_Lake.jpg")["width"] == 128
+
+    def test_replaced_file_loses_stale_analytics(self, real_pil):
+        """Test that luma, hashes and duplicate marks of the old image are dropped when the content changes"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            write_image(real_pil, folder / "2024-05-01_Lake.jpg")
+            write_image(real_pil, folder / "2024-05-02_Hill.jpg", (50, 50))
+            index, _ = ingest(folder)
+            for name in ("2024-05-01_Lake.jpg", "2024-05-02_Hill.jpg"):
+                index.update(name, luma=0.2, colors=[], phash="ab", duplicate_of="x.jpg")
+            index.save()
+            write_image(real_pil, folder / "2024-05-01_Lake.jpg", (128, 72), noise=True)
+
+            index, _ = ingest(folder)
+            lake, hill = index.get("2024-05-01_Lake.jpg"), index.get("2024-05-02_Hill.jpg")
+            assert not {"luma", "colors", "phash", "duplicate_of"} & set(lake)
+            assert lake["width"] == 128
+            assert (hill["luma"], hill["phash"]) == (0.2, "ab")
+
+    def test_verify_detects_bit_rot(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            path = folder / "2024-05-01_Lake.jpg"
+            write_image(real_pil, path)
+            write_image(real_pil, folder / "2024-05-02_Hill.jpg", (50, 50))
+            ingest(folder)
+
+            st = path.stat()
+            data = bytearray(path.read_bytes())
+            data[len(data) // 2] ^= 0xFF
+            path.write_bytes(bytes(data))
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+            assert ingest(folder)[1].mismatched == []  # size and mtime unchanged: not re-read
+            _, report = ingest(folder, verify=True)
+            assert report.mismatched == ["2024-05-01_Lake.jpg"]
+            assert report.unchanged == 1
+
+    def test_truncated_file_is_reported(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            data = write_image(real_pil, folder / "2024-05-01_Lake.jpg", (320, 180), noise=True)
+            (folder / "2024-05-01_Lake.jpg").write_bytes(data[:len(data) // 2])
+            index, report = ingest(folder)
+            assert list(report.invalid) == ["2024-05-01_Lake.jpg"]
+            assert "Truncated" in index.get("2024-05-01_Lake.jpg")["invalid"]
+
+            write_image(real_pil, folder / "2024-05-01_Lake.jpg", (320, 180))
+            index, report = ingest(folder)
+            assert report.invalid == {}
+            assert "invalid" not in index.get("2024-05-01_Lake.jpg")
+
+    def test_exact_duplicates(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            data = write_image(real_pil, folder / "2024-05-01_Lake.jpg")
+            (folder / "lake copy.jpg").write_bytes(data)
+            _, report = ingest(folder)
+            assert report.exact_duplicates == {"2024-05-01_Lake.jpg": ["lake copy.jpg"]}
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the crash-safe run journal
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+import bing_wallpaper
+from journal import DOWNLOADING, PLANNED, VERIFIED, WRITTEN, RunJournal, sha256_bytes
+
+
+def make_imgs(n=3):
+    return [{"startdate": f"2025011{i}", "urlbase": f"/th?id=OHR.Img{i}_DE{i}", "url": f"/th?id=OHR.Img{i}_DE{i}_1920x1080.jpg"}
+            for i in range(n)]
+
+
+def make_args(out_dir: Path, mode: str = "unique"):
+    return argparse.Namespace(out=str(out_dir), res="1920x1080", mkt="de-DE", fallback_mkts="", count=3,
+                              mode=mode, name_mode="slug", set_latest=False)
+
+
+def fake_download(urls):
+    return urls[0].encode() * 1000, "image/jpeg"
+
+
+class TestRunJournal:
+    """Test journal state transitions and persistence"""
+
+    def test_states_and_resume(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            imgs = make_imgs(2)
+            journal = RunJournal(tmp / "journal.json", tmp, "skip")
+            journal.begin("de-DE", imgs)
+            assert journal.counts()[PLANNED] == 2
+
+            data = b"image-bytes"
+            (tmp / "a.jpg").write_bytes(data)
+            journal.mark(imgs[0], WRITTEN, filename="a.jpg", size=len(data), sha256=sha256_bytes(data))
+            journal.mark(imgs[1], DOWNLOADING)
+
+            resumed = RunJournal(tmp / "journal.json", tmp, "skip")
+            assert resumed.load()
+            assert resumed.images() == imgs
+            assert resumed.verify(imgs[0]) == tmp / "a.jpg"
+            assert resumed.entry(imgs[0])["state"] == VERIFIED
+            assert resumed.verify(imgs[1]) is None
+
+            resumed.finish()
+            assert not (tmp / "journal.json").exists()
+
+    def test_corrupt_file_is_not_verified(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            imgs = make_imgs(1)
+            journal = RunJournal(tmp / "journal.json", tmp, "skip")
+            journal.begin("de-DE", imgs)
+            (tmp / "a.jpg").write_bytes(b"other-bytes")
+            journal.mark(imgs[0], WRITTEN, filename="a.jpg", size=11, sha256=sha256_bytes(b"image-bytes"))
+            assert journal.verify(imgs[0]) is None
+
+    def test_stale_or_foreign_journal_is_discarded(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            RunJournal(tmp / "journal.json", tmp, "skip").begin("de-DE", make_imgs(1))
+            assert not RunJournal(tmp / "journal.json", tmp, "unique").load()
+            assert not (tmp / "journal.json").exists()
+
+            RunJournal(tmp / "journal.json", tmp, "skip").begin("de-DE", make_imgs(1))
+            assert not RunJournal(tmp / "journal.json", tmp, "skip").load(now=time.time() + 86400)
+            assert not RunJournal(tmp / "journal.json", tmp, "skip").load(now=time.time() - 86400)
+
+
+class TestResumeRun:
+    """Test that run() resumes an interrupted run"""
+
+    def test_interrupted_run_resumes_without_duplicates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            out_dir = tmp / "wallpapers"
+            config = {"analytics_enabled": False}
+            real_sha = bing_wallpaper.sha256_bytes
+            calls = {"n": 0}
+
+            def crash_on_second(data):
+                calls["n"] += 1
+                if calls["n"] == 2:
+                    # Killed after the second file was renamed into place, before the journal update
+                    raise KeyboardInterrupt
+                return real_sha(data)
+
+            with mock.patch("bing_wallpaper.CONFIG_FILE", tmp / "config.json"), \
+                    mock.patch("bing_wallpaper.fetch_images_json", return_value=make_imgs()) as fetch, \
+                    mock.patch("bing_wallpaper.download_first", side_effect=fake_download) as download:
+                with mock.patch("bing_wallpaper.sha256_bytes", side_effect=crash_on_second):
+                    with pytest.raises(KeyboardInterrupt):
+                        bing_wallpaper.run(make_args(out_dir), config)
+                journal = json.loads((tmp / "run_journal.json").read_text(encoding="utf-8"))
+                states = sorted(e["state"] for e in journal["images"].values())
+                assert states == [DOWNLOADING, DOWNLOADING, VERIFIED]
+
+                fetch.reset_mock()
+                download.reset_mock()
+                assert bing_wallpaper.run(make_args(out_dir), config) == 0
+
+                fetch.assert_not_called()
+                assert download.call_count == 2
+                names = sorted(p.name for p in out_dir.iterdir() if not p.name.startswith("."))
+                assert names == ["2025-01-10_Img0.jpg", "2025-01-11_Img1.jpg", "2025-01-12_Img2.jpg"]
+                assert not (tmp / "run_journal.json").exists()
+
+    def test_journal_from_yesterday_fetches_todays_image(self):
+        """Test that an old journal is not resumed, but its saved images are not downloaded again"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            out_dir = tmp / "wallpapers"
+            out_dir.mkdir()
+            yesterday = make_imgs(3)
+            journal = RunJournal(tmp / "run_journal.json", out_dir, "unique")
+            journal.begin("de-DE", yesterday)
+            data = b"saved-yesterday"
+            (out_dir / "2025-01-10_Img0.jpg").write_bytes(data)
+            journal.mark(yesterday[0], VERIFIED, filename="2025-01-10_Img0.jpg", size=len(data),
+                         sha256=sha256_bytes(data))
+            journal.data["started"] -= 86400
+            journal.save()
+
+            today = [{"startdate": "20250113", "urlbase": "/th?id=OHR.New_DE", "url": "/th?id=OHR.New_DE_1920x1080.jpg"}]
+            today += yesterday[:2]
+            args = make_args(out_dir)
+            args.set_latest = True
+            with mock.patch("bing_wallpaper.CONFIG_FILE", tmp / "config.json"), \
+                    mock.patch("bing_wallpaper.fetch_images_json", return_value=today) as fetch, \
+                    mock.patch("bing_wallpaper.download_first", side_effect=fake_download) as download, \
+                    mock.patch("bing_wallpaper.set_wallpaper") as set_wallpaper:
+                assert bing_wallpaper.run(args, {"analytics_enabled": False}) == 0
+
+            assert fetch.call_count == 1
+            assert [c.args[0][0] for c in download.call_args_list] == [
+                bing_wallpaper.build_candidate_urls(img, ["1920x1080"])[0] for img in (today[0], today[2])]
+            assert (out_dir / "2025-01-10_Img0.jpg").read_bytes() == data
+            assert not (out_dir / "2025-01-10_Img0_1.jpg").exists()
+            assert set_wallpaper.call_args.args[0].name == "2025-01-13_New.jpg"
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the shared logging setup
+"""
+import logging
+import logging.handlers
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+import logger as log_module
+from logger import DailyFileHandler, setup_logger, cleanup_old_logs
+
+
+def make_record(created: float, msg: str = "hello") -> logging.LogRecord:
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+    record.created = created
+    return record
+
+
+class TestDailyFileHandler:
+    """Test date-based log file switching"""
+
+    def test_writes_to_todays_file(self):
+        """Test that records go to the file for the current day"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = DailyFileHandler(Path(tmpdir), "unit")
+            handler.emit(make_record(time.time()))
+            handler.close()
+            expected = Path(tmpdir) / f"unit_{datetime.now().strftime('%Y%m%d')}.log"
+            assert expected.exists()
+            assert "hello" in expected.read_text(encoding="utf-8")
+
+    def test_rolls_over_at_midnight(self):
+        """Test that the first record after midnight opens the next day's file"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = DailyFileHandler(Path(tmpdir), "unit")
+            handler.emit(make_record(time.time(), "today"))
+            tomorrow = datetime.now() + timedelta(days=1)
+            after_midnight = datetime(tomorrow.year, tomorrow.month, tomorrow.day, 0, 0, 1).timestamp()
+            handler.emit(make_record(after_midnight, "tomorrow"))
+            handler.close()
+
+            next_file = Path(tmpdir) / f"unit_{tomorrow.strftime('%Y%m%d')}.log"
+            assert next_file.exists()
+            assert "tomorrow" in next_file.read_text(encoding="utf-8")
+            assert "tomorrow" not in (Path(tmpdir) / f"unit_{datetime.now().strftime('%Y%m%d')}.log").read_text(
+                encoding="utf-8")
+
+    def test_cleanup_is_throttled(self, monkeypatch):
+        """Test that the log directory is scanned once per interval, not per record"""
+        calls = []
+        monkeypatch.setattr(log_module, "cleanup_old_logs", lambda *args: calls.append(args))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = DailyFileHandler(Path(tmpdir), "unit", cleanup_interval=3600)
+            for _ in range(5):
+                handler.emit(make_record(time.time()))
+            handler.close()
+        assert len(calls) == 1
+
+
+class TestSetupLogger:
+    """Test queue-based logger setup"""
+
+    def test_logger_uses_queue_handler(self):
+        """Test that the logger itself only has a non-blocking QueueHandler"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            name = f"unit_queue_{os.getpid()}"
+            lg = setup_logger(name, log_dir=Path(tmpdir))
+            try:
+                assert len(lg.handlers) == 1
+                assert isinstance(lg.handlers[0], logging.handlers.QueueHandler)
+
+                lg.info("queued message")
+                listener = log_module._listeners.pop(name)
+                listener.stop()
+                for handler in listener.handlers:
+                    handler.close()
+
+                log_file = Path(tmpdir) / f"{name}_{datetime.now().strftime('%Y%m%d')}.log"
+                assert "queued message" in log_file.read_text(encoding="utf-8")
+            finally:
+                lg.handlers.clear()
+
+    def test_setup_logger_does_not_scan_directory(self, monkeypatch):
+        """Test that setup_logger leaves cleanup to the listener thread"""
+        calls = []
+        monkeypatch.setattr(log_module, "cleanup_old_logs", lambda *args: calls.append(args))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            name = f"unit_noscan_{os.getpid()}"
+            lg = setup_logger(name, log_dir=Path(tmpdir))
+            try:
+                assert calls == []
+            finally:
+                listener = log_module._listeners.pop(name)
+                listener.stop()
+                for handler in listener.handlers:
+                    handler.close()
+                lg.handlers.clear()
+
+
+class TestCleanupOldLogs:
+    """Test removal of old log files"""
+
+    def test_removes_only_old_logs(self):
+        """Test that files older than max_age_days are deleted"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            old = Path(tmpdir) / "tray_20000101.log"
+            new = Path(tmpdir) / "tray_today.log"
+            old.write_text("old")
+            new.write_text("new")
+            old_time = (datetime.now() - timedelta(days=30)).timestamp()
+            os.utime(old, (old_time, old_time))
+
+            cleanup_old_logs(Path(tmpdir), max_age_days=7)
+
+            assert not old.exists()
+            assert new.exists()
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for metrics export
+"""
+import json
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+from fileutil import atomic_write_text
+from metrics import MetricsRegistry, downloader_registry, record_run, update_locked
+
+
+class TestMetricsRegistry:
+    """Test recording and export"""
+
+    def test_counter_with_labels(self):
+        """Test that labelled counters are tracked separately"""
+        r = MetricsRegistry()
+        r.counter("runs", "Runs")
+        r.inc("runs", result="success")
+        r.inc("runs", result="success")
+        r.inc("runs", result="failure")
+        assert r.value("runs", result="success") == 2
+        assert r.value("runs", result="failure") == 1
+
+    def test_histogram_openmetrics_is_cumulative(self):
+        """Test that histogram buckets are exported cumulatively"""
+        r = MetricsRegistry(prefix="t")
+        r.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        r.observe("latency_seconds", 0.05)
+        r.observe("latency_seconds", 0.5)
+        r.observe("latency_seconds", 5.0)
+        text = r.to_openmetrics()
+        assert 't_latency_seconds_bucket{le="0.1"} 1' in text
+        assert 't_latency_seconds_bucket{le="1.0"} 2' in text
+        assert 't_latency_seconds_bucket{le="+Inf"} 3' in text
+        assert "t_latency_seconds_count 3" in text
+        assert text.endswith("# EOF\n")
+
+    def test_counter_openmetrics_total_suffix(self):
+        """Test that counters are exported with the _total suffix"""
+        r = MetricsRegistry(prefix="t")
+        r.counter("bytes", "Bytes")
+        r.inc("bytes", 42)
+        text = r.to_openmetrics()
+        assert "# TYPE t_bytes counter" in text
+        assert "t_bytes_total 42" in text
+
+    def test_write_and_load_roundtrip(self):
+        """Test that counters continue from the persisted JSON state"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            r = downloader_registry()
+            r.inc("bytes_downloaded", 100)
+            r.observe("run_duration_seconds", 3.0)
+            r.write(Path(tmpdir), "downloader")
+            assert (Path(tmpdir) / "downloader.prom").exists()
+
+            r2 = downloader_registry()
+            assert r2.load(Path(tmpdir) / "downloader.json")
+            r2.inc("bytes_downloaded", 50)
+            assert r2.value("bytes_downloaded") == 150
+            assert r2.value("run_duration_seconds")["count"] == 1
+
+    def test_load_missing_file(self):
+        """Test that loading a missing state file is harmless"""
+        r = downloader_registry()
+        assert r.load(Path("does_not_exist_metrics.json")) is False
+
+    def test_flush_if_due_throttles(self):
+        """Test that periodic flushes are throttled"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            r = MetricsRegistry()
+            r.counter("x", "X")
+            assert r.flush_if_due(Path(tmpdir), "tray", interval=60) is True
+            assert r.flush_if_due(Path(tmpdir), "tray", interval=60) is False
+
+
+class TestRecordRun:
+    """Test folding a run summary into downloader metrics"""
+
+    def test_record_run(self):
+        """Test that summary counters map onto metric families"""
+        r = downloader_registry()
+        summary = {
+            "wall_s": 1.5,
+            "counters": {"bytes_downloaded": 1000, "bytes_skipped": 200, "candidate_404s": 3,
+                         "market_fallbacks": 1, "files_written": 2},
+            "spans": {"set_wallpaper": {"count": 1, "total_s": 0.2, "max_s": 0.2}},
+        }
+        record_run(r, summary, success=True)
+        assert r.value("runs", result="success") == 1
+        assert r.value("bytes_downloaded") == 1000
+        assert r.value("bytes_skipped") == 200
+        assert r.value("candidate_404") == 3
+        assert r.value("market_fallbacks") == 1
+        assert r.value("wallpaper_set_seconds")["count"] == 1
+        assert r.value("last_run_success") == 1
+
+
+    def test_concurrent_runs_keep_all_increments(self):
+        """Test that runs exporting at the same time do not overwrite each other's counters"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out = Path(tmpdir)
+
+            def run():
+                for _ in range(10):
+                    update_locked(downloader_registry(), out, "downloader",
+                                  lambda r: record_run(r, {"counters": {"files_written": 1}}, True))
+
+            threads = [threading.Thread(target=run) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            r = downloader_registry()
+            r.load(out / "downloader.json")
+            assert r.value("images_written") == 40
+            assert r.value("runs", result="success") == 40
+
+
+class TestAtomicWrite:
+    """Test atomic file replacement"""
+
+    def test_atomic_write_replaces_and_leaves_no_temp(self):
+        """Test that the target is replaced and no temp file remains"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            target = Path(tmpdir) / "m.json"
+            target.write_text("old")
+            atomic_write_text(target, json.dumps({"a": 1}))
+            assert json.loads(target.read_text()) == {"a": 1}
+            assert [p.name for p in Path(tmpdir).iterdir()] == ["m.json"]
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the caching HPImageArchive mirror
+"""
+import json
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import pytest
+import requests
+
+import bing_wallpaper
+from conftest import make_jpeg
+from mirror import MirrorStore, create_server
+
+IMAGE = make_jpeg(size=64 * 1024)
+METADATA = {"images": [{"startdate": "20250120", "url": "/th?id=OHR.Lake_DE123_1920x1080.jpg",
+                        "urlbase": "/th?id=OHR.Lake_DE123"}]}
+
+
+class FakeBing(BaseHTTPRequestHandler):
+    """Upstream stand-in that counts requests per path"""
+
+    requests = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.requests.append(self.path)
+        if self.path.startswith("/HPImageArchive.aspx"):
+            body, ct, status = json.dumps(METADATA).encode(), "application/json", 200
+        elif "_1920x1080.jpg" in self.path:
+            threading.Event().wait(0.1)  # slow enough for clients to pile up
+            body, ct, status = IMAGE, "image/jpeg", 200
+        else:
+            body, ct, status = b"", "text/html", 404
+        self.send_response(status)
+        self.send_header("Content-Type", ct)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(server) -> str:
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture
+def mirror():
+    FakeBing.requests = []
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), FakeBing)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = MirrorStore(Path(tmpdir), start(upstream), {"User-Agent": "test"}, 900, 3600)
+        server = create_server(store, "127.0.0.1", 0)
+        url = start(server)
+        yield url, store
+        server.shutdown()
+        server.server_close()
+    upstream.shutdown()
+    upstream.server_close()
+
+
+class TestMirror:
+    """Test that the mirror asks upstream once per resource"""
+
+    def test_concurrent_clients_share_one_fetch(self, mirror):
+        url, store = mirror
+        image_url = url + "/th?id=OHR.Lake_DE123_1920x1080.jpg"
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            responses = list(pool.map(lambda _: requests.get(image_url, timeout=10), range(32)))
+        assert all(r.status_code == 200 and r.content == IMAGE for r in responses)
+        assert FakeBing.requests.count("/th?id=OHR.Lake_DE123_1920x1080.jpg") == 1
+        assert responses[0].headers["Content-Type"] == "image/jpeg"
+
+    def test_metadata_is_cached(self, mirror):
+        url, store = mirror
+        for _ in range(3):
+            r = requests.get(url + "/HPImageArchive.aspx?format=js&idx=0&n=8&mkt=de-DE", timeout=10)
+            assert r.json() == METADATA
+        assert len([p for p in FakeBing.requests if p.startswith("/HPImageArchive")]) == 1
+        assert store.stats["hits"] == 2
+
+    def test_missing_image_is_remembered(self, mirror):
+        url, _ = mirror
+        for _ in range(2):
+            assert requests.get(url + "/th?id=OHR.Lake_DE123_UHD.jpg", timeout=10).status_code == 404
+        assert FakeBing.requests.count("/th?id=OHR.Lake_DE123_UHD.jpg") == 1
+
+    def test_unknown_path(self, mirror):
+        url, _ = mirror
+        assert requests.get(url + "/search?q=x", timeout=10).status_code == 404
+        assert FakeBing.requests == []
+
+
+class TestDesktopAgainstMirror:
+    """Test the downloader with bing_base pointing at a mirror"""
+
+    def test_fetch_and_download_through_mirror(self, mirror):
+        url, _ = mirror
+        with mock.patch("bing_wallpaper.BING_BASE", url), mock.patch("bing_wallpaper.http_cache", None):
+            imgs = bing_wallpaper.fetch_images_json("de-DE", 0, 8)
+            urls = bing_wallpaper.build_candidate_urls(imgs[0], ["UHD", "1920x1080"])
+            data, ct = bing_wallpaper.download_first(urls)
+        assert all(u.startswith(url) for u in urls)
+        assert data == IMAGE and ct == "image/jpeg"
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
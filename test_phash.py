@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for perceptual hashing and near-duplicate detection
+"""
+import io
+import random
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bing_wallpaper import check_duplicate
+from dedupe import backfill_hashes, find_duplicates
+from library_index import LibraryIndex
+from phash import BKTree, DuplicateFinder, from_hex, hamming, image_hashes
+
+
+def scene(seed: int, size=(480, 270)) -> np.ndarray:
+    """Smooth synthetic 'photo' made of a few random blobs"""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    y, x = np.mgrid[0:h, 0:w] / max(w, h)
+    img = np.zeros((h, w), dtype=np.float64)
+    for _ in range(6):
+        cx, cy, r, a = rng.random(4)
+        img += a * np.exp(-((x - cx) ** 2 + (y - cy * h / w) ** 2) / (0.02 + 0.1 * r))
+    img = 255 * img / img.max()
+    return np.stack([img, img * 0.8, 255 - img], axis=-1).astype(np.uint8)
+
+
+def jpeg_bytes(image_module, pixels: np.ndarray, size=None, crop: float = 0.0, quality: int = 90) -> bytes:
+    img = image_module.fromarray(pixels)
+    if crop:
+        w, h = img.size
+        dx, dy = int(w * crop), int(h * crop)
+        img = img.crop((dx, dy, w - dx, h - dy))
+    if size:
+        img = img.resize(size)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def distance(a: dict, b: dict, kind: str = "phash") -> int:
+    return hamming(from_hex(a[kind]), from_hex(b[kind]))
+
+
+class TestHashes:
+    """Test that hashes survive re-scaling and light cropping"""
+
+    def test_resized_copy_is_near(self, real_pil):
+        pixels = scene(1)
+        a = image_hashes(jpeg_bytes(real_pil, pixels))
+        b = image_hashes(jpeg_bytes(real_pil, pixels, size=(192, 108), quality=60))
+        assert distance(a, b) <= 8
+        assert distance(a, b, "dhash") <= 8
+
+    def test_cropped_copy_is_near(self, real_pil):
+        pixels = scene(2)
+        a = image_hashes(jpeg_bytes(real_pil, pixels))
+        b = image_hashes(jpeg_bytes(real_pil, pixels, crop=0.03))
+        assert distance(a, b) <= 10
+
+    def test_different_images_are_far(self, real_pil):
+        a = image_hashes(jpeg_bytes(real_pil, scene(3)))
+        b = image_hashes(jpeg_bytes(real_pil, scene(4)))
+        assert distance(a, b) > 10
+
+    def test_hash_format(self, real_pil):
+        hashes = image_hashes(jpeg_bytes(real_pil, scene(5)))
+        assert set(hashes) == {"phash", "dhash"}
+        assert all(len(v) == 16 for v in hashes.values())
+
+
+class TestBKTree:
+    """Test the BK-tree against a brute-force scan"""
+
+    def test_search_matches_brute_force(self):
+        rng = random.Random(42)
+        values = [rng.getrandbits(64) for _ in range(500)]
+        # Add some close neighbours so there is something to find
+        values += [v ^ (1 << rng.randrange(64)) for v in values[:50]]
+        tree = BKTree()
+        for i, v in enumerate(values):
+            tree.add(v, i)
+        for query in values[:20]:
+            expected = sorted(i for i, v in enumerate(values) if hamming(v, query) <= 6)
+            assert sorted(i for _, i in tree.search(query, 6)) == expected
+
+    def test_finder_exclude(self):
+        finder = DuplicateFinder(threshold=2)
+        finder.add("00000000000000ff", "a.jpg")
+        assert finder.find("00000000000000fe") == (1, "a.jpg")
+        assert finder.find("00000000000000fe", exclude=["a.jpg"]) is None
+
+
+class TestDownloaderCheck:
+    """Test the downloader's near-duplicate check before saving"""
+
+    def test_check_duplicate_finds_file_on_disk(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            pixels = scene(9)
+            original = folder / "2025-01-01_Lake.jpg"
+            original.write_bytes(jpeg_bytes(real_pil, pixels))
+            finder = DuplicateFinder(threshold=8)
+            finder.add(image_hashes(original)["phash"], original.name)
+
+            fields, dup = check_duplicate(finder, jpeg_bytes(real_pil, pixels, size=(240, 135)), folder)
+            assert dup == original
+            assert fields["duplicate_of"] == original.name
+
+            # Overwriting the same file is not a duplicate of itself
+            _, dup = check_duplicate(finder, original.read_bytes(), folder, original.name)
+            assert dup is None
+
+            fields, dup = check_duplicate(finder, jpeg_bytes(real_pil, scene(10)), folder)
+            assert dup is None
+            assert "phash" in fields and "duplicate_of" not in fields
+
+
+class TestDedupe:
+    """Test library-wide duplicate grouping"""
+
+    def test_groups_oldest_first(self, real_pil):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            pixels = scene(7)
+            (folder / "2025-01-01_Lake.jpg").write_bytes(jpeg_bytes(real_pil, pixels))
+            (folder / "2025-01-05_LakeUS.jpg").write_bytes(jpeg_bytes(real_pil, pixels, size=(240, 135)))
+            (folder / "2025-01-03_Desert.jpg").write_bytes(jpeg_bytes(real_pil, scene(8)))
+
+            index = LibraryIndex.open(folder)
+            assert backfill_hashes(index, workers=2) == 3
+            assert backfill_hashes(index) == 0
+            groups = find_duplicates(index, threshold=8)
+            assert groups == {"2025-01-01_Lake.jpg": ["2025-01-05_LakeUS.jpg"]}
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the library index and retention policy
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+import bing_wallpaper
+from conftest import make_jpeg
+from library_index import LibraryIndex, parse_filename
+from retention import RetentionPolicy, apply_retention, protected_names, select_evictions, select_unwanted
+from telemetry import run_stats
+
+
+def make_library(folder: Path, days, size: int = 100):
+    """Create one file per date string with the given size"""
+    paths = []
+    for i, day in enumerate(days):
+        path = folder / f"{day}_Image{i}.jpg"
+        path.write_bytes(b"x" * size)
+        ts = datetime.strptime(day, "%Y-%m-%d").timestamp()
+        os.utime(path, (ts, ts))
+        paths.append(path)
+    return paths
+
+
+class TestParseFilename:
+    """Test mapping filenames back to date and slug"""
+
+    def test_slug_filename(self):
+        assert parse_filename("2025-01-17_Waterfall.jpg") == ("2025-01-17", "Waterfall")
+
+    def test_unique_suffix(self):
+        assert parse_filename("2025-01-17_Waterfall_2.jpg") == ("2025-01-17", "Waterfall")
+
+    def test_foreign_filename(self):
+        assert parse_filename("holiday.jpg") == (None, None)
+
+    def test_bing_filename(self):
+        assert parse_filename("OHR.Waterfall_DE-DE1234567890_UHD.jpg") == (None, "Waterfall")
+
+
+class TestLibraryIndex:
+    """Test index persistence and reconciliation"""
+
+    def test_sync_adds_and_removes(self):
+        """Test that sync picks up new files and drops deleted ones"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            paths = make_library(folder, ["2025-01-01", "2025-01-02"])
+            (folder / "notes.txt").write_text("not an image")
+
+            index = LibraryIndex.open(folder)
+            assert set(index.names()) == {p.name for p in paths}
+            index.save()
+
+            paths[0].unlink()
+            index = LibraryIndex.open(folder)
+            assert set(index.names()) == {paths[1].name}
+
+    def test_sync_does_not_restat_known_files(self):
+        """Test that entries already in the index are trusted"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            make_library(folder, ["2025-01-01"])
+            index = LibraryIndex.open(folder)
+            index.save()
+
+            index = LibraryIndex(folder)
+            index.load()
+            added, removed = index.sync()
+            assert (added, removed) == (0, 0)
+            assert index.dirty is False
+
+    def test_save_and_load_roundtrip(self):
+        """Test that extra fields survive a save/load cycle"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            paths = make_library(folder, ["2025-01-01"])
+            index = LibraryIndex.open(folder)
+            index.update(paths[0].name, sha256="abc")
+            index.save()
+
+            reloaded = LibraryIndex.open(folder)
+            assert reloaded.get(paths[0].name)["sha256"] == "abc"
+            assert reloaded.get(paths[0].name)["date"] == "2025-01-01"
+
+
+class TestRetention:
+    """Test eviction selection"""
+
+    def test_disabled_policy_evicts_nothing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_library(Path(tmpdir), ["2025-01-01", "2025-01-02"])
+            index = LibraryIndex.open(Path(tmpdir))
+            assert select_evictions(index, RetentionPolicy()) == []
+
+    def test_max_count_evicts_oldest(self):
+        """Test that the oldest files go first when over the count limit"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = make_library(Path(tmpdir), ["2025-01-03", "2025-01-01", "2025-01-02"])
+            index = LibraryIndex.open(Path(tmpdir))
+            evict = select_evictions(index, RetentionPolicy(max_count=2))
+            assert evict == [paths[1].name]
+
+    def test_max_bytes(self):
+        """Test that files are evicted until under the byte limit"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_library(Path(tmpdir), ["2025-01-01", "2025-01-02", "2025-01-03"], size=100)
+            index = LibraryIndex.open(Path(tmpdir))
+            evict = select_evictions(index, RetentionPolicy(max_bytes=150))
+            assert len(evict) == 2
+
+    def test_max_age(self):
+        """Test that files older than max_age_days are evicted"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = make_library(Path(tmpdir), ["2025-01-01", "2025-01-19"])
+            index = LibraryIndex.open(Path(tmpdir))
+            evict = select_evictions(index, RetentionPolicy(max_age_days=7), now=datetime(2025, 1, 20))
+            assert evict == [paths[0].name]
+
+    def test_protected_files_are_kept(self):
+        """Test that pinned/current files are never evicted"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = make_library(Path(tmpdir), ["2025-01-01", "2025-01-02", "2025-01-03"])
+            index = LibraryIndex.open(Path(tmpdir))
+            protected = protected_names({"favorites": [paths[0].name]}, paths[1])
+            evict = select_evictions(index, RetentionPolicy(max_count=1), protected)
+            # Protected files still count toward the limit but are never selected
+            assert evict == [paths[2].name]
+
+    def test_apply_retention_deletes_and_updates_index(self):
+        """Test that evicted files are removed from disk and index"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = make_library(Path(tmpdir), ["2025-01-01", "2025-01-02"], size=50)
+            index = LibraryIndex.open(Path(tmpdir))
+            removed, freed = apply_retention(index, RetentionPolicy(max_count=1))
+            assert removed == [paths[0].name]
+            assert freed == 50
+            assert not paths[0].exists()
+            assert paths[0].name not in index.entries
+
+    def test_unwanted_downloads(self):
+        """Test that images which would be evicted right after writing are picked before downloading"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_library(Path(tmpdir), ["2025-01-18", "2025-01-19"])
+            index = LibraryIndex.open(Path(tmpdir))
+            now = datetime(2025, 1, 20)
+            dates = ["2025-01-20", "2025-01-19", "2025-01-18", "2025-01-17"]
+            assert select_unwanted(index, RetentionPolicy(max_count=2), dates, now=now) == {2, 3}
+            assert select_unwanted(index, RetentionPolicy(max_age_days=2), dates, now=now) == {3}
+            assert select_unwanted(index, RetentionPolicy(max_count=1), dates[1:], now=now) == {1, 2}
+            assert select_unwanted(index, RetentionPolicy(max_bytes=1), dates, now=now) == set()
+
+    def test_policy_from_config(self):
+        policy = RetentionPolicy.from_config({"retention_max_mb": 2, "retention_max_count": 10})
+        assert policy.max_bytes == 2 * 1024 * 1024
+        assert policy.max_count == 10
+        assert policy.max_age_days is None
+        assert policy.enabled
+
+
+
+class TestDownloaderRetention:
+    """Test that the downloader does not fetch images the policy removes again"""
+
+    def test_second_run_downloads_nothing_to_evict(self):
+        imgs = [{"startdate": f"2025012{9 - i}", "urlbase": f"/th?id=OHR.Img{i}_DE{i}"} for i in range(6)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            args = argparse.Namespace(out=str(tmp / "out"), res="1920x1080", mkt="de-DE", fallback_mkts="",
+                                      count=6, mode="skip", name_mode="slug", set_latest=False)
+            config = {"analytics_enabled": False, "retention_max_count": 2}
+            for _ in range(2):
+                run_stats.reset()
+                with mock.patch("bing_wallpaper.CONFIG_FILE", tmp / "config.json"), \
+                        mock.patch("bing_wallpaper.fetch_images_json", return_value=imgs), \
+                        mock.patch("bing_wallpaper.download_first",
+                                   return_value=(make_jpeg(), "image/jpeg")) as download:
+                    assert bing_wallpaper.run(args, config) == 0
+                # Only the two images the policy keeps are fetched; nothing is written only to be evicted
+                assert [c.args[0][0].split("OHR.")[1][:4] for c in download.call_args_list] == ["Img0", "Img1"]
+                counters = run_stats.summary()["counters"]
+                assert counters["images_retention_skipped"] == 4
+                assert counters.get("files_evicted", 0) == 0
+            assert sorted(p.name for p in (tmp / "out").glob("*.jpg")) == ["2025-01-28_Img1.jpg", "2025-01-29_Img0.jpg"]
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
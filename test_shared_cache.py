@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the shared (fleet) image cache
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+import bing_wallpaper
+from shared_cache import LOCKS_DIR, OBJECTS_DIR, SharedCache, candidates_key
+
+URLS = ["https://www.bing.com/th?id=OHR.Lake_DE_UHD.jpg", "https://www.bing.com/th?id=OHR.Lake_DE_1920x1080.jpg"]
+
+
+def downloader(calls, delay=0.0):
+    def download(urls):
+        calls.append(urls)
+        time.sleep(delay)
+        return b"jpeg" * 1000, "image/jpeg"
+    return download
+
+
+class TestSharedCache:
+    """Test download-once behaviour across machines"""
+
+    def test_second_machine_copies_from_pool(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            calls = []
+            first, second = SharedCache(Path(tmpdir)), SharedCache(Path(tmpdir))
+            assert first.fetch(URLS, downloader(calls), lambda ct: ".jpg") == (b"jpeg" * 1000, "image/jpeg")
+            assert second.fetch(URLS, downloader(calls)) == (b"jpeg" * 1000, "image/jpeg")
+            assert len(calls) == 1
+            assert (first.stats["misses"], second.stats["hits"]) == (1, 1)
+            assert list((Path(tmpdir) / OBJECTS_DIR).rglob("*.jpg"))
+
+    def test_other_resolution_is_separate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            calls = []
+            cache = SharedCache(Path(tmpdir))
+            cache.fetch(URLS, downloader(calls))
+            cache.fetch(URLS[1:], downloader(calls))
+            assert len(calls) == 2
+
+    def test_concurrent_machines_download_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            calls, results = [], []
+            with mock.patch("shared_cache.LOCK_POLL", 0.01):
+                threads = [threading.Thread(target=lambda: results.append(
+                    SharedCache(Path(tmpdir)).fetch(URLS, downloader(calls, delay=0.2)))) for _ in range(4)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+            assert len(calls) == 1
+            assert len(results) == 4 and len(set(results)) == 1
+
+    def test_corrupt_object_is_downloaded_again(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            calls = []
+            cache = SharedCache(Path(tmpdir))
+            cache.fetch(URLS, downloader(calls))
+            obj = next(p for p in (Path(tmpdir) / OBJECTS_DIR).rglob("*") if p.is_file())
+            obj.write_bytes(b"truncated")
+            assert cache.get(URLS) is None
+            assert cache.fetch(URLS, downloader(calls))[0] == b"jpeg" * 1000
+            assert len(calls) == 2
+            assert cache.get(URLS) is not None
+
+    def test_unreachable_share_downloads_directly(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            blocker = Path(tmpdir) / "share"
+            blocker.write_text("not a folder")
+            calls = []
+            cache = SharedCache(blocker)
+            assert cache.fetch(URLS, downloader(calls))[1] == "image/jpeg"
+            assert len(calls) == 1
+            assert cache.stats["errors"] >= 1
+
+    def test_unwritable_lock_downloads_directly(self):
+        """Test that a lock file that cannot be created (read-only share, pending delete) does not fail the fetch"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            real_open = os.open
+
+            def deny_locks(path, *args, **kwargs):
+                if str(path).endswith(".lock"):
+                    raise PermissionError(13, "Access is denied", str(path))
+                return real_open(path, *args, **kwargs)
+
+            calls = []
+            with mock.patch("fileutil.os.open", side_effect=deny_locks):
+                assert SharedCache(Path(tmpdir)).fetch(URLS, downloader(calls)) == (b"jpeg" * 1000, "image/jpeg")
+            assert len(calls) == 1
+
+    def test_stale_lock_that_cannot_be_removed_times_out(self):
+        """Test that a stale lock owned by someone else is waited for like a busy one, not spun on"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            lock = Path(tmpdir) / LOCKS_DIR / f"{candidates_key(URLS)}.lock"
+            lock.parent.mkdir()
+            lock.touch()
+            old = time.time() - 3600
+            os.utime(lock, (old, old))
+            real_unlink = Path.unlink
+
+            def deny_unlink(path, *args, **kwargs):
+                if path == lock:
+                    raise PermissionError(13, "Access is denied", str(path))
+                return real_unlink(path, *args, **kwargs)
+
+            calls = []
+            with mock.patch("shared_cache.LOCK_WAIT", 0.5), mock.patch("shared_cache.LOCK_POLL", 0.01), \
+                    mock.patch.object(Path, "unlink", deny_unlink):
+                start = time.monotonic()
+                assert SharedCache(Path(tmpdir)).fetch(URLS, downloader(calls))[1] == "image/jpeg"
+                assert time.monotonic() - start < 5
+            assert len(calls) == 1
+
+    def test_prune_keeps_recently_used_objects(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = SharedCache(Path(tmpdir))
+            cache.put(URLS, b"old", "image/jpeg")
+            cache.put(URLS[1:], b"new", "image/jpeg")
+            old = time.time() - 30 * 86400
+            for path in Path(tmpdir).rglob("*"):
+                if path.is_file():
+                    os.utime(path, (old, old))
+            # Re-storing the same bytes refreshes the shared object
+            cache.put(URLS[1:], b"new", "image/jpeg")
+            assert cache.prune(max_age_days=14) == 1
+            assert cache.get(URLS) is None
+            assert cache.get(URLS[1:]) == (b"new", "image/jpeg")
+
+
+class TestDownloaderIntegration:
+    """Test that the downloader goes through the pool when configured"""
+
+    def test_open_shared_cache(self):
+        assert bing_wallpaper.open_shared_cache({}) is None
+        assert bing_wallpaper.open_shared_cache({"shared_cache_folder": "//server/bing"}) is not None
+
+    def test_download_images_uses_pool(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            img = {"startdate": "20250120", "urlbase": "/th?id=OHR.Lake_DE123"}
+            calls = []
+            with mock.patch("bing_wallpaper.shared_cache", SharedCache(Path(tmpdir))), \
+                    mock.patch("bing_wallpaper.download_first", side_effect=downloader(calls)):
+                first = bing_wallpaper.download_images([img], ["1920x1080"])
+                second = bing_wallpaper.download_images([img], ["1920x1080"])
+            assert first == second
+            assert len(calls) == 1
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the wallpaper slideshow
+"""
+import json
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+# Mock pystray and PIL before importing bing_wallpaper_tray
+sys.modules.setdefault('pystray', mock.MagicMock())
+sys.modules.setdefault('PIL', mock.MagicMock())
+sys.modules.setdefault('PIL.Image', mock.MagicMock())
+sys.modules.setdefault('PIL.ImageDraw', mock.MagicMock())
+
+from slideshow import PowerProvider, Slideshow, SlideshowSettings, select_playlist
+
+
+class FakePower(PowerProvider):
+    def __init__(self, battery=False, locked=False):
+        self.battery = battery
+        self.locked = locked
+
+    def on_battery(self):
+        return self.battery
+
+    def session_locked(self):
+        return self.locked
+
+
+@pytest.fixture
+def library():
+    """Five dated wallpapers, newest first"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for day in (20, 19, 18, 10, 1):
+            path = Path(tmpdir) / f"2025-03-{day:02d}_Day{day}.jpg"
+            path.write_bytes(b"x" * 100)
+            paths.append(path)
+        yield paths
+
+
+def make_show(paths, settings=None, **kwargs):
+    applied = []
+    settings = settings or SlideshowSettings(mode='all')
+    show = Slideshow(lambda: select_playlist(paths, show.settings), lambda p: applied.append(p) or True,
+                     settings, **kwargs)
+    return show, applied
+
+
+class TestPlaylist:
+    """Test choosing the wallpapers to rotate through"""
+
+    def test_modes(self, library):
+        """Test all, recent, favourites, date range and off"""
+        today = date(2025, 3, 20)
+        names = lambda paths: [p.name[:10] for p in paths]
+        assert len(select_playlist(library, SlideshowSettings(mode='all'))) == 5
+        assert names(select_playlist(library, SlideshowSettings(mode='recent', recent_days=3), today=today)) == \
+            ['2025-03-20', '2025-03-19', '2025-03-18']
+        assert names(select_playlist(library, SlideshowSettings(mode='favorites'), [library[3].name])) == \
+            ['2025-03-10']
+        assert names(select_playlist(library, SlideshowSettings(mode='dates', date_from='2025-03-05',
+                                                                date_to='2025-03-18'))) == \
+            ['2025-03-18', '2025-03-10']
+        assert len(select_playlist(library, SlideshowSettings(mode='dates', date_to='2025-03-10'))) == 2
+        assert select_playlist(library, SlideshowSettings(mode='off')) == []
+
+    def test_foreign_names_use_modification_day(self):
+        """Test that files without a date in their name are dated by mtime"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "OHR.Mountain_DE-DE123_1920x1080.jpg"
+            path.touch()
+            today = date.today()
+            assert select_playlist([path], SlideshowSettings(mode='recent', recent_days=1), today=today) == [path]
+
+    def test_settings_round_trip(self):
+        """Test that config values survive from_config/to_config and bad values fall back"""
+        settings = SlideshowSettings.from_config({"slideshow_mode": "recent", "slideshow_interval_minutes": 15,
+                                                  "slideshow_recent_days": 3})
+        assert settings.mode == 'recent' and settings.interval == 900 and settings.recent_days == 3
+        assert SlideshowSettings.from_config(settings.to_config()) == settings
+        assert SlideshowSettings.from_config({"slideshow_mode": "bogus"}).mode == 'off'
+        assert SlideshowSettings.from_config({"slideshow_interval_minutes": 0}).interval == 60
+
+
+class TestSlideshowStep:
+    """Test single switches"""
+
+    def test_cycles_through_playlist(self, library):
+        """Test that each step applies the prepared image and wraps around at the end"""
+        show, applied = make_show(library)
+        show.prepare()
+        assert show.next_path == library[0]
+        for _ in range(6):
+            assert show.step()
+        assert applied == library + [library[0]]
+        assert show.next_path == library[1]
+        assert show.switches == 6
+
+    def test_paused_by_user_battery_and_lock(self, library):
+        """Test that nothing is switched while paused, on battery or locked"""
+        power = FakePower()
+        paused = [True]
+        show, applied = make_show(library, power=power, is_paused=lambda: paused[0])
+        assert not show.step()
+        paused[0] = False
+        power.battery = True
+        assert show.pause_reason() == "on battery"
+        assert not show.step()
+        power.battery, power.locked = False, True
+        assert show.pause_reason() == "session locked"
+        assert not show.step()
+        assert applied == []
+
+        show.settings = show.settings.with_changes(pause_on_lock=False)
+        assert show.step()
+        assert applied == [library[0]]
+
+    def test_prepared_file_removed(self, library):
+        """Test that a prepared image deleted before the switch is replaced by a fresh pick"""
+        paths = list(library)
+        show, applied = make_show(paths)
+        show.prepare()
+        library[0].unlink()
+        paths.remove(library[0])
+        assert show.step()
+        assert applied == [library[1]]
+
+
+class TestSlideshowThread:
+    """Test the timer thread"""
+
+    def test_switches_without_busy_waiting(self, library):
+        """Test that the thread wakes once per switch"""
+        show, applied = make_show(library, SlideshowSettings(mode='all', interval=0.05))
+        show.start()
+        try:
+            deadline = time.monotonic() + 5
+            while show.switches < 4 and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            show.stop()
+        assert show.switches >= 4
+        assert show.wakeups <= show.switches + 1
+        assert not show.running
+
+    def test_idle_until_interval_or_reconfigure(self, library):
+        """Test that a long interval means no wakeups, and reconfiguring reschedules"""
+        show, applied = make_show(library, SlideshowSettings(mode='all', interval=60))
+        show.start()
+        try:
+            time.sleep(0.2)
+            assert show.wakeups == 0
+            show.configure(show.settings.with_changes(mode='favorites'))
+            deadline = time.monotonic() + 5
+            while show.wakeups < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert show.wakeups == 1
+            assert applied == []
+            show.configure(show.settings.with_changes(mode='off'))
+            assert not show.running
+        finally:
+            show.stop()
+
+    def test_not_started_when_off(self, library):
+        """Test that no thread exists while the slideshow is off"""
+        show, _ = make_show(library, SlideshowSettings())
+        show.start()
+        assert not show.running
+
+
+class TestTraySlideshow:
+    """Test the slideshow hooks in WallpaperManager"""
+
+    def test_show_wallpaper_and_settings(self, library):
+        """Test that slideshow switches select without pausing and settings are saved"""
+        config_file = library[0].parent / "config.json"
+        config_file.write_text(json.dumps({"download_folder": str(library[0].parent),
+                                           "metrics_enabled": False}), encoding='utf-8')
+        with mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file):
+            from bing_wallpaper_tray import WallpaperManager
+
+            with mock.patch('bing_wallpaper_tray.WallpaperManager.is_task_enabled', return_value=True), \
+                    mock.patch('bing_wallpaper_tray.WallpaperManager.get_current_wallpaper', return_value=None), \
+                    mock.patch('bing_wallpaper_tray.WallpaperManager.set_wallpaper', return_value=True):
+                manager = WallpaperManager()
+                manager.wallpapers = list(library)
+                assert manager.show_wallpaper(library[3])
+                assert manager.current_wallpaper_index == 3
+                assert not manager.user_paused
+                assert not manager.show_wallpaper(Path("elsewhere.jpg"))
+
+                settings = manager.set_slideshow(mode='favorites', interval=900)
+                assert manager.slideshow_playlist() == []
+                manager.toggle_favorite()
+                assert manager.slideshow_playlist() == [library[3]]
+                saved = json.loads(config_file.read_text(encoding='utf-8'))
+                assert saved["slideshow_mode"] == 'favorites'
+                assert saved["slideshow_interval_minutes"] == 15
+                assert settings.interval == 900
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for run telemetry
+"""
+import json
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from telemetry import RunProfiler, RunStats
+
+
+class TestRunStats:
+    """Test span and counter aggregation"""
+
+    def test_span_aggregates_by_name(self):
+        """Test that repeated spans are aggregated"""
+        stats = RunStats()
+        for _ in range(3):
+            with stats.span("download"):
+                pass
+        summary = stats.summary()
+        assert summary["spans"]["download"]["count"] == 3
+        assert summary["spans"]["download"]["total_s"] >= 0
+
+    def test_span_records_on_exception(self):
+        """Test that a failing block is still timed"""
+        stats = RunStats()
+        with pytest.raises(ValueError):
+            with stats.span("metadata"):
+                raise ValueError("boom")
+        assert stats.spans["metadata"]["count"] == 1
+
+    def test_counters_and_throughput(self):
+        """Test counters and throughput calculation"""
+        stats = RunStats()
+        stats.add("bytes_downloaded", 1000)
+        stats.add("bytes_downloaded", 1000)
+        stats.add("candidate_misses")
+        stats.record("download", 2.0)
+        summary = stats.summary()
+        assert summary["counters"]["bytes_downloaded"] == 2000
+        assert summary["counters"]["candidate_misses"] == 1
+        assert summary["throughput_bytes_per_s"] == 1000
+
+    def test_throughput_none_without_downloads(self):
+        """Test that throughput is None when nothing was downloaded"""
+        assert RunStats().summary()["throughput_bytes_per_s"] is None
+
+    def test_reset_clears_state(self):
+        """Test that reset starts a fresh run"""
+        stats = RunStats()
+        stats.add("files_written")
+        stats.record("write", 0.1)
+        stats.reset()
+        summary = stats.summary()
+        assert summary["spans"] == {}
+        assert summary["counters"] == {}
+
+    def test_write_summary(self):
+        """Test that the summary is written as JSON"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stats = RunStats()
+            stats.add("files_written", 2)
+            path = Path(tmpdir) / "sub" / "last_run.json"
+            stats.write_summary(path)
+            data = json.loads(path.read_text(encoding="utf-8"))
+            assert data["counters"]["files_written"] == 2
+            assert "wall_s" in data
+
+
+class TestRunProfiler:
+    """Test opt-in profiling"""
+
+    def test_profiler_writes_pstats(self):
+        """Test that the profiler writes a loadable pstats file"""
+        import pstats
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profiler = RunProfiler(Path(tmpdir))
+            profiler.start()
+            sum(range(1000))
+            result = profiler.stop()
+            assert Path(result["pstats_file"]).exists()
+            assert result["tracemalloc_peak_bytes"] >= 0
+            pstats.Stats(result["pstats_file"])
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for bandwidth throttling and idle detection
+"""
+from unittest import mock
+
+import pytest
+
+import bing_wallpaper
+from conftest import make_jpeg
+from throttle import BandwidthPolicy, TokenBucket, read_paced, wait_for_idle
+
+
+class FakeClock:
+    """Monotonic clock that only advances when sleep() is called"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket:
+    """Test pacing of streamed chunks"""
+
+    def test_rate_is_enforced(self):
+        clock = FakeClock()
+        bucket = TokenBucket(10 * 1024, burst=16 * 1024, clock=clock, sleep=clock.sleep)
+        data = read_paced([b"x" * 16 * 1024] * 10, bucket)
+        assert len(data) == 160 * 1024
+        # 160 KB at 10 KB/s minus the initial burst
+        assert clock.now == pytest.approx(14.4)
+        assert bucket.slept == pytest.approx(14.4)
+
+    def test_pacing_is_smooth(self):
+        clock = FakeClock()
+        bucket = TokenBucket(64 * 1024, clock=clock, sleep=clock.sleep)
+        read_paced([b"x" * 16 * 1024] * 40, bucket)
+        # Every chunk after the burst waits the same short time, no long stalls
+        assert max(clock.sleeps) == pytest.approx(0.25)
+
+    def test_idle_time_refills(self):
+        clock = FakeClock()
+        bucket = TokenBucket(1024, burst=4096, clock=clock, sleep=clock.sleep)
+        assert bucket.consume(4096) == 0
+        clock.now += 10
+        assert bucket.consume(4096) == 0
+
+
+class TestWaitForIdle:
+    """Test idle detection from traffic counters"""
+
+    def run(self, rates, quiet=3, max_wait=20):
+        clock = FakeClock()
+        totals = iter(sum(rates[:i]) for i in range(len(rates) + 1))
+        return wait_for_idle(1000, quiet, max_wait, counter=lambda: next(totals, None),
+                             clock=clock, sleep=clock.sleep), clock.now
+
+    def test_waits_for_quiet_period(self):
+        idle, waited = self.run([50000, 50000, 10, 10, 10, 10])
+        assert idle and waited == 5
+
+    def test_gives_up_after_max_wait(self):
+        idle, waited = self.run([50000] * 30, max_wait=10)
+        assert not idle and waited == 10
+
+    def test_no_counters(self):
+        assert wait_for_idle(1000, 3, 10, counter=lambda: None) is False
+
+
+class TestDownloaderPolicy:
+    """Test how the downloader applies the bandwidth policy"""
+
+    def test_from_config(self):
+        assert BandwidthPolicy.from_config({}) is None
+        policy = BandwidthPolicy.from_config({"bandwidth_limit_kbps": 256, "download_when_idle": True})
+        assert policy.limit_bps == 256 * 1024 and policy.when_idle
+        assert policy.bucket(priority=True) is None
+        assert policy.bucket(priority=False) is policy.bucket(priority=False)
+
+    def test_todays_image_does_not_wait(self):
+        imgs = [{"startdate": f"2025012{i}", "urlbase": f"/th?id=OHR.Img{i}_DE"} for i in range(3)]
+        policy = BandwidthPolicy(limit_bps=1024 * 1024, when_idle=True)
+        events = []
+        policy.before_bulk = lambda logger=None, max_wait=None: events.append("idle") or 0.0
+
+        def fake_download(urls, bucket=None):
+            events.append(("download", urls[0].split("OHR.")[1][:4], bucket is not None))
+            return b"x", "image/jpeg"
+
+        with mock.patch("bing_wallpaper.bandwidth", policy), \
+                mock.patch("bing_wallpaper.download_first", side_effect=fake_download):
+            bing_wallpaper.download_images(imgs, ["1920x1080"])
+        assert events == [("download", "Img0", False), "idle", ("download", "Img1", True),
+                          "idle", ("download", "Img2", True)]
+
+    def test_download_first_streams_with_bucket(self):
+        response = mock.MagicMock()
+        response.headers = {"Content-Type": "image/jpeg"}
+        body = make_jpeg(size=64 * 1024)
+        response.iter_content.return_value = [body[i:i + 16 * 1024] for i in range(0, len(body), 16 * 1024)]
+        clock = FakeClock()
+        bucket = TokenBucket(16 * 1024, burst=16 * 1024, clock=clock, sleep=clock.sleep)
+        with mock.patch("bing_wallpaper.http_cache", None), \
+                mock.patch("bing_wallpaper.requests.Session") as session_cls:
+            session = session_cls.return_value.__enter__.return_value
+            session.get.return_value = response
+            data, ct = bing_wallpaper.download_first(["http://a/img.jpg"], bucket)
+        assert len(data) == 64 * 1024
+        assert session.get.call_args.kwargs["stream"] is True
+        assert clock.now == pytest.approx(3.0)
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
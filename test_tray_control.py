@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the tray control channel
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+# Mock pystray and PIL before importing bing_wallpaper_tray
+sys.modules.setdefault('pystray', mock.MagicMock())
+sys.modules.setdefault('PIL', mock.MagicMock())
+sys.modules.setdefault('PIL.Image', mock.MagicMock())
+sys.modules.setdefault('PIL.ImageDraw', mock.MagicMock())
+
+from tray_control import ControlError, ControlServer, create_key, default_address, read_key, send_command
+
+
+
+def address_for(folder):
+    """Per-test channel address; the real pipe name is per user and could be taken"""
+    if sys.platform == "win32":
+        return rf"\\.\pipe\BingWallpaperTrayTest-{folder.name}", "AF_PIPE"
+    return default_address(folder)
+
+
+@pytest.fixture
+def channel():
+    """Running server with a counter behind "next"; yields (server, folder, calls)"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        folder = Path(tmpdir)
+        calls = []
+        handlers = {"next": lambda: calls.append("next"), "status": lambda: None,
+                    "refresh": lambda: 1 / 0}
+        address, family = address_for(folder)
+        server = ControlServer(handlers, lambda: {"count": len(calls)}, address, family, create_key(folder))
+        server.start()
+        try:
+            yield server, folder, calls
+        finally:
+            server.stop()
+
+
+def send(folder, command, key=None):
+    address, family = address_for(folder)
+    return send_command(command, address, family, key or read_key(folder))
+
+
+class TestControlChannel:
+    """Test requests against a running server"""
+
+    def test_command_runs_handler_and_returns_status(self, channel):
+        """Test that a command reaches its handler and the reply carries the new status"""
+        server, folder, calls = channel
+        assert send(folder, "next") == {"ok": True, "status": {"count": 1}}
+        assert send(folder, "status") == {"ok": True, "status": {"count": 1}}
+        assert calls == ["next"]
+
+    def test_round_trip_is_fast(self, channel):
+        """Test that a request takes milliseconds, not an interpreter start"""
+        _, folder, _ = channel
+        send(folder, "status")
+        start = time.perf_counter()
+        for _ in range(20):
+            send(folder, "status")
+        assert (time.perf_counter() - start) / 20 < 0.05
+
+    def test_errors_are_replies(self, channel):
+        """Test that unknown commands and failing handlers answer instead of killing the server"""
+        _, folder, _ = channel
+        assert send(folder, "dance")["ok"] is False
+        reply = send(folder, "refresh")
+        assert reply["ok"] is False and "division" in reply["error"]
+        assert send(folder, "status")["ok"] is True
+
+    def test_wrong_key_is_rejected(self, channel):
+        """Test that a client without the session key cannot send commands"""
+        _, folder, calls = channel
+        with pytest.raises(ControlError):
+            send(folder, "next", key=b"x" * 32)
+        assert calls == []
+        assert send(folder, "status")["ok"] is True
+
+    def test_not_running(self):
+        """Test that a missing tray is reported as ControlError"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with pytest.raises(ControlError):
+                send(Path(tmpdir), "status")
+            create_key(Path(tmpdir))
+            with pytest.raises(ControlError):
+                send(Path(tmpdir), "status")
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="named pipes leave no file behind")
+    def test_stale_socket_is_replaced(self):
+        """Test that a socket file left by a crashed tray does not block the next start"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = Path(tmpdir)
+            address, family = default_address(folder)
+            Path(address).touch()
+            server = ControlServer({"status": lambda: None}, lambda: {}, address, family, create_key(folder))
+            server.start()
+            try:
+                assert send(folder, "status")["ok"] is True
+            finally:
+                server.stop()
+
+
+class TestTrayCommands:
+    """Test the tray's command line and handlers"""
+
+    def test_parse_args(self):
+        """Test that each flag maps to its command and plain start has none"""
+        from bing_wallpaper_tray import parse_args
+        assert parse_args([]).command is None
+        assert parse_args(["--next"]).command == "next"
+        assert parse_args(["--status"]).command == "status"
+        with pytest.raises(SystemExit):
+            parse_args(["--next", "--previous"])
+
+    def test_cli_drives_running_tray(self, capsys):
+        """Test commands from the command line against a TrayApp's control channel"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config_file = Path(tmpdir) / "config.json"
+            folder = Path(tmpdir) / "wallpapers"
+            folder.mkdir()
+            config_file.write_text(json.dumps({"download_folder": str(folder), "metrics_enabled": False}),
+                                   encoding='utf-8')
+            paths = [folder / f"2025-01-0{i}_Image.jpg" for i in (3, 2, 1)]
+            for age, path in enumerate(paths):
+                path.touch()
+                t = time.time() - age * 3600
+                os.utime(path, (t, t))
+
+            import bing_wallpaper_tray
+            with mock.patch.object(bing_wallpaper_tray, 'CONFIG_FILE', config_file), \
+                    mock.patch.object(bing_wallpaper_tray.WallpaperManager, 'is_task_enabled', return_value=True), \
+                    mock.patch.object(bing_wallpaper_tray.WallpaperManager, 'get_current_wallpaper',
+                                      return_value=None), \
+                    mock.patch.object(bing_wallpaper_tray.WallpaperManager, 'set_wallpaper', return_value=True):
+                app = bing_wallpaper_tray.TrayApp()
+                app.start_control()
+                try:
+                    assert bing_wallpaper_tray.run_command("previous") == 0
+                    status = json.loads(capsys.readouterr().out)
+                    assert status["index"] == 1 and status["count"] == 3
+                    assert status["wallpaper"] == paths[1].name
+                    assert status["user_paused"] is True
+
+                    assert bing_wallpaper_tray.run_command("latest") == 0
+                    assert json.loads(capsys.readouterr().out)["index"] == 0
+                finally:
+                    app.on_exit()
+                assert bing_wallpaper_tray.run_command("status") == 1
+                assert "nicht erreichbar" in capsys.readouterr().err
+
+    def test_gui_build_prints_to_parent_console(self):
+        """Test that the console-less exe attaches to the calling shell, or uses a redirected handle"""
+        import bing_wallpaper_tray
+        windll = mock.MagicMock()
+        kernel32 = windll.kernel32
+        msvcrt = mock.MagicMock()
+        with mock.patch.object(sys, 'platform', 'win32'), \
+                mock.patch.object(sys, 'stdout', None), mock.patch.object(sys, 'stderr', None), \
+                mock.patch.object(bing_wallpaper_tray.ctypes, 'windll', windll, create=True), \
+                mock.patch.dict(sys.modules, {'msvcrt': msvcrt}), \
+                mock.patch('builtins.open') as open_mock:
+            kernel32.GetStdHandle.return_value = 0
+            kernel32.AttachConsole.return_value = 1
+            bing_wallpaper_tray.attach_console()
+            kernel32.AttachConsole.assert_called_once_with(-1)
+            assert [c.args[0] for c in open_mock.call_args_list] == ["CONOUT$", "CONOUT$"]
+            assert sys.stdout is open_mock.return_value and sys.stderr is open_mock.return_value
+
+            # Output redirected by the caller goes to the inherited handle
+            sys.stdout = sys.stderr = None
+            kernel32.reset_mock()
+            open_mock.reset_mock()
+            kernel32.GetStdHandle.return_value = 0x1234
+            bing_wallpaper_tray.attach_console()
+            kernel32.AttachConsole.assert_not_called()
+            msvcrt.open_osfhandle.assert_called_with(0x1234, 0)
+            assert open_mock.call_args.args[0] is msvcrt.open_osfhandle.return_value
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
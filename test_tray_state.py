@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Unit and stress tests for the tray state store
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+# Mock pystray and PIL before importing bing_wallpaper_tray
+sys.modules.setdefault('pystray', mock.MagicMock())
+sys.modules.setdefault('PIL', mock.MagicMock())
+sys.modules.setdefault('PIL.Image', mock.MagicMock())
+sys.modules.setdefault('PIL.ImageDraw', mock.MagicMock())
+
+from tray_state import Coalescer, TrayState
+
+THREADS = 16
+
+
+def run_threads(target, count=THREADS):
+    """Start `count` threads on target(i) at the same moment and re-raise the first failure"""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def worker(i):
+        barrier.wait()
+        try:
+            target(i)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=60)
+    if errors:
+        raise errors[0]
+
+
+class TestTrayState:
+    """Test values, batches and change events"""
+
+    def test_set_reports_only_changed_keys(self):
+        """Test that unchanged values do not raise an event"""
+        state = TrayState(a=1, b=2)
+        events = []
+        state.subscribe(events.append)
+
+        assert state.set(a=1, b=3) == {'b'}
+        assert state.set(a=1) == frozenset()
+        assert events == [frozenset({'b'})]
+
+    def test_batch_is_one_event(self):
+        """Test that changes inside nested batches are reported once, after the outermost batch"""
+        state = TrayState(a=0, b=0)
+        events = []
+        state.subscribe(events.append)
+
+        with state.batch():
+            state.set(a=1)
+            with state.batch():
+                state.set(b=1)
+            assert events == []
+        assert events == [frozenset({'a', 'b'})]
+
+    def test_listener_sees_completed_change(self):
+        """Test that listeners run after the batch and can read the new values"""
+        state = TrayState(a=0, b=0)
+        seen = []
+        state.subscribe(lambda changed: seen.append(state.snapshot()))
+
+        with state.batch():
+            state.set(a=1)
+            state.set(b=2)
+        assert seen == [{'a': 1, 'b': 2}]
+
+    def test_concurrent_read_modify_write(self):
+        """Test that increments in batches from many threads are never lost"""
+        state = TrayState(n=0)
+        events = []
+        state.subscribe(events.append)
+
+        def work(_):
+            for _ in range(500):
+                with state.batch():
+                    state.set(n=state.get('n') + 1)
+
+        run_threads(work)
+        assert state.get('n') == THREADS * 500
+        assert len(events) == THREADS * 500
+
+
+class TestCoalescer:
+    """Test merging bursts of change events"""
+
+    def test_burst_is_one_call(self):
+        """Test that events within the delay become one callback with the union of keys"""
+        calls = []
+        done = threading.Event()
+        coalescer = Coalescer(lambda changed: (calls.append(changed), done.set()), delay=0.2)
+
+        for i in range(100):
+            coalescer(frozenset({f'k{i % 3}'}))
+        assert done.wait(5)
+        time.sleep(0.3)
+        assert calls == [frozenset({'k0', 'k1', 'k2'})]
+
+    def test_flush_and_cancel(self):
+        """Test that flush delivers immediately and cancel drops pending changes"""
+        calls = []
+        coalescer = Coalescer(calls.append, delay=10)
+
+        coalescer(frozenset({'a'}))
+        coalescer.flush()
+        assert calls == [frozenset({'a'})]
+
+        coalescer(frozenset({'b'}))
+        coalescer.cancel()
+        coalescer.flush()
+        assert calls == [frozenset({'a'})]
+
+    def test_events_from_many_threads(self):
+        """Test that no key is lost when many threads report changes at once"""
+        calls = []
+        lock = threading.Lock()
+
+        def callback(changed):
+            with lock:
+                calls.append(changed)
+
+        coalescer = Coalescer(callback, delay=0.01)
+        run_threads(lambda i: [coalescer(frozenset({f't{i}-{j}'})) for j in range(200)])
+        coalescer.flush()
+        seen = set().union(*calls)
+        assert len(seen) == THREADS * 200
+        assert len(calls) < THREADS * 200
+
+
+@pytest.fixture
+def library():
+    """Config and a folder with 30 wallpapers, newest first by mtime"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        folder = Path(tmpdir) / "wallpapers"
+        folder.mkdir()
+        config_file = Path(tmpdir) / "config.json"
+        config_file.write_text(json.dumps({"download_folder": str(folder), "metrics_enabled": False}),
+                               encoding='utf-8')
+        now = time.time()
+        for i in range(30):
+            path = folder / f"2025-01-{i + 1:02d}_Image{i}.jpg"
+            path.touch()
+            os.utime(path, (now - 86400 * (30 - i), now - 86400 * (30 - i)))
+        yield config_file, folder
+
+
+def open_app(config_file):
+    """TrayApp on `config_file` with Win32 calls stubbed; returns (app, applied wallpapers)"""
+    import bing_wallpaper_tray
+    applied = []
+    patches = [
+        mock.patch('bing_wallpaper_tray.CONFIG_FILE', config_file),
+        mock.patch.object(bing_wallpaper_tray.WallpaperManager, 'is_task_enabled', return_value=True),
+        mock.patch.object(bing_wallpaper_tray.WallpaperManager, 'get_current_wallpaper', return_value=None),
+        mock.patch.object(bing_wallpaper_tray.WallpaperManager, 'set_wallpaper',
+                          side_effect=lambda path: applied.append(path) or True),
+    ]
+    for p in patches:
+        p.start()
+    try:
+        app = bing_wallpaper_tray.TrayApp()
+    except BaseException:
+        for p in patches:
+            p.stop()
+        raise
+    app.icon = mock.MagicMock()
+    app.stop_patches = lambda: [p.stop() for p in patches]
+    return app, applied
+
+
+class TestTrayStress:
+    """Hammer navigation and refresh from many threads"""
+
+    def test_navigation_and_refresh_stay_consistent(self, library):
+        """Test that the selection, the applied wallpaper and the menu agree after a storm of actions"""
+        config_file, folder = library
+        app, applied = open_app(config_file)
+        manager = app.manager
+        stop = threading.Event()
+        bad = []
+
+        def watch():
+            # The index must always point into the list it belongs to
+            while not stop.is_set():
+                state = manager.state.snapshot()
+                if state['wallpapers'] and not 0 <= state['current_index'] < len(state['wallpapers']):
+                    bad.append(state['current_index'])
+                time.sleep(0.001)
+
+        def storm(i):
+            rnd = random.Random(i)
+            for j in range(150):
+                if i % 4 == 0:
+                    if j % 10 == 0:
+                        (folder / f"2026-{i:02d}-{j:03d}_New.jpg").touch()
+                    manager.refresh_wallpaper_list()
+                else:
+                    rnd.choice([manager.next_wallpaper, manager.previous_wallpaper,
+                                manager.jump_to_latest, manager.toggle_favorite])()
+
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        try:
+            run_threads(storm)
+        finally:
+            stop.set()
+            watcher.join()
+            app.redraw.flush()
+            app.stop_patches()
+
+        assert bad == []
+        state = manager.state.snapshot()
+        assert applied, "no wallpaper was set"
+        # set_wallpaper runs under the state lock, so the last one applied is the selected one
+        assert applied[-1] == state['wallpapers'][state['current_index']]
+        assert app.view['info'] == manager.get_current_wallpaper_info()
+        assert app.view['can_next'] == (state['current_index'] > 0)
+        assert len(manager.wallpapers) == len(list(folder.glob('*.jpg')))
+
+    def test_burst_redraws_menu_once(self, library):
+        """Test that many state changes in a short burst cause a single menu redraw"""
+        config_file, _ = library
+        app, _ = open_app(config_file)
+        try:
+            app.redraw.delay = 0.5
+            for _ in range(10):
+                app.manager.previous_wallpaper()
+            app.redraw.flush()
+            assert app.icon.update_menu.call_count == 1
+            assert "(11 of 30)" in app.view['info']
+            assert app.view['paused']
+        finally:
+            app.stop_patches()
+
+    def test_unrelated_change_does_not_redraw(self, library):
+        """Test that a change event leaving every menu entry as it was does not redraw"""
+        config_file, _ = library
+        app, _ = open_app(config_file)
+        try:
+            app.on_state_changed(frozenset({'filter_mode'}))
+            assert app.icon.update_menu.call_count == 0
+            app.manager.current_wallpaper_index = 3
+            app.redraw.flush()
+            assert app.icon.update_menu.call_count == 1
+            assert "(4 of 30)" in app.view['info']
+        finally:
+            app.stop_patches()
+
+
+# Run tests if executed directly
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,203 @@
+"""
+Bandwidth throttling and idle detection for image downloads
+
+The logon run competes with VPN, mail sync and everything else starting at
+the same time. A BandwidthPolicy (built from config) can
+
+- cap the download rate with a token bucket that paces every streamed
+  chunk, so the link sees a steady trickle instead of full-speed bursts;
+- hold bulk downloads back until the network has been quiet for a while
+  ("download_when_idle").
+
+Today's image is the priority download: it never waits for idle and uses its
+own (by default unlimited) rate.
+"""
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+CHUNK_SIZE = 16 * 1024
+# Bucket size as seconds of traffic at the configured rate
+BURST_SECONDS = 0.25
+
+
+class TokenBucket:
+    """Rate limiter in bytes per second; consume() sleeps until the bytes are paid for"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = float(rate)
+        self.capacity = burst if burst is not None else max(CHUNK_SIZE, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.slept = 0.0
+
+    def consume(self, n: int) -> float:
+        """Take n bytes from the bucket; returns the time slept"""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= n
+        if self.tokens >= 0:
+            return 0.0
+        # Pay the debt now; the refill on the next call starts from zero
+        wait = -self.tokens / self.rate
+        self.sleep(wait)
+        self.slept += wait
+        return wait
+
+
+def read_paced(chunks: Iterable[bytes], bucket: Optional[TokenBucket]) -> bytes:
+    """Join a streamed body, pacing each chunk through `bucket`"""
+    parts = []
+    for chunk in chunks:
+        if bucket is not None:
+            bucket.consume(len(chunk))
+        parts.append(chunk)
+    return b"".join(parts)
+
+
+def link_bytes() -> Optional[int]:
+    """Total bytes sent + received on all interfaces, or None if unknown"""
+    try:
+        import psutil
+        counters = psutil.net_io_counters()
+        return counters.bytes_recv + counters.bytes_sent
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        return _windows_link_bytes()
+    try:
+        total = 0
+        with open("/proc/net/dev", encoding="ascii") as f:
+            for line in f.readlines()[2:]:
+                name, _, values = line.partition(":")
+                if name.strip() == "lo":
+                    continue
+                fields = values.split()
+                total += int(fields[0]) + int(fields[8])
+        return total
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _windows_link_bytes() -> Optional[int]:
+    """Octet counters from GetIfTable (32-bit per interface, wrap-around is rare within a sample)"""
+    import ctypes
+    from ctypes import wintypes
+
+    class MIB_IFROW(ctypes.Structure):
+        _fields_ = [("wszName", wintypes.WCHAR * 256), ("dwIndex", wintypes.DWORD),
+                    ("dwType", wintypes.DWORD), ("dwMtu", wintypes.DWORD), ("dwSpeed", wintypes.DWORD),
+                    ("dwPhysAddrLen", wintypes.DWORD), ("bPhysAddr", ctypes.c_ubyte * 8),
+                    ("dwAdminStatus", wintypes.DWORD), ("dwOperStatus", wintypes.DWORD),
+                    ("dwLastChange", wintypes.DWORD), ("dwInOctets", wintypes.DWORD),
+                    ("dwInUcastPkts", wintypes.DWORD), ("dwInNUcastPkts", wintypes.DWORD),
+                    ("dwInDiscards", wintypes.DWORD), ("dwInErrors", wintypes.DWORD),
+                    ("dwInUnknownProtos", wintypes.DWORD), ("dwOutOctets", wintypes.DWORD),
+                    ("dwOutUcastPkts", wintypes.DWORD), ("dwOutNUcastPkts", wintypes.DWORD),
+                    ("dwOutDiscards", wintypes.DWORD), ("dwOutErrors", wintypes.DWORD),
+                    ("dwOutQLen", wintypes.DWORD), ("dwDescrLen", wintypes.DWORD),
+                    ("bDescr", ctypes.c_ubyte * 256)]
+
+    try:
+        iphlpapi = ctypes.windll.iphlpapi
+        size = wintypes.ULONG(0)
+        iphlpapi.GetIfTable(None, ctypes.byref(size), False)
+        buf = ctypes.create_string_buffer(size.value)
+        if iphlpapi.GetIfTable(buf, ctypes.byref(size), False) != 0:
+            return None
+        count = wintypes.DWORD.from_buffer(buf).value
+        rows = (MIB_IFROW * count).from_buffer(buf, ctypes.sizeof(wintypes.DWORD))
+        # Software loopback interfaces have type 24
+        return sum(r.dwInOctets + r.dwOutOctets for r in rows if r.dwType != 24)
+    except Exception:
+        return None
+
+
+def wait_for_idle(threshold_bps: float, quiet_seconds: float, max_wait: float, interval: float = 1.0,
+                  counter: Callable[[], Optional[int]] = link_bytes,
+                  clock: Callable[[], float] = time.monotonic,
+                  sleep: Callable[[float], None] = time.sleep) -> bool:
+    """
+    Block until traffic stayed below threshold_bps for quiet_seconds.
+
+    Returns True once the link is idle, False if max_wait ran out or the
+    traffic counters are unavailable (the caller then downloads anyway).
+    """
+    start = clock()
+    last = counter()
+    if last is None:
+        return False
+    quiet_since = start
+    while True:
+        if clock() - quiet_since >= quiet_seconds:
+            return True
+        if clock() - start >= max_wait:
+            return False
+        sleep(interval)
+        current = counter()
+        if current is None:
+            return False
+        # A negative delta (counter wrap/reset) counts as busy
+        delta = current - last
+        last = current
+        if delta < 0 or delta / interval > threshold_bps:
+            quiet_since = clock()
+
+
+@dataclass
+class BandwidthPolicy:
+    """Per-run bandwidth settings; see from_config() for the config keys"""
+
+    limit_bps: float = 0
+    priority_limit_bps: float = 0
+    when_idle: bool = False
+    idle_threshold_bps: float = 50 * 1024
+    idle_quiet_seconds: float = 30
+    idle_max_wait: float = 600
+    idle_checked: bool = field(default=False, repr=False)
+    _bulk: Optional[TokenBucket] = field(default=None, repr=False)
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["BandwidthPolicy"]:
+        policy = cls(
+            limit_bps=config.get("bandwidth_limit_kbps", 0) * 1024,
+            priority_limit_bps=config.get("bandwidth_priority_kbps", 0) * 1024,
+            when_idle=config.get("download_when_idle", False),
+            idle_threshold_bps=config.get("idle_threshold_kbps", 50) * 1024,
+            idle_quiet_seconds=config.get("idle_quiet_seconds", 30),
+            idle_max_wait=config.get("idle_max_wait_seconds", 600),
+        )
+        return policy if policy.active else None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.limit_bps or self.priority_limit_bps or self.when_idle)
+
+    def bucket(self, priority: bool) -> Optional[TokenBucket]:
+        """Rate limiter for one download; bulk downloads share a single bucket"""
+        if priority:
+            return TokenBucket(self.priority_limit_bps) if self.priority_limit_bps else None
+        if self.limit_bps and self._bulk is None:
+            self._bulk = TokenBucket(self.limit_bps)
+        return self._bulk
+
+    def before_bulk(self, logger=None, max_wait: Optional[float] = None) -> float:
+        """Wait for an idle link once per run (idle mode only, at most max_wait); returns seconds waited"""
+        if not self.when_idle or self.idle_checked:
+            return 0.0
+        self.idle_checked = True
+        start = time.monotonic()
+        limit = self.idle_max_wait if max_wait is None else max(0.0, min(self.idle_max_wait, max_wait))
+        idle = wait_for_idle(self.idle_threshold_bps, self.idle_quiet_seconds, limit)
+        waited = time.monotonic() - start
+        if logger:
+            if idle:
+                logger.info(f"Network idle after {waited:.0f}s, starting background downloads")
+            else:
+                logger.info(f"Network not idle after {waited:.0f}s, downloading anyway")
+        return waited
@@ -0,0 +1,164 @@
+"""
+Local control channel for the running tray app
+
+The tray listens on a named pipe (Windows) or a Unix socket next to the
+config (elsewhere) through multiprocessing.connection, which hides the
+difference between the two. Scripts, hotkey tools and a second
+`bing_wallpaper_tray --next` send one small request and get the new status
+back from the running process - no new scan of the download folder, no
+second tray icon.
+
+Requests are authenticated with a random key that the tray writes to
+control.key in the config folder on start, so only the same user can
+connect.
+
+Protocol (pickled dicts, one request per connection):
+
+    -> {"command": "next"}
+    <- {"ok": True, "status": {...}}   or   {"ok": False, "error": "..."}
+"""
+import getpass
+import os
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+from multiprocessing import AuthenticationError
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from fileutil import atomic_write_bytes
+
+COMMANDS = ("next", "previous", "latest", "refresh", "profile", "status")
+KEY_FILE_NAME = "control.key"
+SOCKET_NAME = "tray.sock"
+# A client that connects but never sends is dropped after this long
+REQUEST_TIMEOUT = 2.0
+
+
+class ControlError(Exception):
+    """The running tray could not be reached or rejected the request"""
+
+
+def default_address(folder: Path) -> Tuple[str, str]:
+    """(address, family) of the control channel for the current user"""
+    if sys.platform == "win32":
+        return rf"\\.\pipe\BingWallpaperTray-{getpass.getuser()}", "AF_PIPE"
+    return str(Path(folder) / SOCKET_NAME), "AF_UNIX"
+
+
+def read_key(folder: Path) -> Optional[bytes]:
+    try:
+        return (Path(folder) / KEY_FILE_NAME).read_bytes()
+    except OSError:
+        return None
+
+
+def create_key(folder: Path) -> bytes:
+    """New random key for this tray session, readable only by the user"""
+    key = os.urandom(32)
+    path = Path(folder) / KEY_FILE_NAME
+    atomic_write_bytes(path, key, durable=False)
+    if sys.platform != "win32":
+        os.chmod(path, 0o600)
+    return key
+
+
+class ControlServer:
+    """
+    Accept loop on a daemon thread; each request runs handlers[command]().
+
+    Handlers run one at a time on the server thread, so they see the same
+    ordering as menu clicks do.
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[[], Optional[dict]]], status: Callable[[], dict],
+                 address: str, family: str, authkey: bytes, logger=None):
+        self.handlers = handlers
+        self.status = status
+        self.address = address
+        self.family = family
+        self.authkey = authkey
+        self.logger = logger
+        self.served = 0
+        self._listener: Optional[Listener] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self.family == "AF_UNIX" and os.path.exists(self.address):
+            # Left behind by a tray that crashed; the single-instance check already passed
+            os.unlink(self.address)
+        self._listener = Listener(self.address, self.family, authkey=self.authkey)
+        self._thread = threading.Thread(target=self._serve, name="tray-control", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._listener is None:
+            return
+        self._stopped.set()
+        # accept() does not notice close() on every platform; wake it with a last
+        # connection, which the loop always accepts before it looks at _stopped
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                Client(self.address, self.family, authkey=self.authkey).close()
+            except (OSError, EOFError, AuthenticationError):
+                pass
+        self._listener.close()
+        if self._thread is not None:
+            self._thread.join(REQUEST_TIMEOUT)
+        self._listener = None
+
+    def _serve(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                if self.logger:
+                    self.logger.warning("Rejected control connection with a wrong key")
+                continue
+            except (OSError, EOFError):
+                if self._stopped.is_set():
+                    return
+                continue
+            with conn:
+                if self._stopped.is_set():
+                    return
+                try:
+                    if not conn.poll(REQUEST_TIMEOUT):
+                        continue
+                    conn.send(self.dispatch(conn.recv()))
+                    self.served += 1
+                except (OSError, EOFError) as e:
+                    if self.logger:
+                        self.logger.debug(f"Control connection dropped: {e}")
+
+    def dispatch(self, request) -> dict:
+        """Run one request; never raises"""
+        command = request.get("command") if isinstance(request, dict) else None
+        handler = self.handlers.get(command)
+        if handler is None:
+            return {"ok": False, "error": f"unknown command: {command!r}"}
+        try:
+            handler()
+            return {"ok": True, "status": self.status()}
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Control command {command} failed: {e}", exc_info=True)
+            return {"ok": False, "error": str(e)}
+
+
+def send_command(command: str, address: str, family: str, authkey: Optional[bytes],
+                 timeout: float = 10.0) -> dict:
+    """Send one command to the running tray and return its reply"""
+    if authkey is None:
+        raise ControlError("tray is not running (no control key)")
+    try:
+        with Client(address, family, authkey=authkey) as conn:
+            conn.send({"command": command})
+            if not conn.poll(timeout):
+                raise ControlError(f"no reply within {timeout:.0f}s")
+            return conn.recv()
+    except AuthenticationError as e:
+        raise ControlError(f"tray rejected the key: {e}") from e
+    except (OSError, EOFError) as e:
+        raise ControlError(f"tray is not running ({e})") from e
@@ -0,0 +1,142 @@
+"""
+Thread-safe state for the tray app
+
+The tray is driven from several threads at once: pystray's menu callbacks,
+the delayed refresh after "Download Now" and the background analysis after
+a filter change. TrayState keeps the values those threads share behind one
+lock and tells subscribers which keys changed, so the menu only recomputes
+the entries that depend on them.
+
+- set() and batch() change values atomically; a batch is one change event.
+- Listeners are called with the frozenset of changed keys, after the change
+  is complete and without the caller needing to hold anything.
+- Coalescer turns a burst of change events (ten clicks on "Next", a refresh
+  racing a navigation) into one call after a short delay.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Set
+
+ChangeListener = Callable[[FrozenSet[str]], None]
+
+# Menu redraws within this window are merged into one
+REDRAW_DELAY = 0.05
+
+
+class TrayState:
+    """Lock-protected key/value state with change events"""
+
+    def __init__(self, **values):
+        self.lock = threading.RLock()
+        self._values: Dict[str, Any] = dict(values)
+        self._listeners: List[ChangeListener] = []
+        self._changed: Set[str] = set()
+        self._depth = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            return self._values.get(key, default)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Consistent copy of all values"""
+        with self.lock:
+            return dict(self._values)
+
+    def subscribe(self, listener: ChangeListener):
+        with self.lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ChangeListener):
+        with self.lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    @contextmanager
+    def batch(self) -> Iterator["TrayState"]:
+        """
+        Hold the lock for a read-modify-write; changes made inside are reported
+        as one event when the outermost batch ends.
+        """
+        with self.lock:
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    changed = frozenset(self._changed)
+                    self._changed.clear()
+                    listeners = list(self._listeners)
+                else:
+                    changed = frozenset()
+        if changed:
+            for listener in listeners:
+                listener(changed)
+
+    def set(self, **changes) -> FrozenSet[str]:
+        """Change values; returns the keys whose value actually changed"""
+        changed = set()
+        with self.batch():
+            for key, value in changes.items():
+                if key not in self._values or self._values[key] != value:
+                    self._values[key] = value
+                    changed.add(key)
+            self._changed |= changed
+        return frozenset(changed)
+
+
+def state_property(key: str, doc: Optional[str] = None) -> property:
+    """Attribute that reads and writes `key` in the owner's `state`"""
+    return property(
+        lambda self: self.state.get(key),
+        lambda self, value: self.state.set(**{key: value}),
+        doc=doc,
+    )
+
+
+class Coalescer:
+    """
+    Merge change events into one callback per burst.
+
+    The first event starts a timer; events arriving before it fires only add
+    their keys, so the callback sees the union of everything that changed.
+    The delay is counted from the first event, so a steady stream of changes
+    still redraws every `delay` seconds instead of never.
+    """
+
+    def __init__(self, callback: ChangeListener, delay: float = REDRAW_DELAY):
+        self.callback = callback
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._pending: Set[str] = set()
+        self._timer: Optional[threading.Timer] = None
+        self.calls = 0
+
+    def __call__(self, changed: FrozenSet[str]):
+        with self._lock:
+            self._pending |= changed
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Deliver pending changes now"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            changed = frozenset(self._pending)
+            self._pending.clear()
+            if changed:
+                self.calls += 1
+        if changed:
+            self.callback(changed)
+
+    def cancel(self):
+        """Drop pending changes (on exit)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending.clear()